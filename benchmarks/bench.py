@@ -0,0 +1,473 @@
+"""Benchmarks for building, parsing, and sending messages.
+
+Run all benchmarks and save the results:
+
+.. code-block:: text
+
+    $ python benchmarks/bench.py run -o before.json
+
+Run again after making a change and compare to the saved results, or compare
+two saved results:
+
+.. code-block:: text
+
+    $ python benchmarks/bench.py run -o after.json --compare before.json
+    $ python benchmarks/bench.py compare before.json after.json
+
+Use ``-k`` to only run benchmarks with a name that contains the given text.
+"""
+
+from __future__ import annotations
+
+import argparse
+import collections.abc as cabc
+import contextlib
+import dataclasses
+import datetime
+import gc
+import json
+import platform
+import random
+import statistics
+import string
+import sys
+import time
+import tracemalloc
+import typing as t
+from email.headerregistry import Address
+from email.message import EmailMessage
+from pathlib import Path
+
+from sink import SMTPSink
+
+from email_simplified import Attachment
+from email_simplified import Message
+from email_simplified import SMTPEmailHandler
+from email_simplified.address import AddressList
+from email_simplified.address import clear_address_cache
+from email_simplified.address import prepare_address
+
+Op: t.TypeAlias = cabc.Callable[[], object]
+Setup: t.TypeAlias = cabc.Callable[[contextlib.ExitStack], tuple[Op, int]]
+"""A function that prepares a benchmark. Returns the function to time and the
+number of bytes it processes for each call, or 0 if that doesn't apply. Any
+resources that need to be cleaned up after the benchmark are added to the
+exit stack.
+"""
+
+
+@dataclasses.dataclass
+class Case:
+    name: str
+    setup: Setup
+
+
+CASES: list[Case] = []
+"""Every registered benchmark, in the order they run."""
+
+
+def case(name: str) -> cabc.Callable[[Setup], Setup]:
+    """Register a benchmark setup function."""
+
+    def decorator(f: Setup) -> Setup:
+        CASES.append(Case(name, f))
+        return f
+
+    return decorator
+
+
+@dataclasses.dataclass
+class Result:
+    name: str
+    ops: float
+    """Median calls per second across rounds."""
+    spread: float
+    """Difference between the fastest and slowest round, relative to the
+    median.
+    """
+    bytes_per_sec: float
+    """Bytes processed per second, or 0 if the benchmark doesn't process
+    bytes.
+    """
+    peak_memory: int
+    """Peak bytes allocated during one call."""
+
+
+def measure(name: str, setup: Setup, *, min_time: float, rounds: int) -> Result:
+    """Time a benchmark. Each round calls the function until at least
+    ``min_time`` seconds have passed. Then one more call measures the peak
+    memory allocated.
+    """
+    with contextlib.ExitStack() as stack:
+        op, size = setup(stack)
+        return _measure(name, op, size, min_time=min_time, rounds=rounds)
+
+
+def _measure(name: str, op: Op, size: int, *, min_time: float, rounds: int) -> Result:
+    # Warm up caches and imports before timing.
+    op()
+    samples: list[float] = []
+    gc.collect()
+
+    for _ in range(rounds):
+        count = 0
+        start = time.perf_counter()
+
+        while (elapsed := time.perf_counter() - start) < min_time:
+            op()
+            count += 1
+
+        samples.append(count / elapsed)
+
+    ops = statistics.median(samples)
+    gc.collect()
+    tracemalloc.start()
+
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        op()
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+    return Result(
+        name=name,
+        ops=ops,
+        spread=(max(samples) - min(samples)) / ops,
+        bytes_per_sec=ops * size,
+        peak_memory=peak,
+    )
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+        for _ in range(count)
+    )
+
+
+def _messages() -> dict[str, Message]:
+    """The messages to build and parse, generated from a fixed seed so that
+    every run uses the same content.
+    """
+    rng = random.Random(0)
+    paragraphs = [_words(rng, 80) for _ in range(200)]
+    html = "".join(
+        f"<h2>{p[:20]}</h2><p>{p} <a href='https://example.test/{i}'>link</a></p>"
+        for i, p in enumerate(paragraphs)
+    )
+    return {
+        "small": Message(
+            subject="Hello",
+            text="Hello, world!",
+            from_addr="a@example.test",
+            to=["b@example.test"],
+        ),
+        "html": Message(
+            subject="Newsletter",
+            text="\n\n".join(paragraphs),
+            html=f"<html><body>{html}</body></html>",
+            from_addr="a@example.test",
+            to=["b@example.test"],
+            inline_attachments=[Attachment(rng.randbytes(20_000), filename="a.png")],
+        ),
+        "attachment": Message(
+            subject="Report",
+            text="See attached.",
+            from_addr="a@example.test",
+            to=["b@example.test"],
+            attachments=[Attachment(rng.randbytes(5_000_000), filename="a.pdf")],
+        ),
+    }
+
+
+def _register_messages() -> None:
+    for key, message in _messages().items():
+
+        def to_mime(
+            stack: contextlib.ExitStack, message: Message = message
+        ) -> tuple[Op, int]:
+            return message.to_mime, len(message.to_mime().as_bytes())
+
+        def from_mime(
+            stack: contextlib.ExitStack, message: Message = message
+        ) -> tuple[Op, int]:
+            mime = message.to_mime()
+            return (lambda: Message.from_mime(mime)), len(mime.as_bytes())
+
+        case(f"message.to_mime[{key}]")(to_mime)
+        case(f"message.from_mime[{key}]")(from_mime)
+
+
+_register_messages()
+
+
+def _addresses(count: int) -> list[Address]:
+    return [
+        Address(f"User {i}", f"user{i}", f"d{i % 100}.example.test")
+        for i in range(count)
+    ]
+
+
+@case("address_list.extend[10000]")
+def _address_list_extend(stack: contextlib.ExitStack) -> tuple[Op, int]:
+    addresses = _addresses(10_000)
+
+    def op() -> None:
+        AddressList().extend(addresses)
+
+    return op, 0
+
+
+@case("address_list.contains[10000]")
+def _address_list_contains(stack: contextlib.ExitStack) -> tuple[Op, int]:
+    addresses = _addresses(10_000)
+    values = AddressList(addresses)
+    lookup = addresses[::10]
+
+    def op() -> None:
+        for address in lookup:
+            assert address in values
+
+    return op, 0
+
+
+@case("address_list.dedupe[10000]")
+def _address_list_dedupe(stack: contextlib.ExitStack) -> tuple[Op, int]:
+    addresses = _addresses(5_000) * 2
+
+    def op() -> None:
+        AddressList(addresses).dedupe()
+
+    return op, 0
+
+
+def _address_strings() -> list[str]:
+    return [f"User {i} <user{i}@d{i % 100}.example.test>" for i in range(1_000)]
+
+
+@case("prepare_address[1000,cached]")
+def _prepare_address_cached(stack: contextlib.ExitStack) -> tuple[Op, int]:
+    values = _address_strings()
+
+    def op() -> None:
+        for value in values:
+            prepare_address(value)
+
+    return op, sum(len(v) for v in values)
+
+
+@case("prepare_address[1000,uncached]")
+def _prepare_address_uncached(stack: contextlib.ExitStack) -> tuple[Op, int]:
+    values = _address_strings()
+
+    def op() -> None:
+        clear_address_cache()
+
+        for value in values:
+            prepare_address(value)
+
+    return op, sum(len(v) for v in values)
+
+
+def _send(
+    stack: contextlib.ExitStack, recipients_per_message: int | None
+) -> tuple[Op, int]:
+    sink = stack.enter_context(SMTPSink())
+    handler = SMTPEmailHandler(
+        host=sink.host,
+        port=sink.port,
+        recipients_per_message=recipients_per_message,
+    )
+    message = _messages()["html"]
+    message.to = [f"user{i}@example.test" for i in range(20)]
+    messages: list[Message | EmailMessage] = [message] * 10
+
+    def op() -> None:
+        handler.send(messages)
+
+    op()
+    return op, sink.bytes
+
+
+@case("smtp.send[10 messages,20 recipients]")
+def _smtp_send(stack: contextlib.ExitStack) -> tuple[Op, int]:
+    return _send(stack, None)
+
+
+@case("smtp.send[10 messages,20 recipients,recipients_per_message=5]")
+def _smtp_send_batched(stack: contextlib.ExitStack) -> tuple[Op, int]:
+    return _send(stack, 5)
+
+
+def _format_rate(value: float, unit: str) -> str:
+    for prefix in ("", "k", "M", "G"):
+        if value < 1000:
+            return f"{value:.1f} {prefix}{unit}"
+
+        value /= 1000
+
+    return f"{value:.1f} T{unit}"
+
+
+def _format_size(value: int) -> str:
+    size = float(value)
+
+    for prefix in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.1f} {prefix}"
+
+        size /= 1024
+
+    return f"{size:.1f} GiB"
+
+
+def _print_table(rows: list[list[str]]) -> None:
+    widths = [max(len(r[i]) for r in rows) for i in range(len(rows[0]))]
+
+    for row in rows:
+        print(
+            "  ".join(
+                cell.ljust(width) if i == 0 else cell.rjust(width)
+                for i, (cell, width) in enumerate(zip(row, widths, strict=True))
+            ).rstrip()
+        )
+
+
+def print_results(results: list[Result]) -> None:
+    rows = [["benchmark", "ops/sec", "±", "bytes/sec", "peak memory"]]
+
+    for r in results:
+        rows.append(
+            [
+                r.name,
+                _format_rate(r.ops, "/s"),
+                f"{r.spread:.0%}",
+                _format_rate(r.bytes_per_sec, "B/s") if r.bytes_per_sec else "-",
+                _format_size(r.peak_memory),
+            ]
+        )
+
+    _print_table(rows)
+
+
+def compare(base: list[Result], new: list[Result], *, threshold: float) -> bool:
+    """Print the change in speed and memory of each benchmark in both runs.
+    Returns whether any benchmark is slower by more than ``threshold``, as a
+    fraction of the base speed.
+    """
+    base_by_name = {r.name: r for r in base}
+    rows = [["benchmark", "base ops/sec", "new ops/sec", "change", "memory change"]]
+    regressed = False
+
+    for r in new:
+        if (b := base_by_name.get(r.name)) is None:
+            continue
+
+        change = r.ops / b.ops - 1
+        marker = ""
+
+        if change < -threshold:
+            marker = " slower"
+            regressed = True
+        elif change > threshold:
+            marker = " faster"
+
+        rows.append(
+            [
+                r.name,
+                _format_rate(b.ops, "/s"),
+                _format_rate(r.ops, "/s"),
+                f"{change:+.1%}{marker}",
+                f"{r.peak_memory - b.peak_memory:+,d} B",
+            ]
+        )
+
+    _print_table(rows)
+    return regressed
+
+
+def save(path: Path, results: list[Result]) -> None:
+    path.write_text(
+        json.dumps(
+            {
+                "python": sys.version,
+                "platform": platform.platform(),
+                "date": datetime.datetime.now(datetime.UTC).isoformat(),
+                "results": [dataclasses.asdict(r) for r in results],
+            },
+            indent=2,
+        )
+    )
+
+
+def load(path: Path) -> list[Result]:
+    data = json.loads(path.read_text())
+    return [Result(**r) for r in data["results"]]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.partition("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run benchmarks.")
+    run_parser.add_argument(
+        "-k", dest="pattern", help="Only run benchmarks containing this text."
+    )
+    run_parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.5,
+        help="Minimum seconds to run each round. Default 0.5.",
+    )
+    run_parser.add_argument(
+        "--rounds", type=int, default=5, help="Rounds to run. Default 5."
+    )
+    run_parser.add_argument("-o", "--output", type=Path, help="Save results as JSON.")
+    run_parser.add_argument(
+        "--compare", type=Path, help="Compare to results saved by a previous run."
+    )
+    compare_parser = commands.add_parser("compare", help="Compare saved results.")
+    compare_parser.add_argument("base", type=Path)
+    compare_parser.add_argument("new", type=Path)
+
+    for p in (run_parser, compare_parser):
+        p.add_argument(
+            "--threshold",
+            type=float,
+            default=0.1,
+            help=(
+                "Exit with an error if a benchmark is slower by more than this"
+                " fraction when comparing. Default 0.1."
+            ),
+        )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        return int(compare(load(args.base), load(args.new), threshold=args.threshold))
+
+    results: list[Result] = []
+
+    for c in CASES:
+        if args.pattern and args.pattern not in c.name:
+            continue
+
+        print(f"running {c.name}", file=sys.stderr)
+        results.append(
+            measure(c.name, c.setup, min_time=args.min_time, rounds=args.rounds)
+        )
+
+    print_results(results)
+
+    if args.output:
+        save(args.output, results)
+
+    if args.compare:
+        print()
+        return int(compare(load(args.compare), results, threshold=args.threshold))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""A minimal SMTP server that accepts and discards messages, used to benchmark
+sending without a real server or network latency.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import types
+
+
+class SMTPSink:
+    """Run an SMTP server on a background event loop. It supports
+    ``PIPELINING`` and accepts every message without storing it, so it doesn't
+    affect memory measurements of the client. Use as a context manager to start
+    and stop it.
+    """
+
+    def __init__(self, host: str = "127.0.0.1") -> None:
+        self.host = host
+        self.port = 0
+        self.messages = 0
+        """Number of messages accepted."""
+        self.bytes = 0
+        """Number of message bytes accepted."""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._server: asyncio.Server | None = None
+
+    def __enter__(self) -> SMTPSink:
+        self._thread.start()
+
+        async def start() -> asyncio.Server:
+            return await asyncio.start_server(self._handle, self.host, 0)
+
+        self._server = asyncio.run_coroutine_threadsafe(start(), self._loop).result()
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: types.TracebackType | None,
+    ) -> None:
+        async def stop() -> None:
+            assert self._server is not None
+            self._server.close()
+            current = asyncio.current_task()
+
+            for task in asyncio.all_tasks():
+                if task is not current:
+                    task.cancel()
+
+        asyncio.run_coroutine_threadsafe(stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        writer.write(b"220 localhost ESMTP\r\n")
+        recipients = 0
+
+        try:
+            while line := await reader.readline():
+                name = line[:4].upper()
+
+                if name == b"EHLO":
+                    writer.write(
+                        b"250-localhost\r\n250-8BITMIME\r\n250-SMTPUTF8\r\n"
+                        b"250-PIPELINING\r\n250 SIZE\r\n"
+                    )
+                elif name == b"MAIL":
+                    recipients = 0
+                    writer.write(b"250 OK\r\n")
+                elif name == b"RCPT":
+                    recipients += 1
+                    writer.write(b"250 OK\r\n")
+                elif name == b"DATA":
+                    if not recipients:
+                        writer.write(b"554 No valid recipients\r\n")
+                        continue
+
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+
+                    while (data := await reader.readline()) != b".\r\n":
+                        self.bytes += len(data)
+
+                    self.messages += 1
+                    writer.write(b"250 Done\r\n")
+                elif name == b"QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"250 OK\r\n")
+
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
@@ -1,13 +1,43 @@
+from __future__ import annotations
+
+import importlib
+import typing as t
+
 from .attachment import Attachment
-from .handlers.base import get_handler_class
-from .handlers.smtp import SMTPEmailHandler
-from .handlers.test import TestEmailHandler
+from .attachment import EncodingCache
+from .merge import MessageTemplate
 from .message import Message
 
+if t.TYPE_CHECKING:
+    from .handlers.base import get_handler_class
+    from .handlers.smtp import SMTPEmailHandler
+    from .handlers.test import TestEmailHandler
+
 __all__ = [
     "get_handler_class",
     "Attachment",
+    "EncodingCache",
     "Message",
+    "MessageTemplate",
     "SMTPEmailHandler",
     "TestEmailHandler",
 ]
+
+_lazy = {
+    "get_handler_class": ".handlers.base",
+    "SMTPEmailHandler": ".handlers.smtp",
+    "TestEmailHandler": ".handlers.test",
+}
+"""Attributes that are imported on first access, so that importing the
+package doesn't import the handlers and their dependencies, such as
+:mod:`ssl` and :mod:`smtplib`.
+"""
+
+
+def __getattr__(name: str) -> t.Any:
+    if name in _lazy:
+        value = getattr(importlib.import_module(_lazy[name], __name__), name)
+        globals()[name] = value
+        return value
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,134 @@
+"""Helpers for writing MIME messages directly as bytes, used by
+:meth:`.Message.iter_bytes`. The output is equivalent to flattening the result
+of :meth:`.Message.to_mime`, but without building the message tree first.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import email.policy
+import email.quoprimime
+import email.utils
+import functools
+import secrets
+import sys
+from email.message import EmailMessage
+
+_MAX_LINE = 78
+"""Maximum line length, matching the default email policy."""
+
+
+@functools.cache
+def _policy(linesep: str, utf8: bool) -> email.policy.EmailPolicy[EmailMessage]:
+    return email.policy.default.clone(linesep=linesep, utf8=utf8)
+
+
+def header(name: str, value: str, *, linesep: str, utf8: bool = False) -> bytes:
+    """Format a header line. Short ASCII values are written directly. Anything
+    else goes through the email policy to encode and fold it, the same as
+    setting the header on an :class:`~email.message.EmailMessage` does.
+
+    :param name: The header name.
+    :param value: The header value.
+    :param linesep: The line separator to end the header with.
+    :param utf8: Write non-ASCII values as UTF-8 rather than encoding them.
+    """
+    if (
+        value.isascii()
+        and len(name) + len(value) + 2 <= _MAX_LINE
+        # Encoded words would be decoded by the policy's parser.
+        and "=?" not in value
+        and "\r" not in value
+        and "\n" not in value
+    ):
+        return f"{name}: {value}{linesep}".encode("ascii")
+
+    policy = _policy(linesep, utf8)
+    folded: str = policy.header_factory(name, value).fold(policy=policy)
+    return folded.encode("utf-8" if utf8 else "ascii", "surrogateescape")
+
+
+def params_header(
+    name: str, value: str, params: dict[str, str], *, linesep: str
+) -> bytes:
+    """Format a header with parameters, such as ``Content-Type``. Parameters
+    are moved to continuation lines if the line would be too long. Non-ASCII
+    values are encoded as described by :rfc:`2231`.
+
+    :param name: The header name.
+    :param value: The main header value.
+    :param params: Parameters to add after the value.
+    :param linesep: The line separator to use.
+    """
+    line = f"{name}: {value}"
+    out: list[str] = []
+
+    for key, param in params.items():
+        if param.isascii():
+            item = f'{key}="{email.utils.quote(param)}"'
+        else:
+            item = f"{key}*={email.utils.encode_rfc2231(param, 'utf-8')}"
+
+        if len(line) + len(item) + 2 > _MAX_LINE:
+            out.append(f"{line};")
+            line = f" {item}"
+        else:
+            line = f"{line}; {item}"
+
+    out.append(line)
+    return f"{linesep.join(out)}{linesep}".encode("ascii")
+
+
+def make_boundary() -> str:
+    """Generate a random multipart boundary in the same style as the standard
+    library. The body is not checked for the boundary, since it is not in
+    memory, but it has enough randomness that a collision is not a concern.
+    """
+    return f"{'=' * 15}{secrets.randbelow(sys.maxsize):019d}=="
+
+
+def encode_text(text: str, *, linesep: str) -> tuple[str, bytes]:
+    """Encode text as UTF-8 and choose a transfer encoding, using the same
+    heuristics as :meth:`~email.message.EmailMessage.set_content`. Returns the
+    transfer encoding name and the encoded body.
+
+    :param text: The text to encode.
+    :param linesep: The line separator to use.
+    """
+    lines = text.encode().splitlines()
+    sep = linesep.encode("ascii")
+    body = sep.join(lines) + sep
+
+    if max((len(x) for x in lines), default=0) <= _MAX_LINE:
+        if body.isascii():
+            return "7bit", body
+
+        return "8bit", body
+
+    sniff = sep.join(lines[:10]) + sep
+    sniff_qp = email.quoprimime.body_encode(sniff.decode("latin-1"), _MAX_LINE)
+
+    # Encoded bodies use newlines, as the message would have before being
+    # flattened with a different line separator.
+    normal = b"\n".join(lines) + b"\n"
+
+    if len(sniff_qp) > len(binascii.b2a_base64(sniff)):
+        return "base64", encode_base64(normal, linesep=linesep)
+
+    qp = email.quoprimime.body_encode(normal.decode("latin-1"), _MAX_LINE, linesep)
+    return "quoted-printable", qp.encode("ascii")
+
+
+def encode_base64(data: bytes, *, linesep: str) -> bytes:
+    """Encode data as base64 in 76 character lines.
+
+    :param data: The data to encode.
+    :param linesep: The line separator to end each line with.
+    """
+    encoded = base64.encodebytes(data)
+
+    if linesep != "\n":
+        encoded = encoded.replace(b"\n", linesep.encode("ascii"))
+
+    return encoded
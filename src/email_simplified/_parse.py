@@ -0,0 +1,191 @@
+"""Helpers for parsing MIME messages incrementally, used by
+:meth:`.Message.from_bytes` and :meth:`.Message.from_file`. Large attachment
+parts are decoded to temporary files rather than kept in memory.
+"""
+
+from __future__ import annotations
+
+import binascii
+import collections.abc as cabc
+import email.policy
+import functools
+import os
+import quopri
+import tempfile
+import typing as t
+from email.message import EmailMessage
+from email.parser import BytesFeedParser
+
+from .attachment import Attachment
+
+_DECODE_CHUNK = 76 * 1024
+"""Number of characters of an encoded payload to decode at once."""
+
+
+def parse(
+    chunks: cabc.Iterable[bytes],
+    *,
+    spool_size: int | None = None,
+    spool_dir: str | os.PathLike[str] | None = None,
+) -> EmailMessage:
+    """Parse a MIME message from chunks of bytes with
+    :class:`~email.parser.BytesFeedParser`.
+
+    :param chunks: The message bytes, in any size chunks.
+    :param spool_size: Attachment parts with an encoded payload larger than
+        this are decoded to a temporary file.
+    :param spool_dir: The directory to create temporary files in.
+    """
+    factory: cabc.Callable[..., EmailMessage] = EmailMessage
+
+    if spool_size is not None:
+        factory = functools.partial(
+            _SpooledPart, spool_size=spool_size, spool_dir=spool_dir
+        )
+
+    parser = BytesFeedParser(_factory=factory, policy=email.policy.default)
+
+    for chunk in chunks:
+        parser.feed(chunk)
+
+    return parser.close()
+
+
+class _SpooledPart(EmailMessage):
+    """A message part that decodes a large attachment payload to a temporary
+    file when the parser sets it. The :attr:`attachment` reads from the file,
+    and the payload is encoded from the file if it's accessed again, the same
+    as a part added for a file attachment.
+    """
+
+    def __init__(
+        self,
+        policy: email.policy.Policy | None = None,
+        *,
+        spool_size: int,
+        spool_dir: str | os.PathLike[str] | None,
+    ) -> None:
+        super().__init__(policy)
+        self.spool_size = spool_size
+        self.spool_dir = spool_dir
+        self.attachment: Attachment | None = None
+
+    def set_payload(self, payload: t.Any, charset: t.Any = None) -> None:
+        if (
+            self.attachment is None
+            and isinstance(payload, str)
+            and len(payload) > self.spool_size
+            and self._is_attachment()
+        ):
+            self.attachment = self._spool(payload)
+            payload = ""
+
+        super().set_payload(payload, charset)
+
+    def get_payload(self, i: int | None = None, decode: bool = False) -> t.Any:
+        if self.attachment is None:
+            return super().get_payload(i, decode)  # type: ignore[call-overload]
+
+        if i is not None:
+            raise TypeError("Expected an int index for a multipart payload.")
+
+        if decode:
+            return self.attachment.read()
+
+        return b"".join(self.attachment.iter_base64()).decode("ascii")
+
+    def _is_attachment(self) -> bool:
+        """Only attachments are spooled. Text parts that aren't marked as an
+        attachment could be the message's content.
+        """
+        if self.get_content_maintype() == "multipart":
+            return False
+
+        if self._transfer_encoding() not in _DECODERS:
+            return False
+
+        return (
+            self.get_content_maintype() != "text"
+            or self.get_content_disposition() == "attachment"
+        )
+
+    def _transfer_encoding(self) -> str | None:
+        value = self.get("content-transfer-encoding")
+        return str(value).strip().lower() if value is not None else None
+
+    def _spool(self, payload: str) -> Attachment:
+        """Decode the payload to a temporary file, and replace the transfer
+        encoding with base64, which is how the payload is encoded from the
+        file if it's accessed.
+        """
+        decode = _DECODERS[self._transfer_encoding()]
+        chunks = (c.encode("ascii", "surrogateescape") for c in _line_chunks(payload))
+        f = tempfile.TemporaryFile(dir=self.spool_dir)
+
+        try:
+            for chunk in decode(chunks):
+                f.write(chunk)
+
+            f.seek(0)
+        except BaseException:
+            f.close()
+            raise
+
+        del self["content-transfer-encoding"]
+        self["Content-Transfer-Encoding"] = "base64"
+        return Attachment(
+            f, filename=self.get_filename(), mimetype=self.get_content_type()
+        )
+
+
+def _line_chunks(payload: str) -> cabc.Iterator[str]:
+    """Split the payload into chunks that end at a line boundary, so that each
+    chunk can be decoded separately.
+    """
+    start = 0
+
+    while start < len(payload):
+        end = payload.find("\n", start + _DECODE_CHUNK)
+        end = len(payload) if end == -1 else end + 1
+        yield payload[start:end]
+        start = end
+
+
+def _no_decode(chunks: cabc.Iterable[bytes]) -> cabc.Iterator[bytes]:
+    yield from chunks
+
+
+def _decode_base64(chunks: cabc.Iterable[bytes]) -> cabc.Iterator[bytes]:
+    """Base64 lines may be any length, so a chunk may end partway through a
+    group of 4 characters. Those characters are carried to the next chunk.
+    """
+    pending = b""
+
+    for chunk in chunks:
+        data = pending + b"".join(chunk.split())
+        end = len(data) - len(data) % 4
+        yield binascii.a2b_base64(data[:end])
+        pending = data[end:]
+
+    if pending:
+        yield binascii.a2b_base64(pending)
+
+
+def _decode_quoted_printable(chunks: cabc.Iterable[bytes]) -> cabc.Iterator[bytes]:
+    for chunk in chunks:
+        yield quopri.decodestring(chunk)
+
+
+_DECODERS: dict[
+    str | None, cabc.Callable[[cabc.Iterable[bytes]], cabc.Iterator[bytes]]
+] = {
+    None: _no_decode,
+    "7bit": _no_decode,
+    "8bit": _no_decode,
+    "binary": _no_decode,
+    "base64": _decode_base64,
+    "quoted-printable": _decode_quoted_printable,
+}
+"""Functions to decode a payload for each transfer encoding that can be
+spooled. Each is passed chunks of whole lines, and yields decoded chunks.
+"""
@@ -2,8 +2,11 @@ from __future__ import annotations
 
 import collections.abc as cabc
 import email.utils
+import functools
+import re
 import sys
 import typing as t
+from collections import Counter
 from email.headerregistry import Address
 
 
@@ -11,16 +14,49 @@ class AddressList(list[Address]):
     """A :class:`list` subclass that contains class:`email.headerregistry.Address`
     items, but accepts strings as well for various operations. Domains are IDNA
     encoded if needed.
+
+    The list keeps an index of its items, so checking if an address is in the
+    list with ``in`` or :meth:`count` takes constant time rather than scanning
+    the list. :meth:`add_unique` and :meth:`dedupe` compare addresses by their
+    ``addr_spec`` (``user@domain``), ignoring case and the display name.
     """
 
     def __init__(self, value: cabc.Iterable[str | Address] = (), /) -> None:
         super().__init__(prepare_address(v) for v in value)
+        self._counts: Counter[tuple[str, str, str]] = Counter(map(_key, self))
+        self._specs: Counter[str] = Counter(map(_spec_key, self))
+
+    def __reduce__(self) -> tuple[t.Any, ...]:
+        # The default would copy the index, then add the items to it again.
+        return type(self), (list(self),)
+
+    def _add(self, values: cabc.Iterable[Address]) -> None:
+        for value in values:
+            self._counts[_key(value)] += 1
+            self._specs[_spec_key(value)] += 1
+
+    def _discard(self, values: cabc.Iterable[Address]) -> None:
+        for value in values:
+            key = _key(value)
+            spec = _spec_key(value)
+            self._counts[key] -= 1
+            self._specs[spec] -= 1
+
+            if not self._counts[key]:
+                del self._counts[key]
+
+            if not self._specs[spec]:
+                del self._specs[spec]
 
     def append(self, value: str | Address, /) -> None:
-        super().append(prepare_address(value))
+        value = prepare_address(value)
+        super().append(value)
+        self._add((value,))
 
     def extend(self, value: cabc.Iterable[str | Address], /) -> None:
-        super().extend(prepare_address(v) for v in value)
+        values = [prepare_address(v) for v in value]
+        super().extend(values)
+        self._add(values)
 
     def index(
         self,
@@ -29,16 +65,39 @@ class AddressList(list[Address]):
         stop: t.SupportsIndex = sys.maxsize,
         /,
     ) -> int:
-        return super().index(prepare_address(value))
+        value = prepare_address(value)
+
+        if _key(value) not in self._counts:
+            raise ValueError(f"{value!r} is not in list")
+
+        return super().index(value, start, stop)
 
     def count(self, value: str | Address, /) -> int:
-        return super().count(prepare_address(value))
+        return self._counts[_key(prepare_address(value))]
 
     def insert(self, index: t.SupportsIndex, value: str | Address, /) -> None:
-        super().insert(index, prepare_address(value))
+        value = prepare_address(value)
+        super().insert(index, value)
+        self._add((value,))
 
     def remove(self, value: str | Address, /) -> None:
-        super().remove(prepare_address(value))
+        value = prepare_address(value)
+
+        if _key(value) not in self._counts:
+            raise ValueError(f"{value!r} is not in list")
+
+        super().remove(value)
+        self._discard((value,))
+
+    def pop(self, index: t.SupportsIndex = -1, /) -> Address:
+        value = super().pop(index)
+        self._discard((value,))
+        return value
+
+    def clear(self) -> None:
+        super().clear()
+        self._counts.clear()
+        self._specs.clear()
 
     @t.overload
     def __setitem__(self, key: t.SupportsIndex, value: str | Address) -> None: ...
@@ -52,24 +111,105 @@ class AddressList(list[Address]):
         value: str | Address | cabc.Iterable[str | Address],
     ) -> None:
         if not isinstance(key, slice):
-            super().__setitem__(key, prepare_address(value))  # type: ignore[arg-type]
+            new = prepare_address(value)  # type: ignore[arg-type]
+            self._discard((self[key],))
+            super().__setitem__(key, new)
+            self._add((new,))
         else:
-            super().__setitem__(key, (prepare_address(v) for v in value))  # type: ignore[union-attr]
+            values = [prepare_address(v) for v in value]  # type: ignore[union-attr]
+            old = self[key]
+            super().__setitem__(key, values)
+            self._discard(old)
+            self._add(values)
+
+    def __delitem__(self, key: t.SupportsIndex | slice) -> None:
+        old = self[key]
+        super().__delitem__(key)
+        self._discard(old if isinstance(key, slice) else (old,))  # type: ignore[arg-type]
 
     def __iadd__(self, other: cabc.Iterable[str | Address]) -> t.Self:  # type: ignore[override, misc]
-        return super().__iadd__(prepare_address(v) for v in other)
+        self.extend(other)
+        return self
+
+    def __imul__(self, value: t.SupportsIndex) -> t.Self:
+        items = list(self)
+        super().__imul__(value)
+        self._discard(items)
+        self._add(self)
+        return self
 
     def __contains__(self, value: object) -> bool:
         if not isinstance(value, str | Address):
             return False
 
-        return super().__contains__(prepare_address(value))
+        return _key(prepare_address(value)) in self._counts
+
+    def has_addr_spec(self, value: str | Address, /) -> bool:
+        """Check if an address with the same ``addr_spec`` is in the list,
+        ignoring case and the display name.
+
+        :param value: The address to check.
+        """
+        return _spec_key(prepare_address(value)) in self._specs
+
+    def add_unique(self, value: str | Address, /) -> bool:
+        """Append the address if an address with the same ``addr_spec`` is not
+        already in the list, ignoring case and the display name. Returns whether
+        the address was added.
+
+        :param value: The address to add.
+        """
+        value = prepare_address(value)
+
+        if _spec_key(value) in self._specs:
+            return False
+
+        self.append(value)
+        return True
+
+    def dedupe(self) -> int:
+        """Remove addresses that have the same ``addr_spec`` as an earlier
+        address in the list, ignoring case and the display name. The order of
+        the remaining addresses is kept. Returns the number of addresses
+        removed.
+        """
+        seen: set[str] = set()
+        keep: list[Address] = []
+
+        for value in self:
+            spec = _spec_key(value)
+
+            if spec not in seen:
+                seen.add(spec)
+                keep.append(value)
+
+        removed = len(self) - len(keep)
+
+        if removed:
+            self[:] = keep
+
+        return removed
+
+
+def _key(value: Address) -> tuple[str, str, str]:
+    """The fields compared by :meth:`Address.__eq__`, used to index items in
+    :class:`AddressList`.
+    """
+    return value.display_name, value.username, value.domain
+
+
+def _spec_key(value: Address) -> str:
+    """The normalized ``addr_spec`` used to find duplicate addresses."""
+    return value.addr_spec.lower()
 
 
 def prepare_address(address: str | Address) -> Address:
     """Convert a string or :class:`email.headerregistry.Address` to an
     ``Address`` with the domain part IDNA encoded if needed.
 
+    Parsed strings and encoded domains are cached, see
+    :func:`set_address_cache_size`.
+
     :param address: Address to process.
     """
     if isinstance(address, Address):
@@ -80,13 +220,21 @@ def prepare_address(address: str | Address) -> Address:
 
         return Address(address.display_name, address.username, domain)
 
+    return _parse_address(address)
+
+
+def _parse_address_uncached(address: str) -> Address:
+    """Parse an address string and IDNA encode the domain if needed.
+
+    :param address: The string to parse.
+    """
     name, addr = email.utils.parseaddr(address)
     username, _, domain = addr.rpartition("@")
     domain = _idna_if_needed(domain)
     return Address(name, username, domain)
 
 
-def _idna_if_needed(domain: str) -> str:
+def _idna_if_needed_uncached(domain: str) -> str:
     """If the domain is non-ASCII, IDNA encode it.
 
     :param domain: The domain to encode.
@@ -97,3 +245,228 @@ def _idna_if_needed(domain: str) -> str:
         return domain.encode("idna").decode("ascii")
 
     return domain
+
+
+_DEFAULT_CACHE_SIZE = 100_000
+"""Default number of entries in each address cache."""
+
+# Address is immutable, so the same instance can be returned for every call.
+_parse_address = functools.lru_cache(_DEFAULT_CACHE_SIZE)(_parse_address_uncached)
+_idna_if_needed = functools.lru_cache(_DEFAULT_CACHE_SIZE)(_idna_if_needed_uncached)
+
+
+class CacheInfo(t.NamedTuple):
+    """Statistics about one of the caches used by :func:`prepare_address`,
+    returned by :func:`address_cache_info`.
+    """
+
+    hits: int
+    """The number of calls that returned a cached result."""
+
+    misses: int
+    """The number of calls that had to parse or encode the value."""
+
+    max_size: int | None
+    """The maximum number of entries, or ``None`` if there is no limit."""
+
+    size: int
+    """The current number of entries."""
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of calls that returned a cached result."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def address_cache_info() -> dict[str, CacheInfo]:
+    """Get statistics about the caches used by :func:`prepare_address`. The
+    ``"parse"`` cache holds parsed address strings, and the ``"idna"`` cache
+    holds encoded domains.
+    """
+    return {
+        name: CacheInfo(info.hits, info.misses, info.maxsize, info.currsize)
+        for name, info in (
+            ("parse", _parse_address.cache_info()),
+            ("idna", _idna_if_needed.cache_info()),
+        )
+    }
+
+
+def clear_address_cache() -> None:
+    """Remove all entries from the caches used by :func:`prepare_address`, and
+    reset their statistics.
+    """
+    _parse_address.cache_clear()
+    _idna_if_needed.cache_clear()
+
+
+def set_address_cache_size(size: int | None) -> None:
+    """Set the maximum number of entries in each of the caches used by
+    :func:`prepare_address`. When a cache is full, the least recently used
+    entry is removed. The caches are cleared. Default is 100,000.
+
+    :param size: The maximum number of entries. ``0`` disables caching, and
+        ``None`` removes the limit.
+    """
+    global _parse_address, _idna_if_needed
+    _parse_address = functools.lru_cache(size)(_parse_address_uncached)
+    _idna_if_needed = functools.lru_cache(size)(_idna_if_needed_uncached)
+
+
+class AddressReject(t.NamedTuple):
+    """A value that could not be parsed by :func:`parse_addresses`."""
+
+    position: int
+    """The position of the value in the input."""
+
+    value: str
+    """The value that was rejected."""
+
+    reason: str
+    """Why the value was rejected."""
+
+
+class ParsedAddresses(t.NamedTuple):
+    """The result of :func:`parse_addresses`."""
+
+    addresses: list[Address]
+    """The valid addresses, in input order."""
+
+    rejects: list[AddressReject]
+    """The values that could not be parsed, in input order."""
+
+    duplicates: int
+    """The number of valid addresses that were skipped because an address with
+    the same ``addr_spec`` came earlier.
+    """
+
+    by_domain: dict[str, list[Address]]
+    """The valid addresses grouped by their lowercase, IDNA encoded domain."""
+
+
+def parse_addresses(
+    values: cabc.Iterable[str],
+    *,
+    dedupe: bool = True,
+    processes: int | None = None,
+    chunk_size: int = 10_000,
+) -> ParsedAddresses:
+    """Parse and validate many address strings, such as when importing a
+    mailing list. Returns the valid addresses along with a list of the values
+    that were rejected and why, rather than raising an error.
+
+    The domain is IDNA encoded as with :func:`prepare_address`. A value is
+    rejected if it is empty, contains more than one address, has no ``@``, has
+    an empty user or domain, has a domain that is not valid, or is longer than
+    254 characters.
+
+    :param values: The address strings to parse.
+    :param dedupe: Skip addresses with the same ``addr_spec`` as an earlier
+        address, ignoring case and the display name.
+    :param processes: Parse in a pool of this many processes. This is faster
+        for very large inputs, where the cost of starting the processes and
+        sending the data is outweighed by parsing in parallel.
+    :param chunk_size: The number of values sent to a process at once.
+    """
+    if processes is not None and processes > 1:
+        # Imported here, multiprocessing is slow to import and rarely needed.
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = pool.map(_parse_chunk, _chunks(values, chunk_size))
+            parsed = [item for chunk in results for item in chunk]
+    else:
+        parsed = [_parse_checked(value) for value in values]
+
+    addresses: list[Address] = []
+    rejects: list[AddressReject] = []
+    by_domain: dict[str, list[Address]] = {}
+    seen: set[str] = set()
+    duplicates = 0
+
+    for position, (value, result) in enumerate(parsed):
+        if isinstance(result, str):
+            rejects.append(AddressReject(position, value, result))
+            continue
+
+        if dedupe:
+            spec = _spec_key(result)
+
+            if spec in seen:
+                duplicates += 1
+                continue
+
+            seen.add(spec)
+
+        addresses.append(result)
+        by_domain.setdefault(result.domain.lower(), []).append(result)
+
+    return ParsedAddresses(addresses, rejects, duplicates, by_domain)
+
+
+def _chunks(values: cabc.Iterable[str], size: int) -> cabc.Iterator[list[str]]:
+    chunk: list[str] = []
+
+    for value in values:
+        chunk.append(value)
+
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def _parse_chunk(values: list[str]) -> list[tuple[str, Address | str]]:
+    return [_parse_checked(value) for value in values]
+
+
+_domain_label_re = re.compile(r"(?!-)[a-zA-Z0-9-]{1,63}(?<!-)")
+
+
+def _parse_checked(value: str) -> tuple[str, Address | str]:
+    """Parse and validate one value for :func:`parse_addresses`. Returns the
+    value along with either the address or the reason it was rejected.
+    """
+    if not value or value.isspace():
+        return value, "empty"
+
+    if "," in value and len(email.utils.getaddresses([value])) > 1:
+        return value, "more than one address"
+
+    name, addr = email.utils.parseaddr(value)
+
+    if not addr:
+        return value, "could not be parsed"
+
+    username, at, domain = addr.rpartition("@")
+
+    if not at:
+        return value, "missing '@'"
+
+    if not username:
+        return value, "empty user"
+
+    if not domain:
+        return value, "empty domain"
+
+    try:
+        domain = _idna_if_needed(domain)
+    except UnicodeError:
+        return value, "domain could not be IDNA encoded"
+
+    if not (
+        (domain.startswith("[") and domain.endswith("]"))
+        or all(_domain_label_re.fullmatch(label) for label in domain.split("."))
+    ):
+        return value, "invalid domain"
+
+    if len(username) + len(domain) + 1 > 254:
+        return value, "too long"
+
+    try:
+        return value, Address(name, username, domain)
+    except ValueError as e:
+        return value, str(e)
@@ -1,17 +1,49 @@
 from __future__ import annotations
 
+import collections.abc as cabc
 import email.utils
+import hashlib
 import mimetypes
+import os
 import socket
+import threading
 import typing as t
+from collections import OrderedDict
+from contextlib import contextmanager
 from email.message import EmailMessage
+from mmap import mmap
+
+from . import _mime
+
+AttachmentData: t.TypeAlias = str | bytes | os.PathLike[str] | t.IO[bytes] | mmap
+"""The types of data that can be passed to :class:`.Attachment`."""
+
+_BASE64_LINE = 57
+"""Number of bytes encoded on each line of base64, for 76 character lines as
+the default email policy does.
+"""
+
+_BASE64_CHUNK = _BASE64_LINE * 1024
+"""Number of bytes to read and encode at once when streaming base64."""
 
 
 class Attachment:
     """Structured representation of an email attachment.
 
-    :param data: Text or bytes data to attach.
-    :param filename: Filename to show for the attachment.
+    Set :attr:`encoding_cache` to reuse the encoded data of attachments that
+    are sent many times.
+
+    Rather than text or bytes, ``data`` can be a path, an open binary file, or
+    an :class:`mmap.mmap`. The data is read when the message is serialized, in
+    chunks, rather than being loaded into memory ahead of time. A file is read
+    from the position it was at when the attachment was created, each time the
+    message is serialized, so it must be seekable if it will be sent more than
+    once.
+
+    :param data: Text or bytes data to attach, or a path or binary file to
+        read the data from.
+    :param filename: Filename to show for the attachment. Defaults to the name
+        of the file if ``data`` is a path or named file.
     :param mimetype: Mimetype describing the attached data. Defaults to guessing
         from ``filename`` if possible, or ``text/plain`` for text data or
         ``application/octet-stream`` for bytes data.
@@ -19,11 +51,14 @@ class Attachment:
 
     def __init__(
         self,
-        data: str | bytes,
+        data: AttachmentData,
         *,
         filename: str | None = None,
         mimetype: str | None = None,
     ):
+        if filename is None:
+            filename = _source_filename(data)
+
         if mimetype is None and filename is not None:
             guess = mimetypes.guess_type(filename)[0]
 
@@ -36,12 +71,17 @@ class Attachment:
             else:
                 mimetype = "application/octet-stream"
 
-        self.data = data
-        """Text or bytes data to attach."""
+        self._data = data
+        self._loader: cabc.Callable[[], str | bytes] | None = None
 
         self.filename = filename
         """Filename to show for the attachment."""
 
+        self._start: int | None = None
+
+        if _is_file(data) and data.seekable():
+            self._start = data.tell()
+
         self.mimetype: str = mimetype
         """Mimetype describing the attached data. Defaults to guessing from
         ``filename`` if possible, or ``text/plain`` for text data or
@@ -49,6 +89,34 @@ class Attachment:
         """
 
         self._cid: str | None = None
+        self._digest: tuple[str | bytes, bytes] | None = None
+
+    encoding_cache: t.ClassVar[EncodingCache | None] = None
+    """A cache shared by all attachments, to reuse the base64 encoded data of
+    attachments with the same content. Disabled by default. Only data in
+    memory is cached, files are always read and encoded in chunks.
+
+    .. code-block:: python
+
+        Attachment.encoding_cache = EncodingCache(max_size=64 * 1024 * 1024)
+    """
+
+    @property
+    def data(self) -> AttachmentData:
+        """Text or bytes data to attach, or a path or binary file to read the
+        data from.
+        """
+        if self._loader is not None:
+            # Decode data from a lazily parsed message on first access.
+            self._data = self._loader()
+            self._loader = None
+
+        return self._data
+
+    @data.setter
+    def data(self, value: AttachmentData) -> None:
+        self._loader = None
+        self._data = value
 
     @property
     def cid(self) -> str:
@@ -64,6 +132,140 @@ class Attachment:
     def cid(self, value: str | None) -> None:
         self._cid = value
 
+    @property
+    def is_file(self) -> bool:
+        """Whether :attr:`data` is read from a file rather than held in
+        memory.
+        """
+        return not isinstance(self.data, str | bytes)
+
+    @contextmanager
+    def open(self) -> cabc.Iterator[t.IO[bytes] | mmap]:
+        """Context manager that opens :attr:`data` for reading bytes. A path is
+        opened and closed after, a file is positioned at its starting position
+        but not closed.
+        """
+        data = self.data
+
+        if isinstance(data, str | bytes):
+            raise TypeError("Only file data can be opened.")
+
+        if isinstance(data, os.PathLike):
+            with open(data, "rb") as f:
+                yield f
+
+            return
+
+        if self._start is not None:
+            data.seek(self._start)
+        elif isinstance(data, mmap):
+            data.seek(0)
+
+        yield data
+
+    def read(self) -> str | bytes:
+        """Get all the data as text or bytes, reading from a file if needed."""
+        if isinstance(self.data, str | bytes):
+            return self.data
+
+        with self.open() as f:
+            return f.read()
+
+    def iter_base64(
+        self, *, linesep: str = "\n", chunk_size: int = _BASE64_CHUNK
+    ) -> cabc.Iterator[bytes]:
+        """Encode the data as base64 in lines of 76 characters, the same as the
+        default email policy does. Files are read and encoded in chunks, so the
+        whole file is never in memory.
+
+        :param linesep: The line separator to end each line with.
+        :param chunk_size: The number of bytes to read and encode at once.
+            Rounded down to a multiple of 57, the number of bytes encoded on
+            each line.
+        """
+        chunk_size = max(chunk_size // _BASE64_LINE, 1) * _BASE64_LINE
+
+        if isinstance(self.data, str | bytes):
+            data = self.data.encode() if isinstance(self.data, str) else self.data
+
+            for i in range(0, len(data), chunk_size):
+                yield _mime.encode_base64(data[i : i + chunk_size], linesep=linesep)
+
+            return
+
+        with self.open() as f:
+            while chunk := f.read(chunk_size):
+                yield _mime.encode_base64(chunk, linesep=linesep)
+
+    def _cached_base64(self, *, linesep: str) -> bytes | None:
+        """Get the base64 encoded data from :attr:`encoding_cache`, encoding
+        and storing it if it's not cached. Returns ``None`` if there is no cache
+        or the data is a file.
+        """
+        cache = Attachment.encoding_cache
+        data = self.data
+
+        if cache is None or not isinstance(data, str | bytes):
+            return None
+
+        if self._digest is None or self._digest[0] is not data:
+            # Remember the hash until the data is replaced.
+            value = data.encode() if isinstance(data, str) else data
+            self._digest = (data, hashlib.sha256(value).digest())
+
+        key = (self._digest[1], self.mimetype, "base64", linesep)
+        encoded = cache.get(key)
+
+        if encoded is None:
+            encoded = b"".join(self.iter_base64(linesep=linesep))
+            cache.set(key, encoded)
+
+        return encoded
+
+    def iter_bytes(
+        self, *, inline: bool = False, linesep: str = "\r\n"
+    ) -> cabc.Iterator[bytes]:
+        """Write this attachment as a MIME part, equivalent to the part added by
+        :meth:`add_to_mime`. Used by :meth:`.Message.iter_bytes`. The data is
+        read and encoded in chunks.
+
+        :param inline: Write an inline part for linking from HTML.
+        :param linesep: The line separator to use.
+        """
+        main_type = self.mimetype.partition("/")[0]
+        params: dict[str, str] = {}
+        body: cabc.Iterable[bytes]
+
+        if isinstance(self.data, str) and main_type == "text":
+            params["charset"] = "utf-8"
+            cte, encoded = _mime.encode_text(self.data, linesep=linesep)
+            body = (encoded,)
+        else:
+            cte = "base64"
+            cached = self._cached_base64(linesep=linesep)
+            body = self.iter_base64(linesep=linesep) if cached is None else (cached,)
+
+        yield _mime.params_header(
+            "Content-Type", self.mimetype, params, linesep=linesep
+        )
+        yield f"Content-Transfer-Encoding: {cte}{linesep}".encode("ascii")
+
+        if inline:
+            yield _mime.header("Content-ID", self.cid, linesep=linesep)
+            yield f"Content-Disposition: inline{linesep}".encode("ascii")
+        elif self.filename:
+            yield _mime.params_header(
+                "Content-Disposition",
+                "attachment",
+                {"filename": self.filename},
+                linesep=linesep,
+            )
+        else:
+            yield f"Content-Disposition: attachment{linesep}".encode("ascii")
+
+        yield linesep.encode("ascii")
+        yield from body
+
     def add_to_mime(self, message: EmailMessage, *, inline: bool = False) -> None:
         """Add this attachment to the given :class:`email.message.EmailMessage.
         When attaching inline, include the :attr:`cid`, otherwise the
@@ -72,9 +274,25 @@ class Attachment:
         :param message: The message to attach to.
         :param inline: Attach inline for linking from HTML.
         """
+        if self.is_file:
+            self._add_base64_to_mime(
+                message, _FilePart(self, policy=message.policy), inline=inline
+            )
+            return
+
+        if not (isinstance(self.data, str) and self.mimetype.startswith("text/")):
+            cached = self._cached_base64(linesep="\n")
+
+            if cached is not None:
+                part = EmailMessage(policy=message.policy)
+                part.set_payload(cached.decode("ascii"))
+                self._add_base64_to_mime(message, part, inline=inline)
+                return
+
         kwargs: dict[str, t.Any] = {}
         main_type, _, kwargs["subtype"] = self.mimetype.partition("/")
-        data: str | bytes = self.data
+        data = self.data
+        assert isinstance(data, str | bytes)
 
         if isinstance(data, str):
             if main_type != "text":
@@ -95,6 +313,181 @@ class Attachment:
 
             message.add_attachment(data, **kwargs)
 
+    def _add_base64_to_mime(
+        self, message: EmailMessage, part: EmailMessage, *, inline: bool
+    ) -> None:
+        """Add a part with a base64 payload that has already been set, either
+        encoded data or a :class:`_FilePart` that reads from the file when the
+        message is serialized. The headers match what
+        :meth:`~email.message.EmailMessage.add_attachment` would produce for
+        the same bytes.
+        """
+        part["Content-Type"] = self.mimetype
+        part["Content-Transfer-Encoding"] = "base64"
+
+        if inline:
+            part["Content-ID"] = self.cid
+        elif self.filename:
+            part["Content-Disposition"] = "attachment"
+            part.set_param(
+                "filename", self.filename, header="Content-Disposition", replace=True
+            )
+
+        part["MIME-Version"] = "1.0"
+
+        if "content-disposition" not in part:
+            part["Content-Disposition"] = "inline" if inline else "attachment"
+
+        _attach_part(message, part, inline=inline)
+
+
+_CacheKey: t.TypeAlias = tuple[bytes, str, str, str]
+
+
+class EncodingCache:
+    """A thread-safe cache of encoded attachment data, used by
+    :attr:`Attachment.encoding_cache`. Entries are keyed by a hash of the
+    content, the mimetype, the transfer encoding, and the line separator, so
+    separate attachments with the same content share an entry.
+
+    When the total size of the entries is over ``max_size``, the least recently
+    used entries are removed. Data larger than ``max_size`` is not cached.
+
+    The :attr:`hits` and :attr:`misses` counters can be used to decide how big
+    the cache should be.
+
+    :param max_size: The maximum total size of the encoded data, in bytes.
+    """
+
+    def __init__(self, max_size: int = 32 * 1024 * 1024) -> None:
+        if max_size < 1:
+            raise ValueError("'max_size' must be at least 1.")
+
+        self.max_size: int = max_size
+        """The maximum total size of the encoded data, in bytes."""
+
+        self.size: int = 0
+        """The current total size of the encoded data, in bytes."""
+
+        self.hits: int = 0
+        """The number of times data was found in the cache."""
+
+        self.misses: int = 0
+        """The number of times data was not found and had to be encoded."""
+
+        self.evictions: int = 0
+        """The number of entries removed to stay under :attr:`max_size`."""
+
+        self._data: OrderedDict[_CacheKey, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: _CacheKey) -> bytes | None:
+        """Get the encoded data for a key, marking it as recently used. Returns
+        ``None`` if it is not cached.
+
+        :param key: The content hash, mimetype, transfer encoding, and line
+            separator.
+        """
+        with self._lock:
+            value = self._data.get(key)
+
+            if value is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: _CacheKey, value: bytes) -> None:
+        """Store encoded data, removing the least recently used entries if the
+        cache is too large.
+
+        :param key: The content hash, mimetype, transfer encoding, and line
+            separator.
+        :param value: The encoded data.
+        """
+        if len(value) > self.max_size:
+            return
+
+        with self._lock:
+            if (old := self._data.pop(key, None)) is not None:
+                self.size -= len(old)
+
+            self._data[key] = value
+            self.size += len(value)
+
+            while self.size > self.max_size:
+                _, removed = self._data.popitem(last=False)
+                self.size -= len(removed)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+
+class _FilePart(EmailMessage):
+    """A MIME part for an :class:`Attachment` that reads from a file. The
+    payload is read and encoded each time it's accessed, rather than being
+    stored in memory.
+    """
+
+    def __init__(self, attachment: Attachment, **kwargs: t.Any) -> None:
+        super().__init__(**kwargs)
+        self.attachment = attachment
+        # The generators skip parts with a None payload.
+        self._payload = ""
+
+    def get_payload(self, i: int | None = None, decode: bool = False) -> t.Any:
+        if i is not None:
+            raise TypeError("Expected an int index for a multipart payload.")
+
+        if decode:
+            return self.attachment.read()
+
+        return b"".join(self.attachment.iter_base64()).decode("ascii")
+
+
+def _attach_part(message: EmailMessage, part: EmailMessage, *, inline: bool) -> None:
+    """Attach a part to the message, converting the message to
+    ``multipart/related`` or ``multipart/mixed`` first if needed, as
+    :meth:`~email.message.EmailMessage.add_related` and
+    :meth:`~email.message.EmailMessage.add_attachment` do.
+    """
+    subtype = "related" if inline else "mixed"
+
+    if message.get_content_type() != f"multipart/{subtype}":
+        getattr(message, f"make_{subtype}")()
+
+    message.attach(part)
+
+
+def _is_file(data: AttachmentData) -> t.TypeGuard[t.IO[bytes]]:
+    return not isinstance(data, str | bytes | os.PathLike | mmap)
+
+
+def _source_filename(data: AttachmentData) -> str | None:
+    """Get the filename from a path or named file."""
+    if isinstance(data, os.PathLike):
+        return os.path.basename(data)
+
+    if _is_file(data):
+        name = getattr(data, "name", None)
+
+        if isinstance(name, str):
+            return os.path.basename(name)
+
+    return None
+
 
 _local_hostname: str | None = None
 """Cached value for :func:`local_hostname`."""
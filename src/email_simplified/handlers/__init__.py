@@ -1,11 +1,50 @@
+from __future__ import annotations
+
+import importlib
+import typing as t
+
 from .base import EmailHandler
 from .base import get_handler_class
-from .smtp import SMTPEmailHandler
-from .test import TestEmailHandler
+
+if t.TYPE_CHECKING:
+    from .failover import FailoverSMTPEmailHandler
+    from .file import FileEmailHandler
+    from .file import MaildirEmailHandler
+    from .file import MboxEmailHandler
+    from .smtp import SMTPEmailHandler
+    from .spool import SpoolEmailHandler
+    from .test import TestEmailHandler
 
 __all__ = [
     "get_handler_class",
     "EmailHandler",
+    "FailoverSMTPEmailHandler",
+    "FileEmailHandler",
+    "MaildirEmailHandler",
+    "MboxEmailHandler",
     "SMTPEmailHandler",
+    "SpoolEmailHandler",
     "TestEmailHandler",
 ]
+
+_lazy = {
+    "FailoverSMTPEmailHandler": ".failover",
+    "FileEmailHandler": ".file",
+    "MaildirEmailHandler": ".file",
+    "MboxEmailHandler": ".file",
+    "SMTPEmailHandler": ".smtp",
+    "SpoolEmailHandler": ".spool",
+    "TestEmailHandler": ".test",
+}
+"""Attributes that are imported on first access, so that importing the
+package doesn't import every handler and its dependencies.
+"""
+
+
+def __getattr__(name: str) -> t.Any:
+    if name in _lazy:
+        value = getattr(importlib.import_module(_lazy[name], __name__), name)
+        globals()[name] = value
+        return value
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
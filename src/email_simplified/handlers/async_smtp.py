@@ -0,0 +1,518 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import collections.abc as cabc
+import hmac
+import typing as t
+from smtplib import SMTPAuthenticationError
+from smtplib import SMTPDataError
+from smtplib import SMTPException
+from smtplib import SMTPHeloError
+from smtplib import SMTPNotSupportedError
+from smtplib import SMTPRecipientsRefused
+from smtplib import SMTPResponseException
+from smtplib import SMTPSenderRefused
+from smtplib import SMTPServerDisconnected
+from ssl import SSLContext
+
+_MAX_LINE = 8192
+"""Maximum length of a reply line, matching :mod:`smtplib`."""
+
+
+class AsyncSMTP:
+    """A minimal SMTP client built on :func:`asyncio.open_connection`. Used by
+    :meth:`.SMTPEmailHandler.send_async` so that many sends can share an event
+    loop rather than each using a thread.
+
+    Only the commands needed to send messages are implemented. Errors raise the
+    same exceptions as :mod:`smtplib`, so they can be handled the same way
+    whether sending with the sync or async client.
+
+    Use :meth:`connect` to create a connected client rather than creating it
+    directly.
+
+    :param reader: The stream to read replies from.
+    :param writer: The stream to write commands to.
+    :param host: The host that was connected to, used to verify the server
+        certificate during ``STARTTLS``.
+    :param local_hostname: The name to send with ``EHLO``.
+    :param timeout: Timeout for each reply. Default is no timeout.
+    """
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        *,
+        host: str,
+        local_hostname: str,
+        timeout: float | None = None,
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.host = host
+        self.local_hostname = local_hostname
+        self.timeout = timeout
+
+        self.esmtp_features: dict[str, str] = {}
+        """Extensions advertised by the server in response to ``EHLO``. Keys are
+        lowercase extension names, values are any parameters.
+        """
+
+        self.does_esmtp = False
+        """Whether the server responded to ``EHLO`` rather than ``HELO``."""
+
+    @classmethod
+    async def connect(
+        cls,
+        host: str,
+        port: int,
+        *,
+        local_hostname: str,
+        timeout: float | None = None,
+        tls_context: SSLContext | None = None,
+    ) -> t.Self:
+        """Open a connection, read the server greeting, and send ``EHLO``.
+
+        :param host: Host to connect to.
+        :param port: Port to connect to.
+        :param local_hostname: The name to send with ``EHLO``.
+        :param timeout: Timeout for connecting and for each reply.
+        :param tls_context: Establish the connection with TLS using this
+            context.
+        """
+        async with asyncio.timeout(timeout):
+            reader, writer = await asyncio.open_connection(
+                host,
+                port,
+                ssl=tls_context,
+                server_hostname=host if tls_context is not None else None,
+                limit=_MAX_LINE * 8,
+            )
+
+        client = cls(
+            reader, writer, host=host, local_hostname=local_hostname, timeout=timeout
+        )
+
+        try:
+            code, message = await client.read_reply()
+
+            if code != 220:
+                raise SMTPResponseException(code, message)
+
+            await client.ehlo_or_helo()
+        except BaseException:
+            client.close()
+            raise
+
+        return client
+
+    async def __aenter__(self) -> t.Self:
+        return self
+
+    async def __aexit__(self, *args: t.Any) -> None:
+        try:
+            await self.quit()
+        except (SMTPException, OSError):
+            pass
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Close the connection without sending ``QUIT``."""
+        self.writer.close()
+
+    async def read_reply(self) -> tuple[int, bytes]:
+        """Read a single, possibly multi-line, reply from the server. Returns
+        the code and the lines of text joined with newlines.
+        """
+        lines: list[bytes] = []
+        code = -1
+
+        async with asyncio.timeout(self.timeout):
+            while True:
+                line = await self.reader.readline()
+
+                if not line:
+                    self.close()
+                    raise SMTPServerDisconnected("Connection unexpectedly closed")
+
+                if len(line) > _MAX_LINE:
+                    self.close()
+                    raise SMTPResponseException(500, b"Line too long.")
+
+                lines.append(line[4:].strip(b" \t\r\n"))
+
+                try:
+                    code = int(line[:3])
+                except ValueError:
+                    code = -1
+                    break
+
+                if line[3:4] != b"-":
+                    break
+
+        return code, b"\n".join(lines)
+
+    async def command(self, name: str, args: str = "") -> tuple[int, bytes]:
+        """Send a command and read its reply.
+
+        :param name: The command name, such as ``MAIL``.
+        :param args: The text to send after the command name.
+        """
+        self.writer.write(command_line(name, args))
+        await self.writer.drain()
+        return await self.read_reply()
+
+    async def ehlo_or_helo(self) -> None:
+        """Send ``EHLO`` and record the server's extensions. Falls back to
+        ``HELO`` if the server doesn't support ``EHLO``.
+        """
+        code, message = await self.command("EHLO", self.local_hostname)
+
+        if code == 250:
+            self.does_esmtp = True
+            self.esmtp_features = _parse_features(message)
+            return
+
+        self.does_esmtp = False
+        self.esmtp_features = {}
+        code, message = await self.command("HELO", self.local_hostname)
+
+        if code != 250:
+            raise SMTPHeloError(code, message)
+
+    def has_extn(self, name: str) -> bool:
+        """Whether the server advertised the given extension.
+
+        :param name: The extension name, case insensitive.
+        """
+        return name.lower() in self.esmtp_features
+
+    async def starttls(self, context: SSLContext) -> None:
+        """Upgrade the connection to TLS, then send ``EHLO`` again.
+
+        :param context: The TLS context to use.
+        """
+        if not self.has_extn("starttls"):
+            raise SMTPNotSupportedError("STARTTLS extension not supported by server.")
+
+        code, message = await self.command("STARTTLS")
+
+        if code != 220:
+            raise SMTPResponseException(code, message)
+
+        async with asyncio.timeout(self.timeout):
+            await self.writer.start_tls(context, server_hostname=self.host)
+
+        await self.ehlo_or_helo()
+
+    async def login(self, username: str, password: str) -> None:
+        """Authenticate using the first of ``CRAM-MD5``, ``PLAIN``, or
+        ``LOGIN`` that the server supports, as :meth:`smtplib.SMTP.login` does.
+
+        :param username: Username to log in with.
+        :param password: Password to log in with.
+        """
+        if not self.has_extn("auth"):
+            raise SMTPNotSupportedError("SMTP AUTH extension not supported by server.")
+
+        advertised = self.esmtp_features["auth"].upper().split()
+        mechanisms = [m for m in ("CRAM-MD5", "PLAIN", "LOGIN") if m in advertised]
+
+        if not mechanisms:
+            raise SMTPException("No suitable authentication method found.")
+
+        last: SMTPAuthenticationError | None = None
+
+        for mechanism in mechanisms:
+            code, message = await self._auth(mechanism, username, password)
+
+            if code in {235, 503}:
+                return
+
+            last = SMTPAuthenticationError(code, message)
+
+        assert last is not None
+        raise last
+
+    async def _auth(
+        self, mechanism: str, username: str, password: str
+    ) -> tuple[int, bytes]:
+        if mechanism == "PLAIN":
+            token = _b64(f"\0{username}\0{password}")
+            return await self.command("AUTH", f"PLAIN {token}")
+
+        code, challenge = await self.command("AUTH", mechanism)
+
+        if mechanism == "CRAM-MD5":
+            if code != 334:
+                return code, challenge
+
+            digest = hmac.HMAC(
+                password.encode(), base64.b64decode(challenge), "md5"
+            ).hexdigest()
+            return await self.command(_b64(f"{username} {digest}"))
+
+        # LOGIN sends the username and password in response to two challenges.
+        for value in (username, password):
+            if code != 334:
+                break
+
+            code, challenge = await self.command(_b64(value))
+
+        return code, challenge
+
+    async def rset(self) -> tuple[int, bytes]:
+        """Reset the current mail transaction."""
+        return await self.command("RSET")
+
+    async def noop(self) -> tuple[int, bytes]:
+        """Check that the connection is still alive."""
+        return await self.command("NOOP")
+
+    async def sendmail(
+        self,
+        from_addr: str,
+        to_addrs: t.Sequence[str],
+        msg: bytes | cabc.Iterable[bytes],
+        mail_options: t.Sequence[str] = (),
+        *,
+        size: int | None = None,
+    ) -> dict[str, tuple[int, bytes]]:
+        """Send a message that has already been serialized, as
+        :meth:`smtplib.SMTP.sendmail` does. Returns a dict of recipients that
+        were refused, if some were accepted.
+
+        :param from_addr: The address to send ``MAIL`` from.
+        :param to_addrs: The addresses to send ``RCPT`` to.
+        :param msg: The message bytes, with CRLF line endings. May be an
+            iterable of chunks, which are written as they are produced.
+        :param mail_options: Extra parameters for the ``MAIL`` command.
+        :param size: The total size of the message, sent with ``SIZE`` if the
+            server supports it. Only needed if ``msg`` is an iterable.
+        """
+        if isinstance(msg, bytes):
+            size = len(msg)
+            msg = (msg,)
+
+        options = list(mail_options)
+
+        if size is not None and self.does_esmtp and self.has_extn("size"):
+            options.append(f"SIZE={size}")
+
+        if self.has_extn("pipelining"):
+            return await self._sendmail_pipelined(from_addr, to_addrs, msg, options)
+
+        code, message = await self.command(
+            "MAIL", " ".join([f"FROM:<{from_addr}>", *options])
+        )
+
+        if code != 250:
+            await self._rset_quietly(code)
+            raise SMTPSenderRefused(code, message, from_addr)
+
+        refused: dict[str, tuple[int, bytes]] = {}
+
+        for addr in to_addrs:
+            code, message = await self.command("RCPT", f"TO:<{addr}>")
+
+            if code not in {250, 251}:
+                refused[addr] = (code, message)
+
+            if code == 421:
+                self.close()
+                raise SMTPRecipientsRefused(refused)
+
+        if len(refused) == len(to_addrs):
+            await self._rset_quietly(code)
+            raise SMTPRecipientsRefused(refused)
+
+        code, message = await self.command("DATA")
+
+        if code != 354:
+            await self._rset_quietly(code)
+            raise SMTPDataError(code, message)
+
+        return await self._send_data(msg, refused)
+
+    async def _sendmail_pipelined(
+        self,
+        from_addr: str,
+        to_addrs: t.Sequence[str],
+        msg: cabc.Iterable[bytes],
+        options: list[str],
+    ) -> dict[str, tuple[int, bytes]]:
+        """Send ``MAIL``, every ``RCPT``, and ``DATA`` in one write, then read
+        all the replies, as described by :rfc:`2920`.
+        """
+        self.writer.write(pipeline_commands(from_addr, to_addrs, options))
+        await self.writer.drain()
+        replies = [await self.read_reply() for _ in range(len(to_addrs) + 2)]
+
+        try:
+            refused = check_pipeline_replies(from_addr, to_addrs, replies)
+        except SMTPException:
+            if replies[-1][0] == 354:
+                # The server is waiting for data even though the transaction
+                # failed. Send an empty message to end the data section.
+                self.writer.write(b".\r\n")
+                await self.writer.drain()
+                await self.read_reply()
+
+            closing = any(code == 421 for code, _ in replies)
+            await self._rset_quietly(421 if closing else 0)
+            raise
+
+        return await self._send_data(msg, refused)
+
+    async def _send_data(
+        self, msg: cabc.Iterable[bytes], refused: dict[str, tuple[int, bytes]]
+    ) -> dict[str, tuple[int, bytes]]:
+        for chunk in quote_data(msg):
+            self.writer.write(chunk)
+            # Wait for the buffer to empty so a large message is not held in
+            # memory all at once.
+            await self.writer.drain()
+
+        code, message = await self.read_reply()
+
+        if code != 250:
+            await self._rset_quietly(code)
+            raise SMTPDataError(code, message)
+
+        return refused
+
+    async def _rset_quietly(self, code: int) -> None:
+        if code == 421:
+            self.close()
+            return
+
+        try:
+            await self.rset()
+        except SMTPServerDisconnected:
+            pass
+
+    async def quit(self) -> None:
+        """Send ``QUIT``. Use :meth:`close` after to close the connection."""
+        await self.command("QUIT")
+
+
+def _b64(value: str) -> str:
+    return base64.b64encode(value.encode()).decode("ascii")
+
+
+def _parse_features(message: bytes) -> dict[str, str]:
+    """Parse the extension lines of an ``EHLO`` reply. The first line is the
+    server's greeting and is skipped.
+    """
+    features: dict[str, str] = {}
+
+    for line in message.decode("latin-1").split("\n")[1:]:
+        name, _, params = line.partition(" ")
+
+        if not name:
+            continue
+
+        name = name.lower()
+
+        if name == "auth" and name in features:
+            params = f"{features[name]} {params}"
+
+        features[name] = params.strip()
+
+    return features
+
+
+def command_line(name: str, args: str = "") -> bytes:
+    """Format a command to send to the server.
+
+    :param name: The command name, such as ``MAIL``.
+    :param args: The text to send after the command name.
+    """
+    line = f"{name} {args}" if args else name
+
+    if "\r" in line or "\n" in line:
+        raise ValueError("Command and arguments must not contain newlines.")
+
+    return f"{line}\r\n".encode()
+
+
+def pipeline_commands(
+    from_addr: str, to_addrs: t.Sequence[str], options: t.Sequence[str]
+) -> bytes:
+    """Format the ``MAIL``, ``RCPT``, and ``DATA`` commands to send in a single
+    write when the server supports ``PIPELINING``.
+
+    :param from_addr: The address to send ``MAIL`` from.
+    :param to_addrs: The addresses to send ``RCPT`` to.
+    :param options: Extra parameters for the ``MAIL`` command.
+    """
+    return b"".join(
+        [
+            command_line("MAIL", " ".join([f"FROM:<{from_addr}>", *options])),
+            *(command_line("RCPT", f"TO:<{addr}>") for addr in to_addrs),
+            command_line("DATA"),
+        ]
+    )
+
+
+def check_pipeline_replies(
+    from_addr: str, to_addrs: t.Sequence[str], replies: list[tuple[int, bytes]]
+) -> dict[str, tuple[int, bytes]]:
+    """Check the replies to :func:`pipeline_commands`. Returns a dict of
+    recipients that were refused, if some were accepted. Raises the same errors
+    as :meth:`smtplib.SMTP.sendmail` if the transaction failed.
+
+    :param from_addr: The address sent with ``MAIL``.
+    :param to_addrs: The addresses sent with ``RCPT``.
+    :param replies: The replies to ``MAIL``, each ``RCPT``, and ``DATA``.
+    """
+    (mail_code, mail_message), *rcpt_replies, (data_code, data_message) = replies
+
+    if mail_code != 250:
+        raise SMTPSenderRefused(mail_code, mail_message, from_addr)
+
+    refused = {
+        addr: reply
+        for addr, reply in zip(to_addrs, rcpt_replies, strict=True)
+        if reply[0] not in {250, 251}
+    }
+
+    if len(refused) == len(to_addrs):
+        raise SMTPRecipientsRefused(refused)
+
+    if data_code != 354:
+        raise SMTPDataError(data_code, data_message)
+
+    return refused
+
+
+def quote_data(chunks: cabc.Iterable[bytes]) -> cabc.Iterator[bytes]:
+    """Escape leading periods and add the terminating ``.`` line, as
+    :meth:`smtplib.SMTP.data` does. The message is processed in chunks, so it
+    does not need to be in memory all at once. Lines may be split across
+    chunks.
+
+    :param chunks: The message bytes, with CRLF line endings.
+    """
+    line_start = True
+    end = b""
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+
+        if line_start and chunk[:1] == b".":
+            chunk = b"." + chunk
+
+        chunk = chunk.replace(b"\n.", b"\n..")
+        line_start = chunk[-1:] == b"\n"
+        end = (end + chunk)[-2:]
+        yield chunk
+
+    if not end.endswith(b"\r\n"):
+        yield b"\r\n"
+
+    yield b".\r\n"
@@ -1,14 +1,14 @@
 from __future__ import annotations
 
-import asyncio
-import importlib.metadata
 import pkgutil
 import typing as t
 from email.message import EmailMessage as _EmailMessage
-from inspect import isclass
 
 from ..message import Message
 
+if t.TYPE_CHECKING:
+    from importlib.metadata import EntryPoint
+
 
 class EmailHandler:
     """Interface for sending email messages. Subclasses will define how to send
@@ -31,6 +31,9 @@ class EmailHandler:
         """Send one or more email messages, as with :meth:`send`, but in an
         ``async`` context.
         """
+        # Imported here so that importing the package doesn't import asyncio.
+        import asyncio
+
         await asyncio.to_thread(self.send, messages)
 
     @classmethod
@@ -44,15 +47,35 @@ class EmailHandler:
 
 
 _handler_classes: dict[str, type[EmailHandler]] = {}
+_entry_points: dict[str, EntryPoint] | None = None
+
+
+def _get_entry_point(name: str) -> EntryPoint | None:
+    """Find an entry point in the ``email_simplified.handler`` namespace. The
+    entry points are listed the first time this is called, but are not loaded.
+    """
+    global _entry_points
+
+    if _entry_points is None:
+        # Imported here, importlib.metadata is slow to import.
+        import importlib.metadata
+
+        _entry_points = {
+            ep.name: ep
+            for ep in importlib.metadata.entry_points(group="email_simplified.handler")
+        }
+
+    return _entry_points.get(name)
 
 
 def get_handler_class(name: str | type[EmailHandler]) -> type[EmailHandler]:
     """Get a :class:`.EmailHandler` implementation by name.
 
     First looks up if the name is in the ``email_simplified.handler`` entry
-    point namespace, and loads the referenced class if it is. Libraries
-    providing handler implementations should register a handler's name so that
-    it's automatically available when installed.
+    point namespace, and loads the referenced class if it is. Only the
+    requested entry point is loaded, other installed handlers are not imported.
+    Libraries providing handler implementations should register a handler's
+    name so that it's automatically available when installed.
 
     If an entry point is not found, attempts to treat the name as an import
     path in the form ``module.submodule:handler_class``. This is useful for
@@ -66,20 +89,20 @@ def get_handler_class(name: str | type[EmailHandler]) -> type[EmailHandler]:
     if not isinstance(name, str):
         return name
 
-    if not _handler_classes:
-        for ep in importlib.metadata.entry_points(group="email_simplified.handler"):
-            obj = ep.load()
-            _handler_classes[ep.name] = obj
-
     if name in _handler_classes:
         return _handler_classes[name]
 
+    if (ep := _get_entry_point(name)) is not None:
+        obj = ep.load()
+        _handler_classes[name] = obj
+        return obj  # type: ignore[no-any-return]
+
     try:
         obj = pkgutil.resolve_name(name)
     except ImportError:
         obj = None
 
-    if isclass(obj) and issubclass(obj, EmailHandler):
+    if isinstance(obj, type) and issubclass(obj, EmailHandler):
         _handler_classes[name] = obj
         return obj
 
@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+import collections.abc as cabc
+import copy
+import logging
+import random
+import threading
+import time
+import typing as t
+import weakref
+from contextlib import asynccontextmanager
+from contextlib import AsyncExitStack
+from smtplib import SMTP
+from smtplib import SMTPException
+
+from .async_smtp import AsyncSMTP
+from .smtp import _Timer
+from .smtp import SMTPEmailHandler
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPEndpoint:
+    """An SMTP server used by :class:`FailoverSMTPEmailHandler`, along with
+    its weight and health.
+
+    :param handler: The handler that connects to the server.
+    :param weight: How much of the load to send to this server, relative to the
+        other endpoints.
+    """
+
+    def __init__(self, handler: SMTPEmailHandler, weight: float = 1.0) -> None:
+        if weight <= 0:
+            raise ValueError("Endpoint weight must be greater than 0.")
+
+        self.handler = handler
+        """The handler that connects to the server."""
+
+        self.weight = weight
+        """How much of the load to send to this server."""
+
+        self.failures = 0
+        """The number of failures since the last success."""
+
+        self.unhealthy_since: float | None = None
+        """The :func:`time.monotonic` time the endpoint was marked unhealthy,
+        or ``None`` if it's healthy.
+        """
+
+    @property
+    def healthy(self) -> bool:
+        """Whether the endpoint is used for new connections."""
+        return self.unhealthy_since is None
+
+    def __repr__(self) -> str:
+        return (
+            f"<SMTPEndpoint {self.handler.host}:{self.handler.port}"
+            f" weight={self.weight} healthy={self.healthy}>"
+        )
+
+
+class FailoverSMTPEmailHandler(SMTPEmailHandler):
+    """Email handler that sends with SMTP through multiple servers, spreading
+    the load between them and avoiding servers that are failing.
+
+    Each new connection goes to a healthy endpoint chosen at random by weight.
+    If connecting fails, the next endpoint is tried. An endpoint that can't be
+    connected to, or that fails ``failure_threshold`` transactions in a row
+    with a ``4xx`` reply or a lost connection, is marked unhealthy, and isn't
+    used until it recovers. If every endpoint is unhealthy, they are all tried
+    anyway, starting with the one that failed longest ago.
+
+    After a failure, :meth:`deliver` closes the connection, so that recipients
+    retried with ``retries`` are sent through an endpoint that hasn't been
+    failing when one is available. :meth:`send` doesn't retry, it raises the
+    error, and the next message is sent through another endpoint. Use
+    ``deliver`` to move a message to another endpoint after a ``4xx`` reply.
+
+    :param endpoints: The servers to send through. Each item may be an
+        :class:`SMTPEndpoint`, an :class:`.SMTPEmailHandler` with weight 1, or a
+        config dict passed to :meth:`.SMTPEmailHandler.from_config`, with an
+        optional ``weight`` key.
+    :param failure_threshold: The number of failed transactions in a row that
+        mark an endpoint unhealthy. A failure to connect marks it unhealthy
+        immediately.
+    :param cooldown: How long in seconds an unhealthy endpoint is skipped
+        before it is checked again.
+    :param probe: Check unhealthy endpoints from a background thread by
+        connecting and sending ``NOOP``. Otherwise, after the cooldown the next
+        connection tries the endpoint, and marks it unhealthy again if it fails.
+    :param kwargs: Other arguments are passed to :class:`.SMTPEmailHandler`,
+        and control how messages are sent, such as ``pool_size``, ``retries``,
+        and the rate limits. Connection arguments such as ``host`` are not
+        used, each endpoint has its own, and ``resolver`` is not supported.
+        ``listeners`` are called for each endpoint's connections, as well as
+        the endpoint's own listeners. The endpoint handlers passed in are not
+        changed.
+    """
+
+    def __init__(
+        self,
+        endpoints: cabc.Iterable[SMTPEndpoint | SMTPEmailHandler | dict[str, t.Any]],
+        *,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        probe: bool = True,
+        **kwargs: t.Any,
+    ) -> None:
+        super().__init__(**kwargs)
+
+        if self.resolver is not None:
+            raise ValueError("A resolver can't be used with failover endpoints.")
+
+        self.endpoints: list[SMTPEndpoint] = [_endpoint(e) for e in endpoints]
+        """The servers to send through."""
+
+        if not self.endpoints:
+            raise ValueError("At least one endpoint is required.")
+
+        self.failure_threshold = failure_threshold
+        """The number of failed transactions in a row that mark an endpoint
+        unhealthy.
+        """
+
+        self.cooldown = cooldown
+        """How long in seconds an unhealthy endpoint is skipped before it is
+        checked again.
+        """
+
+        self.probe = probe
+        """Check unhealthy endpoints from a background thread."""
+
+        # A copy of each endpoint's handler that also calls this handler's
+        # listeners, so that a handler shared with other code isn't changed.
+        self._handlers: dict[SMTPEndpoint, SMTPEmailHandler] = {}
+
+        for endpoint in self.endpoints:
+            handler = self._handlers[endpoint] = copy.copy(endpoint.handler)
+            handler.listeners = [*endpoint.handler.listeners, *self.listeners]
+
+        self._lock = threading.Lock()
+        self._clients: weakref.WeakKeyDictionary[SMTP | AsyncSMTP, SMTPEndpoint] = (
+            weakref.WeakKeyDictionary()
+        )
+        self._probe_thread: threading.Thread | None = None
+        self._probe_stop = threading.Event()
+        self._closed = False
+
+    @classmethod
+    def from_config(cls, config: dict[str, t.Any]) -> t.Self:
+        """Create a handler from a config dict. Config keys match the arguments
+        to :class:`.FailoverSMTPEmailHandler` and :class:`.SMTPEmailHandler`.
+        ``endpoints`` is required, and is a list of config dicts for
+        :class:`.SMTPEmailHandler` with an optional ``weight`` key.
+        """
+        return cls(
+            config["endpoints"],
+            failure_threshold=config.get("failure_threshold", 3),
+            cooldown=config.get("cooldown", 30.0),
+            probe=config.get("probe", True),
+            **SMTPEmailHandler._config_args(config),
+        )
+
+    def open(self) -> SMTP:
+        """Connect to an endpoint, trying each in turn until one succeeds. The
+        caller is responsible for closing the client.
+        """
+        if self.connection_rate is not None:
+            self.connection_rate.acquire()
+
+        error: Exception | None = None
+
+        for endpoint in self._candidates():
+            try:
+                client = self._handlers[endpoint].open()
+            except (SMTPException, OSError) as e:
+                self._failed(endpoint, connect=True)
+                error = e
+                continue
+
+            with self._lock:
+                self._clients[client] = endpoint
+
+            return client
+
+        assert error is not None
+        raise error
+
+    @asynccontextmanager
+    async def _connect_async(self, timer: _Timer | None) -> t.AsyncIterator[AsyncSMTP]:
+        if self.connection_rate is not None:
+            await self.connection_rate.acquire_async()
+
+        error: Exception | None = None
+
+        for endpoint in self._candidates():
+            stack = AsyncExitStack()
+            handler = self._handlers[endpoint]
+
+            try:
+                client = await stack.enter_async_context(
+                    handler._connect_async(handler._timer())
+                )
+            except (SMTPException, OSError) as e:
+                self._failed(endpoint, connect=True)
+                error = e
+                continue
+
+            with self._lock:
+                self._clients[client] = endpoint
+
+            async with stack:
+                yield client
+
+            return
+
+        assert error is not None
+        raise error
+
+    def close(self) -> None:
+        """Stop checking unhealthy endpoints, and close any idle connections in
+        the pool and in each endpoint's pool. Unhealthy endpoints are not
+        checked in the background after this.
+        """
+        with self._lock:
+            self._closed = True
+            self._probe_stop.set()
+            thread, self._probe_thread = self._probe_thread, None
+
+        if thread is not None:
+            thread.join()
+
+        super().close()
+
+        for endpoint in self.endpoints:
+            endpoint.handler.close()
+
+    def _candidates(self) -> list[SMTPEndpoint]:
+        """The endpoints to try connecting to, in order. Healthy endpoints that
+        haven't been failing come first, in a random order by weight. Unhealthy
+        endpoints come last, starting with the one that failed longest ago.
+        Without :attr:`probe`, an endpoint that has been unhealthy for the
+        cooldown is tried first, to check if it has recovered.
+        """
+        now = time.monotonic()
+        trial: list[SMTPEndpoint] = []
+        healthy: list[SMTPEndpoint] = []
+        unhealthy: list[SMTPEndpoint] = []
+
+        with self._lock:
+            for endpoint in self.endpoints:
+                since = endpoint.unhealthy_since
+
+                if since is None:
+                    healthy.append(endpoint)
+                elif not self.probe and now - since >= self.cooldown:
+                    # Let this caller try it, others wait for another cooldown.
+                    endpoint.unhealthy_since = now
+                    trial.append(endpoint)
+                else:
+                    unhealthy.append(endpoint)
+
+        # A weighted shuffle, each endpoint is first with probability
+        # proportional to its weight.
+        keys = {id(e): random.random() ** (1 / e.weight) for e in healthy}
+        healthy.sort(key=lambda e: (e.failures, -keys[id(e)]))
+        unhealthy.sort(key=lambda e: t.cast(float, e.unhealthy_since))
+        return trial + healthy + unhealthy
+
+    def _report(self, client: SMTP | AsyncSMTP, failed: bool) -> bool:
+        with self._lock:
+            endpoint = self._clients.get(client)
+
+        if endpoint is None:
+            return False
+
+        if not failed:
+            self._succeeded(endpoint)
+            return False
+
+        self._failed(endpoint)
+        # Reconnect, possibly to another endpoint, for the next transaction.
+        return True
+
+    def _succeeded(self, endpoint: SMTPEndpoint) -> None:
+        with self._lock:
+            recovered = endpoint.unhealthy_since is not None
+            endpoint.failures = 0
+            endpoint.unhealthy_since = None
+
+        if recovered:
+            logger.info("SMTP endpoint %r recovered.", endpoint)
+
+    def _failed(self, endpoint: SMTPEndpoint, connect: bool = False) -> None:
+        with self._lock:
+            endpoint.failures += 1
+
+            if endpoint.unhealthy_since is not None:
+                return
+
+            if not connect and endpoint.failures < self.failure_threshold:
+                return
+
+            endpoint.unhealthy_since = time.monotonic()
+
+        logger.warning("SMTP endpoint %r is unhealthy.", endpoint)
+
+        if self.probe:
+            self._start_probe()
+
+    def _start_probe(self) -> None:
+        """Start the thread that checks unhealthy endpoints, if it isn't
+        already running and the handler hasn't been closed.
+        """
+        with self._lock:
+            if self._closed:
+                return
+
+            if self._probe_thread is not None and self._probe_thread.is_alive():
+                return
+
+            self._probe_stop = threading.Event()
+            self._probe_thread = threading.Thread(
+                target=self._run_probe,
+                args=(self._probe_stop,),
+                name="email-smtp-probe",
+                daemon=True,
+            )
+            self._probe_thread.start()
+
+    def _run_probe(self, stop: threading.Event) -> None:
+        """Check each endpoint that has been unhealthy for the cooldown. Stops
+        once every endpoint is healthy.
+        """
+        while not stop.wait(self.cooldown / 4):
+            now = time.monotonic()
+
+            with self._lock:
+                due = [
+                    e
+                    for e in self.endpoints
+                    if e.unhealthy_since is not None
+                    and now - e.unhealthy_since >= self.cooldown
+                ]
+
+                if all(e.healthy for e in self.endpoints):
+                    self._probe_thread = None
+                    return
+
+            for endpoint in due:
+                if _check(self._handlers[endpoint]):
+                    self._succeeded(endpoint)
+                else:
+                    with self._lock:
+                        endpoint.unhealthy_since = time.monotonic()
+
+
+def _endpoint(
+    value: SMTPEndpoint | SMTPEmailHandler | dict[str, t.Any],
+) -> SMTPEndpoint:
+    if isinstance(value, SMTPEndpoint):
+        return value
+
+    if isinstance(value, SMTPEmailHandler):
+        return SMTPEndpoint(value)
+
+    config = dict(value)
+    weight = config.pop("weight", 1.0)
+    return SMTPEndpoint(SMTPEmailHandler.from_config(config), weight)
+
+
+def _check(handler: SMTPEmailHandler) -> bool:
+    """Connect to an endpoint and send ``NOOP``, returning whether it
+    succeeded.
+    """
+    try:
+        with handler.connect() as client:
+            code, _ = client.noop()
+    except (SMTPException, OSError):
+        return False
+
+    return code == 250
@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import asyncio
+import collections.abc as cabc
+import functools
+import io
+import itertools
+import os
+import re
+import socket
+import threading
+import time
+import typing as t
+from email.generator import BytesGenerator
+from email.message import EmailMessage as _EmailMessage
+from pathlib import Path
+
+from ..message import Message
+from .base import EmailHandler
+
+
+class _DirectoryEmailHandler(EmailHandler):
+    """Base for handlers that write each message to a file in ``_tmp``, then
+    move the files to ``_new`` together.
+    """
+
+    _suffix = ""
+
+    def __init__(
+        self,
+        directory: str | os.PathLike[str],
+        *,
+        fsync: bool = True,
+        workers: int = 4,
+        linesep: str = "\n",
+    ) -> None:
+        self.directory: Path = Path(directory)
+        """The directory to write to."""
+
+        self.fsync = fsync
+        """Flush files and the directory to disk before :meth:`send`
+        returns.
+        """
+
+        self.workers = workers
+        """The number of threads :meth:`send_async` writes with."""
+
+        self.linesep = linesep
+        """The line separator to write."""
+
+        self._tmp = self.directory / "tmp"
+        self._new = self.directory / "new"
+
+    def send(self, messages: list[Message | _EmailMessage]) -> None:
+        """Write each message to a new file.
+
+        Each message is written to a temporary file, then all the files are
+        moved into place together. If an error occurs while writing, none of
+        the messages are written.
+
+        :param messages: A list of messages to write.
+        """
+        if not messages:
+            return
+
+        self._commit(self._write_all(messages))
+
+    async def send_async(self, messages: list[Message | _EmailMessage]) -> None:
+        """Write each message to a new file, as with :meth:`send`, but split
+        the messages between :attr:`workers` threads.
+
+        :param messages: A list of messages to write.
+        """
+        if not messages:
+            return
+
+        results = await asyncio.gather(
+            *(
+                asyncio.to_thread(self._write_all, group)
+                for group in _split(messages, self.workers)
+            ),
+            return_exceptions=True,
+        )
+        written = [p for r in results if isinstance(r, list) for p in r]
+
+        for result in results:
+            if isinstance(result, BaseException):
+                _unlink_all(written)
+                raise result
+
+        await asyncio.to_thread(self._commit, written)
+
+    def _write_all(self, messages: list[Message | _EmailMessage]) -> list[Path]:
+        """Write each message to a new file in ``_tmp``. If an error occurs,
+        the files that were written are removed.
+        """
+        written: list[Path] = []
+
+        try:
+            for message in messages:
+                path = self._tmp / _unique_name(self._suffix)
+                written.append(path)
+                _write_file(path, message, linesep=self.linesep, fsync=self.fsync)
+        except BaseException:
+            _unlink_all(written)
+            raise
+
+        return written
+
+    def _commit(self, written: list[Path]) -> None:
+        """Move the written files to ``_new``, then flush the directory once."""
+        for path in written:
+            path.rename(self._new / path.name)
+
+        if self.fsync:
+            _fsync_dir(self._new)
+
+
+class FileEmailHandler(_DirectoryEmailHandler):
+    """Email handler that writes each message to a ``.eml`` file in a
+    directory, such as to archive messages or for a local MTA to pick up.
+
+    Messages are written to a hidden ``.tmp`` directory inside the directory,
+    then moved into it once they are completely written, so that a program
+    watching the directory never sees a partial message. Messages are streamed
+    to the file rather than built in memory first.
+
+    :param directory: The directory to write to. Created if it doesn't exist.
+    :param fsync: Flush each file and the directory to disk before :meth:`send`
+        returns. The directory is flushed once for all the messages passed to
+        ``send``. Disable this to trade durability for speed.
+    :param workers: The number of threads :meth:`send_async` writes with.
+    :param linesep: The line separator to write. Some programs expect ``\\r\\n``
+        in ``.eml`` files.
+    """
+
+    _suffix = ".eml"
+
+    def __init__(
+        self,
+        directory: str | os.PathLike[str],
+        *,
+        fsync: bool = True,
+        workers: int = 4,
+        linesep: str = "\n",
+    ) -> None:
+        super().__init__(directory, fsync=fsync, workers=workers, linesep=linesep)
+        self._tmp = self.directory / ".tmp"
+        self._new = self.directory
+        self._tmp.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: dict[str, t.Any]) -> t.Self:
+        """Create a handler from a config dict. Config keys match the arguments
+        to :class:`.FileEmailHandler`. ``directory`` is required.
+        """
+        return cls(
+            config["directory"],
+            fsync=config.get("fsync", True),
+            workers=config.get("workers", 4),
+            linesep=config.get("linesep", "\n"),
+        )
+
+
+class MaildirEmailHandler(_DirectoryEmailHandler):
+    """Email handler that delivers each message to a maildir, which can be read
+    by mail clients and servers, or :class:`mailbox.Maildir`.
+
+    Messages are written to ``tmp``, then moved to ``new`` once they are
+    completely written. Messages are streamed to the file rather than built in
+    memory first.
+
+    :param directory: The maildir. It and its ``tmp``, ``new``, and ``cur``
+        directories are created if they don't exist.
+    :param fsync: Flush each file and the ``new`` directory to disk before
+        :meth:`send` returns. The directory is flushed once for all the messages
+        passed to ``send``. Disable this to trade durability for speed.
+    :param workers: The number of threads :meth:`send_async` writes with.
+    """
+
+    def __init__(
+        self,
+        directory: str | os.PathLike[str],
+        *,
+        fsync: bool = True,
+        workers: int = 4,
+    ) -> None:
+        super().__init__(directory, fsync=fsync, workers=workers)
+
+        for name in ("tmp", "new", "cur"):
+            (self.directory / name).mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: dict[str, t.Any]) -> t.Self:
+        """Create a handler from a config dict. Config keys match the arguments
+        to :class:`.MaildirEmailHandler`. ``directory`` is required.
+        """
+        return cls(
+            config["directory"],
+            fsync=config.get("fsync", True),
+            workers=config.get("workers", 4),
+        )
+
+
+class MboxEmailHandler(EmailHandler):
+    """Email handler that appends messages to an mbox file, which can be read
+    by mail clients, or :class:`mailbox.mbox`.
+
+    Lines in a message that start with ``From`` are quoted with ``>``. Messages
+    are quoted and written in chunks rather than built in memory first. The
+    handler can be used from multiple threads, but only one process should
+    write to a file at a time.
+
+    :param path: The mbox file. Created if it doesn't exist.
+    :param fsync: Flush the file to disk before :meth:`send` returns. The file
+        is flushed once for all the messages passed to ``send``. Disable this to
+        trade durability for speed.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike[str],
+        *,
+        fsync: bool = True,
+    ) -> None:
+        self.path: Path = Path(path)
+        """The mbox file."""
+
+        self.fsync = fsync
+        """Flush the file to disk before :meth:`send` returns."""
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict[str, t.Any]) -> t.Self:
+        """Create a handler from a config dict. Config keys match the arguments
+        to :class:`.MboxEmailHandler`. ``path`` is required.
+        """
+        return cls(config["path"], fsync=config.get("fsync", True))
+
+    def send(self, messages: list[Message | _EmailMessage]) -> None:
+        """Append the messages to the file, in order.
+
+        :param messages: A list of messages to append.
+        """
+        if not messages:
+            return
+
+        self._append(messages)
+
+    async def send_async(self, messages: list[Message | _EmailMessage]) -> None:
+        """Append the messages to the file, as with :meth:`send`, from a
+        thread. Unlike the directory handlers, the messages aren't split
+        between threads, since only one writer can append to the file at a
+        time.
+
+        :param messages: A list of messages to append.
+        """
+        if not messages:
+            return
+
+        await asyncio.to_thread(self._append, messages)
+
+    def _append(self, messages: list[Message | _EmailMessage]) -> None:
+        with self._lock, self.path.open("ab") as f:
+            for message in messages:
+                _write_mbox(f, _iter_message(message))
+
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def _iter_message(message: Message | _EmailMessage) -> cabc.Iterator[bytes]:
+    """Serialize a message in chunks with ``\\n`` line endings. A
+    :class:`.Message` is generated in parts, an
+    :class:`~email.message.EmailMessage` all at once.
+    """
+    if isinstance(message, Message):
+        yield from message.iter_bytes(linesep="\n")
+        return
+
+    out = io.BytesIO()
+    BytesGenerator(out, policy=message.policy).flatten(message, linesep="\n")
+    yield out.getvalue()
+
+
+def _write_file(
+    path: Path,
+    message: Message | _EmailMessage,
+    *,
+    linesep: str = "\n",
+    fsync: bool = True,
+) -> None:
+    """Write a message to a new file, without building it in memory first."""
+    with path.open("xb") as f:
+        if isinstance(message, Message):
+            message.write_to(f, linesep=linesep)
+        else:
+            BytesGenerator(f, policy=message.policy).flatten(message, linesep=linesep)
+
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+_from_line = re.compile(rb"^From ", re.MULTILINE)
+
+
+def _write_mbox(fp: t.IO[bytes], chunks: cabc.Iterable[bytes]) -> None:
+    """Append a message to an mbox file from its serialized chunks, which use
+    ``\\n`` line endings. Lines in the message that start with ``From`` are
+    quoted with ``>``. A line split between chunks is held until the rest of it
+    is read, so that only whole lines are quoted.
+    """
+    date = time.asctime(time.gmtime())
+    fp.write(f"From MAILER-DAEMON {date}\n".encode())
+    pending = b""
+
+    for chunk in chunks:
+        data = pending + chunk
+        end = data.rfind(b"\n") + 1
+        fp.write(_from_line.sub(b">From ", data[:end]))
+        pending = data[end:]
+
+    if pending:
+        fp.write(_from_line.sub(b">From ", pending) + b"\n")
+
+    fp.write(b"\n")
+
+
+_names = itertools.count()
+
+
+@functools.cache
+def _host() -> str:
+    return socket.gethostname().replace("/", "_").replace(".", "_")
+
+
+def _unique_name(suffix: str = "") -> str:
+    """Generate a maildir style file name that is unique across processes and
+    hosts. Names sort in the order they were generated.
+    """
+    return f"{time.time_ns():020d}.{os.getpid()}_{next(_names)}.{_host()}{suffix}"
+
+
+def _split(items: list[t.Any], workers: int) -> list[list[t.Any]]:
+    """Split the items into up to ``workers`` groups, keeping their order."""
+    size = -(-len(items) // max(1, min(workers, len(items))))
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def _unlink_all(paths: list[Path]) -> None:
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+def _fsync_dir(path: Path) -> None:
+    """Flush a directory so that renames into it are durable. Not supported on
+    Windows, where opening a directory fails.
+    """
+    if os.name == "nt":
+        return
+
+    fd = os.open(path, os.O_RDONLY)
+
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
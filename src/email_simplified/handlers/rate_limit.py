@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """A thread-safe token bucket rate limiter. Tokens are added at ``rate``
+    per ``period`` seconds, up to ``burst`` tokens. Taking tokens waits until
+    enough have been added.
+
+    Waiting callers reserve their tokens in the order they call, so a caller
+    that needs many tokens isn't starved by callers that need few. A single
+    request may be larger than ``burst``, it waits for the tokens to be added.
+
+    The same bucket can be shared between handlers and threads, and used from
+    sync and async code, to share one budget across the process.
+
+    :param rate: The number of tokens added each period.
+    :param period: The length of the period in seconds.
+    :param burst: The maximum number of tokens that can be saved up while idle,
+        allowing a burst of that size. Defaults to ``rate``.
+    """
+
+    def __init__(
+        self, rate: float, period: float = 1.0, *, burst: float | None = None
+    ) -> None:
+        if rate <= 0 or period <= 0:
+            raise ValueError("Rate and period must be greater than 0.")
+
+        self.rate = rate
+        """The number of tokens added each period."""
+
+        self.period = period
+        """The length of the period in seconds."""
+
+        self.burst: float = rate if burst is None else burst
+        """The maximum number of tokens that can be saved up."""
+
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take tokens from the bucket, and return how long in seconds the
+        caller must wait before using them. Prefer :meth:`acquire` or
+        :meth:`acquire_async`, which wait as well.
+
+        :param tokens: The number of tokens to take.
+        """
+        with self._lock:
+            now = time.monotonic()
+            added = (now - self._last) * self.rate / self.period
+            self._tokens = min(self.burst, self._tokens + added) - tokens
+            self._last = now
+
+            if self._tokens >= 0:
+                return 0.0
+
+            return -self._tokens * self.period / self.rate
+
+    def acquire(self, tokens: float = 1) -> None:
+        """Take tokens from the bucket, waiting until they're available.
+
+        :param tokens: The number of tokens to take.
+        """
+        if delay := self.reserve(tokens):
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: float = 1) -> None:
+        """Take tokens from the bucket, waiting without blocking the event loop
+        until they're available.
+
+        :param tokens: The number of tokens to take.
+        """
+        if delay := self.reserve(tokens):
+            await asyncio.sleep(delay)
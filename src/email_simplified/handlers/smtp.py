@@ -1,18 +1,58 @@
 from __future__ import annotations
 
+import asyncio
+import collections.abc as cabc
+import copy
+import itertools
+import random
+import socket
 import ssl
+import threading
+import time
 import typing as t
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextlib import AsyncExitStack
 from contextlib import contextmanager
+from contextlib import ExitStack
+from email.generator import BytesGenerator
 from email.message import EmailMessage as _EmailMessage
-from itertools import islice
 from smtplib import SMTP
 from smtplib import SMTP_SSL
 from smtplib import SMTP_SSL_PORT
+from smtplib import SMTPDataError
+from smtplib import SMTPException
+from smtplib import SMTPNotSupportedError
+from smtplib import SMTPRecipientsRefused
+from smtplib import SMTPResponseException
+from smtplib import SMTPSenderRefused
+from smtplib import SMTPServerDisconnected
 from ssl import SSLContext
+from tempfile import SpooledTemporaryFile
 
+from .. import address
 from ..attachment import local_hostname
 from ..message import Message
+from .async_smtp import AsyncSMTP
+from .async_smtp import check_pipeline_replies
+from .async_smtp import pipeline_commands
+from .async_smtp import quote_data
 from .base import EmailHandler
+from .rate_limit import TokenBucket
+
+_SPOOL_SIZE = 1024 * 1024
+"""Serialized messages larger than this are written to a temporary file rather
+than held in memory while sending.
+"""
+
+_CHUNK_SIZE = 64 * 1024
+"""Size of each chunk of message data written to the connection."""
+
+_MAX_ROUTES = 100
+"""The number of hosts returned by the resolver to keep a handler and pool for.
+The least recently used host's idle connections are closed after that.
+"""
 
 
 class SMTPEmailHandler(EmailHandler):
@@ -20,6 +60,9 @@ class SMTPEmailHandler(EmailHandler):
     :mod:`smtplib`. All arguments are optional, :class:`smtplib.SMTP` uses
     default values if something is not given.
 
+    :meth:`send_async` uses :class:`.AsyncSMTP` rather than running
+    :meth:`send` in a thread, and uses the same arguments.
+
     :param host: Host to connect to.
     :param port: Port to connect to.
     :param use_tls: The connection should be established with TLS. Default is
@@ -41,6 +84,49 @@ class SMTPEmailHandler(EmailHandler):
         recipients, split the send calls to batches of this size. This is to
         support servers that have a limit configured. By default, no batching
         is done.
+    :param pool_size: Keep up to this many logged-in connections open between
+        calls to :meth:`send` and reuse them, rather than connecting for every
+        call. By default, no pool is used.
+    :param pool_idle_timeout: Close a pooled connection rather than reuse it if
+        it has been idle for longer than this many seconds. By default, idle
+        connections are kept until the server closes them.
+    :param pool_max_messages: Close a pooled connection after it has sent this
+        many messages, and open a new one. By default, there is no limit.
+    :param max_connections: Send a list of messages over up to this many
+        connections in parallel. By default, messages are sent in order over a
+        single connection.
+    :param preserve_order: When using ``max_connections``, send messages with
+        the same recipients over the same connection in the order they were
+        given.
+    :param listeners: Functions to call with an :class:`SMTPEvent` after each
+        phase of connecting and sending, to record how long it took.
+    :param retries: The number of times :meth:`deliver` tries again to send to
+        recipients that failed temporarily. By default, it doesn't retry.
+    :param retry_backoff: The delay in seconds before the first retry. The
+        delay doubles for each retry after that.
+    :param retry_max_delay: The longest delay in seconds between retries.
+    :param retry_jitter: Use a random delay between zero and the backoff delay,
+        so that many clients retrying at once don't all connect at the same
+        time.
+    :param max_messages_per_second: Wait before sending rather than send more
+        than this many messages per second. Each batch of
+        ``recipients_per_message`` counts as a message. May be a
+        :class:`.TokenBucket` to share the limit with other handlers.
+    :param max_recipients_per_second: Wait before sending rather than send to
+        more than this many recipients per second. May be a
+        :class:`.TokenBucket`.
+    :param max_connections_per_minute: Wait before connecting rather than open
+        more than this many connections per minute. May be a
+        :class:`.TokenBucket`.
+    :param group_by_domain: Order each message's recipients by domain before
+        splitting them into batches of ``recipients_per_message``, so that each
+        batch has as few domains as possible.
+    :param resolver: A function called with each recipient domain that returns
+        the host to deliver to, as ``host`` or ``(host, port)``, or ``None`` to
+        use ``host``. Each message is sent in one transaction per destination
+        host, over a connection to that host which is reused for the following
+        messages. Connections to other hosts use the same settings as ``host``,
+        and each has its own pool if ``pool_size`` is given.
     """
 
     def __init__(
@@ -56,6 +142,21 @@ class SMTPEmailHandler(EmailHandler):
         password: str | None = None,
         default_from: str | None = None,
         recipients_per_message: int | None = None,
+        pool_size: int | None = None,
+        pool_idle_timeout: float | None = None,
+        pool_max_messages: int | None = None,
+        max_connections: int | None = None,
+        preserve_order: bool = False,
+        listeners: cabc.Iterable[SMTPListener] | None = None,
+        retries: int = 0,
+        retry_backoff: float = 1.0,
+        retry_max_delay: float = 60.0,
+        retry_jitter: bool = True,
+        max_messages_per_second: float | TokenBucket | None = None,
+        max_recipients_per_second: float | TokenBucket | None = None,
+        max_connections_per_minute: float | TokenBucket | None = None,
+        group_by_domain: bool = False,
+        resolver: SMTPResolver | None = None,
     ):
         self.host = host
         """Host to connect to."""
@@ -83,6 +184,61 @@ class SMTPEmailHandler(EmailHandler):
         that have a limit configured. By default no batching is done.
         """
 
+        self.max_connections = max_connections
+        """Send a list of messages over up to this many connections in
+        parallel.
+        """
+
+        self.preserve_order = preserve_order
+        """When using :attr:`max_connections`, send messages with the same
+        recipients over the same connection in the order they were given.
+        """
+
+        self.listeners: list[SMTPListener] = list(listeners or ())
+        """Functions to call with an :class:`SMTPEvent` after each phase of
+        connecting and sending. Phases are only timed if there are listeners.
+        """
+
+        self._connection_ids = itertools.count()
+
+        self.retries = retries
+        """The number of times :meth:`deliver` tries again to send to recipients
+        that failed temporarily.
+        """
+
+        self.retry_backoff = retry_backoff
+        """The delay in seconds before the first retry, doubled for each retry
+        after that.
+        """
+
+        self.retry_max_delay = retry_max_delay
+        """The longest delay in seconds between retries."""
+
+        self.retry_jitter = retry_jitter
+        """Use a random delay between zero and the backoff delay."""
+
+        self.message_rate: TokenBucket | None = _bucket(max_messages_per_second, 1)
+        """Limits the number of messages sent per second. Shared by every
+        thread and task using this handler.
+        """
+
+        self.recipient_rate: TokenBucket | None = _bucket(max_recipients_per_second, 1)
+        """Limits the number of recipients sent to per second."""
+
+        self.connection_rate: TokenBucket | None = _bucket(
+            max_connections_per_minute, 60
+        )
+        """Limits the number of connections opened per minute."""
+
+        self.group_by_domain = group_by_domain
+        """Order recipients by domain before splitting them into batches."""
+
+        self.resolver = resolver
+        """Maps each recipient domain to the host to deliver to."""
+
+        self._routes: dict[tuple[str, int | None], SMTPEmailHandler] = {}
+        self._routes_lock = threading.Lock()
+
         if use_tls is None:
             use_tls = port == SMTP_SSL_PORT
 
@@ -102,12 +258,32 @@ class SMTPEmailHandler(EmailHandler):
         ``use_starttls`` is enabled.
         """
 
+        self.pool: SMTPConnectionPool | None = None
+        """The pool of open connections reused by :meth:`send`, if
+        ``pool_size`` was given.
+        """
+
+        if pool_size is not None:
+            self.pool = SMTPConnectionPool(
+                self.open,
+                size=pool_size,
+                idle_timeout=pool_idle_timeout,
+                max_messages=pool_max_messages,
+            )
+
     @classmethod
     def from_config(cls, config: dict[str, t.Any]) -> t.Self:
         """Create a handler from a config dict. Config keys match the
         arguments to :class:`.SMTPEmailHandler`, and are all optional.
         """
-        return cls(
+        return cls(**cls._config_args(config))
+
+    @staticmethod
+    def _config_args(config: dict[str, t.Any]) -> dict[str, t.Any]:
+        """Get the arguments to :class:`.SMTPEmailHandler` from a config dict,
+        with the default for any missing keys.
+        """
+        return dict(
             host=config.get("host"),
             port=config.get("port"),
             use_tls=config.get("use_tls"),
@@ -117,13 +293,32 @@ class SMTPEmailHandler(EmailHandler):
             username=config.get("username"),
             password=config.get("password"),
             default_from=config.get("default_from"),
+            recipients_per_message=config.get("recipients_per_message"),
+            pool_size=config.get("pool_size"),
+            pool_idle_timeout=config.get("pool_idle_timeout"),
+            pool_max_messages=config.get("pool_max_messages"),
+            max_connections=config.get("max_connections"),
+            preserve_order=config.get("preserve_order", False),
+            listeners=config.get("listeners"),
+            retries=config.get("retries", 0),
+            retry_backoff=config.get("retry_backoff", 1.0),
+            retry_max_delay=config.get("retry_max_delay", 60.0),
+            retry_jitter=config.get("retry_jitter", True),
+            max_messages_per_second=config.get("max_messages_per_second"),
+            max_recipients_per_second=config.get("max_recipients_per_second"),
+            max_connections_per_minute=config.get("max_connections_per_minute"),
+            group_by_domain=config.get("group_by_domain", False),
+            resolver=config.get("resolver"),
         )
 
-    @contextmanager
-    def connect(self) -> t.Iterator[SMTP]:
-        """Context manager that creates an :class:`smtplib.SMTP` client, connects,
-        logs in, then closes when exiting the block.
+    def open(self) -> SMTP:
+        """Create an :class:`smtplib.SMTP` client, connect, and log in. The
+        caller is responsible for closing the client. Prefer :meth:`connect`
+        unless the client needs to outlive a ``with`` block.
         """
+        if self.connection_rate is not None:
+            self.connection_rate.acquire()
+
         smtp_cls: type[SMTP | SMTP_SSL] = SMTP
         smtp_args: dict[str, t.Any] = {
             "host": self.host,
@@ -136,54 +331,1797 @@ class SMTPEmailHandler(EmailHandler):
             smtp_cls = SMTP_SSL
             smtp_args["context"] = self.tls_context
 
-        with smtp_cls(**smtp_args) as client:
+        timer = self._timer()
+
+        if timer is not None:
+            smtp_cls = _TimedSMTP_SSL if self.use_tls else _TimedSMTP
+            smtp_args["timer"] = timer
+
+        client = smtp_cls(**smtp_args)
+
+        try:
+            if timer is not None:
+                # Send EHLO now so that it's timed separately, rather than as
+                # part of the next command.
+                start = time.perf_counter()
+                client.ehlo_or_helo_if_needed()
+                timer.emit("ehlo", start)
+
             if self.use_starttls:
+                start = time.perf_counter()
                 client.starttls(context=self.tls_context)
 
+                if timer is not None:
+                    timer.emit("starttls", start)
+
             if self.username is not None and self.password is not None:
+                start = time.perf_counter()
                 client.login(self.username, self.password)
 
+                if timer is not None:
+                    timer.emit("auth", start)
+        except BaseException:
+            client.close()
+            raise
+
+        return client
+
+    @contextmanager
+    def connect(self) -> t.Iterator[SMTP]:
+        """Context manager that creates an :class:`smtplib.SMTP` client, connects,
+        logs in, then closes when exiting the block.
+        """
+        client = self.open()
+
+        with client:
             yield client
 
-    def _send_batched(
-        self, client: SMTP, message: _EmailMessage, from_addr: str | None
-    ) -> None:
-        assert self.recipients_per_message is not None
+    def close(self) -> None:
+        """Close any idle connections in the :attr:`pool`, and the pools for
+        hosts returned by the :attr:`resolver`. Connections that are in use by
+        another thread are closed when they are returned.
+        """
+        if self.pool is not None:
+            self.pool.close()
+
+        with self._routes_lock:
+            routes = list(self._routes.values())
+            self._routes.clear()
+
+        for handler in routes:
+            handler.close()
+
+    @asynccontextmanager
+    async def connect_async(self) -> t.AsyncIterator[AsyncSMTP]:
+        """Async context manager that creates an :class:`.AsyncSMTP` client,
+        connects, logs in, then closes when exiting the block.
+        """
+        async with self._connect_async(None) as client:
+            yield client
+
+    @asynccontextmanager
+    async def _connect_async(self, timer: _Timer | None) -> t.AsyncIterator[AsyncSMTP]:
+        port = self.port
+
+        if port is None:
+            port = SMTP_SSL_PORT if self.use_tls else 25
+
+        if self.connection_rate is not None:
+            await self.connection_rate.acquire_async()
+
+        start = time.perf_counter()
+        client = await AsyncSMTP.connect(
+            self.host or "localhost",
+            port,
+            local_hostname=local_hostname(),
+            timeout=self.timeout,
+            tls_context=self.tls_context if self.use_tls else None,
+        )
+
+        if timer is not None:
+            timer.emit("connect", start)
+
+        async with client:
+            if self.use_starttls:
+                assert self.tls_context is not None
+                start = time.perf_counter()
+                await client.starttls(self.tls_context)
+
+                if timer is not None:
+                    timer.emit("starttls", start)
+
+            if self.username is not None and self.password is not None:
+                start = time.perf_counter()
+                await client.login(self.username, self.password)
+
+                if timer is not None:
+                    timer.emit("auth", start)
+
+            yield client
+
+    def _throttle(self, recipients: int) -> None:
+        """Wait for the message and recipient rate limits before sending a
+        message to a batch of recipients.
+        """
+        if self.message_rate is not None:
+            self.message_rate.acquire()
+
+        if self.recipient_rate is not None:
+            self.recipient_rate.acquire(recipients)
+
+    async def _throttle_async(self, recipients: int) -> None:
+        """Async version of :meth:`_throttle`."""
+        if self.message_rate is not None:
+            await self.message_rate.acquire_async()
+
+        if self.recipient_rate is not None:
+            await self.recipient_rate.acquire_async(recipients)
+
+    def _report(self, client: SMTP | AsyncSMTP, failed: bool) -> bool:
+        """Called after each transaction with whether it failed temporarily,
+        either with a ``4xx`` reply or because the connection failed. Returns
+        whether the client should be closed rather than used for the next
+        transaction. Does nothing by default, subclasses can override this to
+        track the health of the server.
+        """
+        return False
+
+    def _timer(self) -> _Timer | None:
+        """Create a timer for a new connection if there are any
+        :attr:`listeners`.
+        """
+        if not self.listeners:
+            return None
+
+        return _Timer(self.listeners, next(self._connection_ids))
+
+    def _prepare(self, message: Message | _EmailMessage) -> _Envelope:
+        """Serialize the message to the bytes sent with ``DATA``, as
+        :meth:`smtplib.SMTP.send_message` does, and get its SMTP envelope.
+
+        A :class:`.Message` is written directly with :meth:`.Message.write_to`
+        rather than building MIME first. The data is written to a spooled
+        temporary file, so large messages are not held in memory.
+        """
+        data = SpooledTemporaryFile(max_size=_SPOOL_SIZE)
+
+        try:
+            if isinstance(message, Message):
+                envelope = self._prepare_message(message, data)
+            else:
+                envelope = self._prepare_mime(message, data)
+        except BaseException:
+            data.close()
+            raise
+
+        data.seek(0)
+        return envelope
+
+    def _prepare_message(self, message: Message, data: t.IO[bytes]) -> _Envelope:
+        if message.from_addr is None:
+            # Set the From header in the message to the default. If it's not
+            # set some clients don't show the SMTP MAIL address, and may mark
+            # it as spam. This is only done to Mesage, MIME is assumed to be
+            # deliberate.
+            message.from_addr = self.default_from
+
+        from_addr = message.from_addr.addr_spec if message.from_addr else ""
+        recipients = [a.addr_spec for a in (*message.to, *message.cc, *message.bcc)]
+        international = not all(a.isascii() for a in (from_addr, *recipients))
+        # Bcc recipients get the message, but shouldn't see each other.
+        message.write_to(data, linesep="\r\n", include_bcc=False, utf8=international)
+        return _Envelope(from_addr, recipients, data, data.tell(), international)
+
+    def _prepare_mime(self, message: _EmailMessage, data: t.IO[bytes]) -> _Envelope:
+        from_header = message["sender"] or message["from"]
+
+        if from_header:
+            from_addr = from_header.addresses[0].addr_spec
+        else:
+            from_addr = self.default_from or ""
+
         recipient_fields = (message["to"], message["cc"], message["bcc"])
-        recipients = (
+        recipients = [
             a.addr_spec for f in recipient_fields if f is not None for a in f.addresses
-        )
+        ]
+        international = not all(a.isascii() for a in (from_addr, *recipients))
+        policy = message.policy
+
+        if international:
+            policy = policy.clone(utf8=True)  # type: ignore[call-arg]
+
+        # Bcc recipients get the message, but shouldn't see each other.
+        message = copy.copy(message)
+        del message["bcc"]
+        del message["resent-bcc"]
+        BytesGenerator(data, policy=policy).flatten(message, linesep="\r\n")
+        return _Envelope(from_addr, recipients, data, data.tell(), international)
+
+    def _batches(self, recipients: list[str]) -> cabc.Iterator[list[str]]:
+        """Split recipients into batches of :attr:`recipients_per_message`, or
+        a single batch if that is not set. With :attr:`group_by_domain`, the
+        recipients are ordered by domain first.
+        """
+        if self.group_by_domain:
+            recipients = _group_by_domain(recipients)
+
+        if not self.recipients_per_message:
+            yield recipients
+            return
+
+        for i in range(0, len(recipients), self.recipients_per_message):
+            yield recipients[i : i + self.recipients_per_message]
+
+    def _route_batches(
+        self, recipients: list[str]
+    ) -> cabc.Iterator[tuple[_Route, list[str]]]:
+        """Split recipients into batches as :meth:`_batches` does, along with
+        the host to send each batch to. Without a :attr:`resolver`, every batch
+        is sent to :attr:`host`, which is ``None``. Otherwise, recipients are
+        grouped by the host their domain resolves to, then each group is split.
+        """
+        if self.resolver is None:
+            for batch in self._batches(recipients):
+                yield None, batch
+
+            return
+
+        routes: dict[str, _Route] = {}
+        groups: dict[_Route, list[str]] = {}
+
+        for addr in recipients:
+            domain = _domain(addr)
+
+            if domain not in routes:
+                routes[domain] = self._resolve(domain)
+
+            groups.setdefault(routes[domain], []).append(addr)
+
+        for route, group in groups.items():
+            for batch in self._batches(group):
+                yield route, batch
+
+    def _resolve(self, domain: str) -> _Route:
+        assert self.resolver is not None
+        result = self.resolver(domain)
+
+        if result is None:
+            return None
+
+        host, port = (result, None) if isinstance(result, str) else result
+
+        if host == self.host and port == self.port:
+            return None
+
+        return host, port
+
+    def _route_handler(self, route: _Route) -> SMTPEmailHandler:
+        """Get the handler that connects to a host returned by the
+        :attr:`resolver`. It's a copy of this handler with a different host and
+        its own pool. ``None`` is this handler.
+
+        Up to :data:`_MAX_ROUTES` handlers are kept. After that, the least
+        recently used handler is removed and its pool is closed.
+        """
+        if route is None:
+            return self
+
+        evicted: SMTPEmailHandler | None = None
+
+        with self._routes_lock:
+            # Move the handler to the end to keep the dict in order of use.
+            handler = self._routes.pop(route, None)
+
+            if handler is None:
+                handler = self._copy_to(*route)
+
+                if len(self._routes) >= _MAX_ROUTES:
+                    evicted = self._routes.pop(next(iter(self._routes)))
+
+            self._routes[route] = handler
+
+        if evicted is not None:
+            evicted.close()
+
+        return handler
+
+    def _copy_to(self, host: str, port: int | None) -> SMTPEmailHandler:
+        handler = copy.copy(self)
+        handler.host = host
+        handler.port = port
+        handler.resolver = None
+        handler._routes = {}
+        handler._routes_lock = threading.Lock()
+
+        if self.pool is not None:
+            handler.pool = SMTPConnectionPool(
+                handler.open,
+                size=self.pool.size,
+                idle_timeout=self.pool.idle_timeout,
+                max_messages=self.pool.max_messages,
+            )
+
+        return handler
+
+    def _transact(
+        self,
+        routes: _Routes,
+        route: _Route,
+        envelope: _Envelope,
+        batch: list[str],
+        position: int,
+        sent: set[_PooledConnection],
+        prepared: float | None = None,
+    ) -> dict[str, tuple[int, bytes]]:
+        """Send one transaction to a batch of recipients over the connection to
+        its host, and return the refused recipients. Used by both :meth:`send`
+        and :meth:`deliver`.
+
+        The result is passed to :meth:`_report`. The connection is closed if
+        the transaction failed other than with a reply from the server, if the
+        server closed it, or if ``_report`` returns true. Otherwise it's kept in
+        ``routes`` for the next transaction.
+
+        :param sent: The connections the message was already sent over. The
+            message is counted once for each connection, for the pool's
+            ``max_messages``, however many batches it's sent in.
+        :param prepared: How long the message took to prepare. It's emitted
+            once the connection is open, for the first batch of a message.
+        """
+        client: SMTP | None = None
+
+        try:
+            conn = routes.get(route, sent)
+            client = conn.client
+            timer = client.timer if isinstance(client, _TimedSMTP) else None
+
+            if timer is not None:
+                timer.message = position
+
+                if prepared is not None:
+                    timer.record("prepare", prepared, envelope.size)
+
+            client.ehlo_or_helo_if_needed()
+            _check_smtputf8(client, envelope)
+            self._throttle(len(batch))
+            refused = _sendmail(client, envelope, batch, timer)
+        except (SMTPException, OSError) as e:
+            if client is not None and (
+                self._report(client, _is_temporary(e))
+                or not _is_reply(e)
+                or client.sock is None
+            ):
+                routes.discard(route)
+
+            raise
+        except BaseException:
+            routes.discard(route)
+            raise
+
+        if conn not in sent:
+            sent.add(conn)
+            conn.messages += 1
+
+        # The server may have closed the connection with a 421 reply.
+        if self._report(client, _has_temporary(refused)) or client.sock is None:
+            routes.discard(route)
+
+        return refused
+
+    def _send_message(
+        self, routes: _Routes, position: int, message: Message | _EmailMessage
+    ) -> None:
+        """Send a message in one transaction for each batch of recipients,
+        raising the first error.
+        """
+        # The message is serialized once, then the same bytes are sent for each
+        # batch of recipients.
+        start = time.perf_counter()
+        envelope = self._prepare(message)
+        prepared: float | None = time.perf_counter() - start
+        sent: set[_PooledConnection] = set()
+
+        with envelope.data:
+            for route, batch in self._route_batches(envelope.recipients):
+                self._transact(routes, route, envelope, batch, position, sent, prepared)
+                prepared = None
+
+    def _send_queue(
+        self,
+        queue: deque[tuple[int, Message | _EmailMessage]],
+        connection: int,
+        failures: list[SendFailure] | None,
+    ) -> None:
+        """Send messages from the queue in order. Multiple workers may share a
+        queue, each taking the next message when ready.
 
-        # itertools.batched for Python < 3.12
-        while batch := tuple(islice(recipients, self.recipients_per_message)):
-            client.send_message(message, from_addr=from_addr, to_addrs=batch)
+        If ``failures`` is given, a failed message is recorded there and the
+        remaining messages are sent, over a new connection if needed.
+        Otherwise, the error is raised.
+        """
+        routes = _Routes(self)
+
+        try:
+            while (item := _pop(queue)) is not None:
+                try:
+                    self._send_message(routes, *item)
+                except (SMTPException, OSError) as e:
+                    if failures is None:
+                        raise
+
+                    failures.append(SendFailure(item[0], item[1], connection, e))
+        finally:
+            routes.release_all()
+
+    def _queues(
+        self, messages: list[Message | _EmailMessage]
+    ) -> list[deque[tuple[int, Message | _EmailMessage]]]:
+        """Split messages into a queue for each connection. Without
+        :attr:`preserve_order`, all connections share a single queue.
+        """
+        assert self.max_connections is not None
+        count = min(self.max_connections, len(messages))
+
+        if not self.preserve_order:
+            return [deque(enumerate(messages))] * count
+
+        queues: list[deque[tuple[int, Message | _EmailMessage]]] = [
+            deque() for _ in range(count)
+        ]
+
+        for item in enumerate(messages):
+            queues[hash(_recipients_key(item[1])) % count].append(item)
+
+        return queues
 
     def send(self, messages: list[Message | _EmailMessage]) -> None:
+        """Send one or more email messages.
+
+        Without :attr:`max_connections`, messages are sent in order over one
+        connection, and the first error is raised as is, such as
+        :exc:`smtplib.SMTPRecipientsRefused` or :exc:`OSError`. The remaining
+        messages are not sent.
+
+        If :attr:`max_connections` is set, messages are sent over multiple
+        connections in parallel. Every message is attempted, then if any
+        failed, :exc:`.SMTPSendError` is raised, listing each failure. This is
+        the same however many messages are sent.
+
+        :param messages: A list of messages to send.
+        """
         if not messages:
             return
 
-        with self.connect() as client:
-            for message in messages:
-                if isinstance(message, Message):
-                    if message.from_addr is None:
-                        # Set the From header in the message to the default. If it's
-                        # not set some clients don't show the SMTP MAIL address, and
-                        # may mark it as spam. This is only done to Mesage, MIME is
-                        # assumed to be deliberate.
-                        message.from_addr = self.default_from
-
-                    mime_message = message.to_mime()
-                else:
-                    mime_message = message
+        if not self.max_connections:
+            self._send_queue(deque(enumerate(messages)), 0, None)
+            return
 
-                from_addr = mime_message["sender"] or mime_message["from"]
+        failures: list[SendFailure] = []
+        queues = self._queues(messages)
 
-                if from_addr:
-                    from_addr = from_addr.addresses[0].addr_spec
-                else:
-                    from_addr = self.default_from
+        if len(queues) == 1:
+            # Send in this thread rather than starting a worker.
+            self._send_queue(queues[0], 0, failures)
+        else:
+            with ThreadPoolExecutor(len(queues)) as executor:
+                futures = [
+                    executor.submit(self._send_queue, queue, i, failures)
+                    for i, queue in enumerate(queues)
+                ]
 
-                if self.recipients_per_message:
-                    self._send_batched(client, mime_message, from_addr)
-                else:
-                    client.send_message(mime_message, from_addr=from_addr)
+            for future in futures:
+                future.result()
+
+        if failures:
+            raise SMTPSendError(failures)
+
+    async def _transact_async(
+        self,
+        routes: _AsyncRoutes,
+        route: _Route,
+        envelope: _Envelope,
+        batch: list[str],
+        position: int,
+        prepared: float | None = None,
+    ) -> dict[str, tuple[int, bytes]]:
+        """Async version of :meth:`_transact`."""
+        conn = routes[route]
+        client: AsyncSMTP | None = None
+
+        try:
+            client = await conn.get()
+
+            if conn.timer is not None:
+                conn.timer.message = position
+
+                if prepared is not None:
+                    conn.timer.record("prepare", prepared, envelope.size)
+
+            _check_smtputf8(client, envelope)
+            await self._throttle_async(len(batch))
+            start = time.perf_counter()
+            refused = await _sendmail_async(client, envelope, batch)
+        except (SMTPException, OSError) as e:
+            if client is not None and (
+                self._report(client, _is_temporary(e))
+                or not _is_reply(e)
+                or client.writer.is_closing()
+            ):
+                await conn.reset()
+
+            raise
+        except BaseException:
+            await conn.reset()
+            raise
+
+        if conn.timer is not None:
+            conn.timer.emit("data", start, envelope.size)
+
+        if self._report(client, _has_temporary(refused)) or (
+            client.writer.is_closing()
+        ):
+            await conn.reset()
+
+        return refused
+
+    async def _send_message_async(
+        self, routes: _AsyncRoutes, position: int, message: Message | _EmailMessage
+    ) -> None:
+        """Async version of :meth:`_send_message`."""
+        start = time.perf_counter()
+        envelope = self._prepare(message)
+        prepared: float | None = time.perf_counter() - start
+
+        with envelope.data:
+            for route, batch in self._route_batches(envelope.recipients):
+                await self._transact_async(
+                    routes, route, envelope, batch, position, prepared
+                )
+                prepared = None
+
+    async def _send_queue_async(
+        self,
+        queue: deque[tuple[int, Message | _EmailMessage]],
+        connection: int,
+        failures: list[SendFailure] | None,
+    ) -> None:
+        """Async version of :meth:`_send_queue`."""
+        async with _AsyncRoutes(self) as routes:
+            while (item := _pop(queue)) is not None:
+                try:
+                    await self._send_message_async(routes, *item)
+                except (SMTPException, OSError) as e:
+                    if failures is None:
+                        raise
+
+                    failures.append(SendFailure(item[0], item[1], connection, e))
+
+    async def send_async(self, messages: list[Message | _EmailMessage]) -> None:
+        """Send one or more email messages, as with :meth:`send`, but in an
+        ``async`` context. If :attr:`max_connections` is set, the connections
+        are all handled by the event loop rather than threads.
+
+        :param messages: A list of messages to send.
+        """
+        if not messages:
+            return
+
+        if not self.max_connections:
+            await self._send_queue_async(deque(enumerate(messages)), 0, None)
+            return
+
+        failures: list[SendFailure] = []
+        await asyncio.gather(
+            *(
+                self._send_queue_async(queue, i, failures)
+                for i, queue in enumerate(self._queues(messages))
+            )
+        )
+
+        if failures:
+            raise SMTPSendError(failures)
+
+    def deliver(self, messages: list[Message | _EmailMessage]) -> list[MessageResult]:
+        """Send one or more email messages, and return the result for each
+        message and recipient rather than raising an error.
+
+        Every message is attempted. Recipients that the server refuses with a
+        temporary ``4xx`` reply, or that weren't sent to because the connection
+        failed, are tried again up to :attr:`retries` times, reconnecting if
+        needed. Recipients that were accepted are not sent to again. There is
+        a delay before each retry, see ``retry_backoff``.
+
+        If the connection is lost after the message data was sent but before
+        the server replied, the recipients are tried again, so they may receive
+        the message twice. This can't be avoided with SMTP.
+
+        Uses :attr:`max_connections` and the :attr:`pool` in the same way as
+        :meth:`send`.
+
+        :param messages: A list of messages to send.
+        """
+        results: list[MessageResult] = [None] * len(messages)  # type: ignore[list-item]
+
+        if not messages:
+            return results
+
+        if not self.max_connections or len(messages) == 1:
+            self._deliver_queue(deque(enumerate(messages)), results)
+            return results
+
+        queues = self._queues(messages)
+
+        with ThreadPoolExecutor(len(queues)) as executor:
+            futures = [
+                executor.submit(self._deliver_queue, queue, results) for queue in queues
+            ]
+
+        for future in futures:
+            future.result()
+
+        return results
+
+    def _deliver_queue(
+        self,
+        queue: deque[tuple[int, Message | _EmailMessage]],
+        results: list[MessageResult],
+    ) -> None:
+        """Deliver messages from the queue in order, storing each result at the
+        message's position.
+        """
+        routes = _Routes(self)
+
+        try:
+            while (item := _pop(queue)) is not None:
+                results[item[0]] = self._deliver_message(routes, *item)
+        finally:
+            routes.release_all()
+
+    def _deliver_message(
+        self,
+        routes: _Routes,
+        position: int,
+        message: Message | _EmailMessage,
+    ) -> MessageResult:
+        """Send one message with :meth:`_transact`, collecting the reply for
+        each recipient rather than raising, and retrying recipients that failed
+        temporarily.
+        """
+        start = time.perf_counter()
+
+        try:
+            envelope = self._prepare(message)
+        except Exception as e:
+            return MessageResult(position, message, [], e)
+
+        prepared: float | None = time.perf_counter() - start
+        tracker = _RecipientTracker(envelope.recipients)
+        sent: set[_PooledConnection] = set()
+
+        with envelope.data:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    time.sleep(self._retry_delay(attempt))
+
+                for route, batch in self._resolved_batches(tracker):
+                    try:
+                        refused = self._transact(
+                            routes, route, envelope, batch, position, sent, prepared
+                        )
+                    except SMTPRecipientsRefused as e:
+                        tracker.update(_replies(batch, e))
+                    except (SMTPException, OSError) as e:
+                        tracker.fail(batch, e)
+                    else:
+                        tracker.update(_accepted(batch, refused))
+
+                    prepared = None
+
+                tracker.attempts += 1
+
+                if not tracker.pending:
+                    break
+
+        return tracker.result(position, message)
+
+    def _resolved_batches(
+        self, tracker: _RecipientTracker
+    ) -> list[tuple[_Route, list[str]]]:
+        """Get the batches for the pending recipients. If the :attr:`resolver`
+        fails, the recipients fail temporarily and there are no batches.
+        """
+        try:
+            return list(self._route_batches(tracker.pending))
+        except Exception as e:
+            tracker.fail(tracker.pending, e)
+            return []
+
+    def _retry_delay(self, attempt: int) -> float:
+        """The delay before a retry, starting at 1 for the first retry."""
+        delay = min(self.retry_max_delay, self.retry_backoff * 2.0 ** (attempt - 1))
+
+        if self.retry_jitter:
+            delay = random.uniform(0, delay)
+
+        return delay
+
+    async def deliver_async(
+        self, messages: list[Message | _EmailMessage]
+    ) -> list[MessageResult]:
+        """Send one or more email messages and return the result for each, as
+        with :meth:`deliver`, but in an ``async`` context. If
+        :attr:`max_connections` is set, the connections are all handled by the
+        event loop rather than threads.
+
+        :param messages: A list of messages to send.
+        """
+        results: list[MessageResult] = [None] * len(messages)  # type: ignore[list-item]
+
+        if not messages:
+            return results
+
+        if not self.max_connections or len(messages) == 1:
+            await self._deliver_queue_async(deque(enumerate(messages)), results)
+            return results
+
+        await asyncio.gather(
+            *(
+                self._deliver_queue_async(queue, results)
+                for queue in self._queues(messages)
+            )
+        )
+        return results
+
+    async def _deliver_queue_async(
+        self,
+        queue: deque[tuple[int, Message | _EmailMessage]],
+        results: list[MessageResult],
+    ) -> None:
+        """Async version of :meth:`_deliver_queue`."""
+        async with _AsyncRoutes(self) as routes:
+            while (item := _pop(queue)) is not None:
+                results[item[0]] = await self._deliver_message_async(routes, *item)
+
+    async def _deliver_message_async(
+        self,
+        routes: _AsyncRoutes,
+        position: int,
+        message: Message | _EmailMessage,
+    ) -> MessageResult:
+        """Async version of :meth:`_deliver_message`."""
+        start = time.perf_counter()
+
+        try:
+            envelope = self._prepare(message)
+        except Exception as e:
+            return MessageResult(position, message, [], e)
+
+        prepared: float | None = time.perf_counter() - start
+        tracker = _RecipientTracker(envelope.recipients)
+
+        with envelope.data:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    await asyncio.sleep(self._retry_delay(attempt))
+
+                for route, batch in self._resolved_batches(tracker):
+                    try:
+                        refused = await self._transact_async(
+                            routes, route, envelope, batch, position, prepared
+                        )
+                    except SMTPRecipientsRefused as e:
+                        tracker.update(_replies(batch, e))
+                    except (SMTPException, OSError) as e:
+                        tracker.fail(batch, e)
+                    else:
+                        tracker.update(_accepted(batch, refused))
+
+                    prepared = None
+
+                tracker.attempts += 1
+
+                if not tracker.pending:
+                    break
+
+        return tracker.result(position, message)
+
+
+DeliveryStatus: t.TypeAlias = t.Literal["accepted", "temporary", "permanent"]
+"""The result of sending to a recipient. ``temporary`` failures may succeed if
+tried again later, ``permanent`` failures will not.
+"""
+
+
+class RecipientResult(t.NamedTuple):
+    """The result of sending a message to one recipient, listed by
+    :attr:`MessageResult.recipients`.
+    """
+
+    address: str
+    """The recipient's address."""
+
+    status: DeliveryStatus
+    """Whether the server accepted the message for the recipient, or the
+    failure was temporary or permanent.
+    """
+
+    code: int | None
+    """The server's reply code for the last attempt, or ``None`` if the
+    connection failed.
+    """
+
+    reply: str
+    """The server's reply text for the last attempt, or the error message if
+    the connection failed.
+    """
+
+    attempts: int
+    """The number of times sending to the recipient was attempted."""
+
+
+class MessageResult(t.NamedTuple):
+    """The result of sending a message with
+    :meth:`.SMTPEmailHandler.deliver`.
+    """
+
+    position: int
+    """The position of the message in the list passed to ``deliver``."""
+
+    message: Message | _EmailMessage
+    """The message that was sent."""
+
+    recipients: list[RecipientResult]
+    """The result for each recipient."""
+
+    error: Exception | None
+    """The last error that wasn't a reply for specific recipients, such as a
+    connection error. If the message couldn't be serialized, this is set and
+    there are no recipients.
+    """
+
+    @property
+    def accepted(self) -> bool:
+        """Whether every recipient accepted the message."""
+        return bool(self.recipients) and not self.failed
+
+    @property
+    def failed(self) -> list[RecipientResult]:
+        """The recipients that failed, temporarily or permanently."""
+        return [r for r in self.recipients if r.status != "accepted"]
+
+
+class SendFailure(t.NamedTuple):
+    """A message that failed to send when using multiple connections. Listed
+    by :attr:`.SMTPSendError.failures`.
+    """
+
+    position: int
+    """The position of the message in the list passed to ``send``."""
+
+    message: Message | _EmailMessage
+    """The message that failed to send."""
+
+    connection: int
+    """The number of the connection the message was sent on, from ``0`` up to
+    :attr:`.SMTPEmailHandler.max_connections`.
+    """
+
+    error: Exception
+    """The error that occurred."""
+
+
+class SMTPSendError(SMTPException):
+    """Raised by :class:`SMTPEmailHandler` when sending over multiple
+    connections, after all messages were attempted, if any failed.
+
+    :param failures: Each message that failed to send.
+    """
+
+    def __init__(self, failures: list[SendFailure]) -> None:
+        super().__init__(f"{len(failures)} message(s) failed to send.")
+        self.failures = sorted(failures, key=lambda f: f.position)
+        """Each message that failed to send, in the order they were passed to
+        ``send``.
+        """
+
+
+SMTPPhase: t.TypeAlias = t.Literal[
+    "dns",
+    "connect",
+    "tls",
+    "ehlo",
+    "starttls",
+    "auth",
+    "prepare",
+    "envelope",
+    "data",
+]
+"""The phases of connecting and sending that are timed by
+:class:`SMTPEmailHandler`.
+"""
+
+
+class SMTPEvent(t.NamedTuple):
+    """The time taken by one phase of connecting or sending. Passed to each of
+    :attr:`.SMTPEmailHandler.listeners`.
+
+    The phases for each connection are:
+
+    -   ``dns``: Resolve the host's addresses.
+    -   ``connect``: Open the TCP connection and read the server greeting.
+    -   ``tls``: The TLS handshake, if ``use_tls`` is enabled.
+    -   ``ehlo``: Send ``EHLO`` and read the server's extensions.
+    -   ``starttls``: Upgrade the connection to TLS and send ``EHLO`` again, if
+        ``use_starttls`` is enabled.
+    -   ``auth``: Log in, if a username and password are configured.
+
+    The phases for each message are:
+
+    -   ``prepare``: Serialize the message. :attr:`size` is the size of the
+        message.
+    -   ``envelope``: Send ``MAIL``, each ``RCPT``, and ``DATA``, and read the
+        replies. Repeated for each batch of ``recipients_per_message``.
+    -   ``data``: Send the message data and read the reply. :attr:`size` is the
+        size of the message. Repeated for each batch.
+
+    :meth:`~.SMTPEmailHandler.send_async` reports fewer phases. ``connect``
+    includes resolving the host, the TLS handshake, and ``EHLO``, and ``data``
+    includes the ``envelope`` commands.
+    """
+
+    phase: SMTPPhase
+    """The phase that was timed."""
+
+    duration: float
+    """How long the phase took, in seconds."""
+
+    size: int
+    """The number of bytes of message data, or 0 if the phase doesn't send
+    message data.
+    """
+
+    connection: int
+    """A number that identifies the connection, unique for the handler. Events
+    from the same connection have the same number, including when it's reused
+    from the pool.
+    """
+
+    message: int | None
+    """The position of the message in the list passed to ``send``, or
+    ``None`` for connection phases.
+    """
+
+
+SMTPListener: t.TypeAlias = cabc.Callable[[SMTPEvent], None]
+"""A function that is called with each :class:`SMTPEvent`."""
+
+
+SMTPResolver: t.TypeAlias = cabc.Callable[[str], "str | tuple[str, int] | None"]
+"""The type of :attr:`.SMTPEmailHandler.resolver`, a function that takes a
+recipient domain and returns the host to deliver to, as ``host`` or
+``(host, port)``, or ``None`` to use the handler's host.
+"""
+
+_Route: t.TypeAlias = "tuple[str, int | None] | None"
+"""A host and port returned by the resolver, or ``None`` for the handler's
+host.
+"""
+
+
+class PhaseStats(t.NamedTuple):
+    """Totals for one phase, recorded by :class:`SMTPStats`."""
+
+    calls: int
+    """The number of times the phase was timed."""
+
+    total: float
+    """The total duration of the phase, in seconds."""
+
+    max: float
+    """The longest duration of the phase, in seconds."""
+
+    size: int
+    """The total number of bytes of message data."""
+
+    @property
+    def mean(self) -> float:
+        """The average duration of the phase, in seconds."""
+        return self.total / self.calls if self.calls else 0.0
+
+
+class SMTPStats:
+    """A listener that keeps totals for each phase of sending. Add it to
+    :attr:`.SMTPEmailHandler.listeners`. It's safe to use from multiple threads.
+
+    .. code-block:: python
+
+        stats = SMTPStats()
+        handler = SMTPEmailHandler(..., listeners=[stats])
+        handler.send(messages)
+        print(stats.phases["data"].mean)
+    """
+
+    def __init__(self) -> None:
+        self._phases: dict[SMTPPhase, PhaseStats] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: SMTPEvent) -> None:
+        with self._lock:
+            calls, total, longest, size = self._phases.get(event.phase, _NO_STATS)
+            self._phases[event.phase] = PhaseStats(
+                calls + 1,
+                total + event.duration,
+                max(longest, event.duration),
+                size + event.size,
+            )
+
+    @property
+    def phases(self) -> dict[SMTPPhase, PhaseStats]:
+        """A copy of the totals for each phase that has been timed."""
+        with self._lock:
+            return dict(self._phases)
+
+    def reset(self) -> None:
+        """Clear all totals."""
+        with self._lock:
+            self._phases.clear()
+
+
+_NO_STATS = PhaseStats(0, 0.0, 0.0, 0)
+
+
+def _bucket(value: float | TokenBucket | None, period: float) -> TokenBucket | None:
+    """Create a token bucket for a rate limit, or use the given bucket."""
+    if value is None or isinstance(value, TokenBucket):
+        return value
+
+    return TokenBucket(value, period)
+
+
+def _pop(
+    queue: deque[tuple[int, Message | _EmailMessage]],
+) -> tuple[int, Message | _EmailMessage] | None:
+    """Take the next item from a queue that may be shared between threads."""
+    try:
+        return queue.popleft()
+    except IndexError:
+        return None
+
+
+def _domain(addr: str) -> str:
+    """Get the normalized domain of an address, IDNA encoded if needed."""
+    domain = addr.rpartition("@")[2]
+
+    try:
+        # Looked up when called, set_address_cache_size replaces the cache.
+        domain = address._idna_if_needed(domain)
+    except UnicodeError:
+        pass
+
+    return domain.lower()
+
+
+def _group_by_domain(recipients: list[str]) -> list[str]:
+    """Order recipients so that each domain's recipients are together. Domains
+    are in the order they first appear.
+    """
+    groups: dict[str, list[str]] = {}
+
+    for addr in recipients:
+        groups.setdefault(_domain(addr), []).append(addr)
+
+    return [addr for group in groups.values() for addr in group]
+
+
+def _recipients_key(message: Message | _EmailMessage) -> frozenset[str]:
+    """The set of recipients of a message, used to send messages with the same
+    recipients over the same connection.
+    """
+    if isinstance(message, Message):
+        addresses = [*message.to, *message.cc, *message.bcc]
+    else:
+        fields = (message["to"], message["cc"], message["bcc"])
+        addresses = [a for f in fields if f is not None for a in f.addresses]
+
+    return frozenset(a.addr_spec.lower() for a in addresses)
+
+
+class _Envelope(t.NamedTuple):
+    """A message serialized for sending, along with its SMTP envelope."""
+
+    from_addr: str
+    recipients: list[str]
+    data: t.IO[bytes]
+    size: int
+    international: bool
+
+    @property
+    def mail_options(self) -> tuple[str, ...]:
+        if self.international:
+            return ("SMTPUTF8", "BODY=8BITMIME")
+
+        return ()
+
+    def chunks(self) -> cabc.Iterator[bytes]:
+        """Read the data from the start in chunks. Each batch of recipients
+        reads the same data again.
+        """
+        self.data.seek(0)
+
+        while chunk := self.data.read(_CHUNK_SIZE):
+            yield chunk
+
+
+def _status(code: int) -> DeliveryStatus:
+    if code < 400:
+        return "accepted"
+
+    if code < 500:
+        return "temporary"
+
+    return "permanent"
+
+
+class _RecipientTracker:
+    """Records the latest result for each recipient of a message across
+    attempts, and which recipients still need to be tried.
+    """
+
+    def __init__(self, recipients: list[str]) -> None:
+        # Duplicate addresses are only sent to once.
+        self.recipients = list(dict.fromkeys(recipients))
+        self.pending = self.recipients
+        self.attempts = 0
+        self.error: Exception | None = None
+        self._results: dict[str, tuple[DeliveryStatus, int | None, str, int]] = {}
+
+    def update(self, replies: dict[str, tuple[int, bytes]]) -> None:
+        for addr, (code, message) in replies.items():
+            self._set(addr, _status(code), code, message.decode("utf-8", "replace"))
+
+        self._update_pending()
+
+    def fail(self, addrs: list[str], error: Exception) -> None:
+        """Record an error that applies to every address in the batch. A
+        reply error uses its code, anything else is temporary.
+        """
+        self.error = error
+
+        if isinstance(error, SMTPNotSupportedError):
+            status: DeliveryStatus = "permanent"
+            code = None
+        elif isinstance(error, SMTPResponseException):
+            status = _status(error.smtp_code)
+            code = error.smtp_code
+        else:
+            status = "temporary"
+            code = None
+
+        for addr in addrs:
+            self._set(addr, status, code, str(error))
+
+        self._update_pending()
+
+    def _set(
+        self, addr: str, status: DeliveryStatus, code: int | None, reply: str
+    ) -> None:
+        self._results[addr] = (status, code, reply, self.attempts + 1)
+
+    def _update_pending(self) -> None:
+        self.pending = [
+            a
+            for a in self.recipients
+            if a not in self._results or self._results[a][0] == "temporary"
+        ]
+
+    def result(self, position: int, message: Message | _EmailMessage) -> MessageResult:
+        recipients = [
+            RecipientResult(addr, *self._results[addr]) for addr in self.recipients
+        ]
+        return MessageResult(position, message, recipients, self.error)
+
+
+def _is_temporary(error: Exception) -> bool:
+    """Whether an error from a transaction is a temporary failure, a ``4xx``
+    reply or a failed connection.
+    """
+    if isinstance(error, SMTPRecipientsRefused):
+        return _has_temporary(error.recipients)
+
+    if isinstance(error, SMTPResponseException):
+        return _status(error.smtp_code) == "temporary"
+
+    return isinstance(error, SMTPServerDisconnected) or not isinstance(
+        error, SMTPException
+    )
+
+
+def _has_temporary(replies: dict[str, tuple[int, bytes]]) -> bool:
+    """Whether any recipient reply is a temporary failure."""
+    return any(_status(code) == "temporary" for code, _ in replies.values())
+
+
+def _is_reply(error: Exception) -> bool:
+    """Whether an error from a transaction is a reply from the server, after
+    which the transaction was reset and the connection can be used again,
+    unless the server closed it.
+    """
+    return isinstance(
+        error, (SMTPResponseException, SMTPRecipientsRefused, SMTPNotSupportedError)
+    )
+
+
+def _accepted(
+    to_addrs: list[str], refused: dict[str, tuple[int, bytes]]
+) -> dict[str, tuple[int, bytes]]:
+    """Get the reply for every recipient from a transaction that succeeded,
+    where only the refused recipients have a reply.
+    """
+    return {addr: refused.get(addr, (250, b"")) for addr in to_addrs}
+
+
+async def _sendmail_async(
+    client: AsyncSMTP, envelope: _Envelope, to_addrs: list[str]
+) -> dict[str, tuple[int, bytes]]:
+    """Async version of :func:`_sendmail`."""
+    return await client.sendmail(
+        envelope.from_addr,
+        to_addrs,
+        envelope.chunks(),
+        envelope.mail_options,
+        size=envelope.size,
+    )
+
+
+def _replies(
+    to_addrs: list[str], error: SMTPRecipientsRefused
+) -> dict[str, tuple[int, bytes]]:
+    """Get the reply for every recipient from an error where all recipients
+    were refused. If the server closed the connection, the recipients after
+    that weren't sent.
+    """
+    refused: dict[str, tuple[int, bytes]] = error.recipients
+    closed = (421, b"Not sent, the server closed the connection.")
+    return {addr: refused.get(addr, closed) for addr in to_addrs}
+
+
+def _check_smtputf8(client: SMTP | AsyncSMTP, envelope: _Envelope) -> None:
+    """Raise an error if the message needs ``SMTPUTF8`` but the server doesn't
+    support it, as :meth:`smtplib.SMTP.send_message` does.
+    """
+    if envelope.international and not client.has_extn("smtputf8"):
+        raise SMTPNotSupportedError(
+            "One or more source or delivery addresses require"
+            " internationalized email support, but the server"
+            " does not advertise the required SMTPUTF8 capability"
+        )
+
+
+def _sendmail(
+    client: SMTP,
+    envelope: _Envelope,
+    to_addrs: list[str],
+    timer: _Timer | None = None,
+) -> dict[str, tuple[int, bytes]]:
+    """Send the message to the given recipients, as
+    :meth:`smtplib.SMTP.sendmail` does, returning the refused recipients. The
+    data is read and written in chunks rather than all at once.
+
+    If the server supports ``PIPELINING``, ``MAIL``, every ``RCPT``, and
+    ``DATA`` are sent in one write, then all the replies are read, as described
+    by :rfc:`2920`.
+    """
+    options = list(envelope.mail_options)
+
+    if client.does_esmtp and client.has_extn("size"):
+        options.append(f"SIZE={envelope.size}")
+
+    start = time.perf_counter()
+
+    if client.has_extn("pipelining"):
+        refused = _send_commands_pipelined(
+            client, envelope.from_addr, to_addrs, options
+        )
+    else:
+        refused = _send_commands(client, envelope.from_addr, to_addrs, options)
+
+    if timer is not None:
+        timer.emit("envelope", start)
+        start = time.perf_counter()
+
+    for chunk in quote_data(envelope.chunks()):
+        client.send(chunk)
+
+    code, message = client.getreply()
+
+    if timer is not None:
+        timer.emit("data", start, envelope.size)
+
+    if code != 250:
+        _rset_quietly(client, code == 421)
+        raise SMTPDataError(code, message)
+
+    return refused
+
+
+def _send_commands(
+    client: SMTP, from_addr: str, to_addrs: list[str], options: list[str]
+) -> dict[str, tuple[int, bytes]]:
+    """Send ``MAIL``, each ``RCPT``, and ``DATA``, waiting for each reply."""
+    code, message = client.mail(from_addr, options)
+
+    if code != 250:
+        _rset_quietly(client, code == 421)
+        raise SMTPSenderRefused(code, message, from_addr)
+
+    refused: dict[str, tuple[int, bytes]] = {}
+
+    for addr in to_addrs:
+        code, message = client.rcpt(addr)
+
+        if code not in {250, 251}:
+            refused[addr] = (code, message)
+
+        if code == 421:
+            client.close()
+            raise SMTPRecipientsRefused(refused)
+
+    if len(refused) == len(to_addrs):
+        _rset_quietly(client, False)
+        raise SMTPRecipientsRefused(refused)
+
+    code, message = client.docmd("data")
+
+    if code != 354:
+        _rset_quietly(client, code == 421)
+        raise SMTPDataError(code, message)
+
+    return refused
+
+
+def _send_commands_pipelined(
+    client: SMTP, from_addr: str, to_addrs: list[str], options: list[str]
+) -> dict[str, tuple[int, bytes]]:
+    """Send ``MAIL``, each ``RCPT``, and ``DATA`` in one write, then read all
+    the replies.
+    """
+    client.send(pipeline_commands(from_addr, to_addrs, options))
+    replies = [client.getreply() for _ in range(len(to_addrs) + 2)]
+
+    try:
+        return check_pipeline_replies(from_addr, to_addrs, replies)
+    except SMTPException:
+        if replies[-1][0] == 354:
+            # The server is waiting for data even though the transaction
+            # failed. Send an empty message to end the data section.
+            client.send(b".\r\n")
+            client.getreply()
+
+        _rset_quietly(client, any(code == 421 for code, _ in replies))
+        raise
+
+
+def _rset_quietly(client: SMTP, closing: bool) -> None:
+    """Reset the transaction after an error, or close the connection if the
+    server said it is closing.
+    """
+    if closing:
+        client.close()
+        return
+
+    try:
+        client.rset()
+    except SMTPServerDisconnected:
+        pass
+
+
+class _Timer:
+    """Calls the handler's listeners with events for one connection."""
+
+    __slots__ = ("listeners", "connection", "message")
+
+    def __init__(self, listeners: list[SMTPListener], connection: int) -> None:
+        self.listeners = listeners
+        self.connection = connection
+        self.message: int | None = None
+        """The position of the message being sent, set for each message."""
+
+    def emit(self, phase: SMTPPhase, start: float, size: int = 0) -> None:
+        """Call each listener with an event for a phase that started at the
+        given :func:`time.perf_counter` value and ended now.
+        """
+        self.record(phase, time.perf_counter() - start, size)
+
+    def record(self, phase: SMTPPhase, duration: float, size: int = 0) -> None:
+        """Call each listener with an event for a phase that was timed
+        separately, such as preparing a message before it's sent.
+        """
+        event = SMTPEvent(phase, duration, size, self.connection, self.message)
+
+        for listener in self.listeners:
+            listener(event)
+
+
+class _TimedSMTP(SMTP):
+    """An :class:`smtplib.SMTP` client that times resolving the host and
+    opening the connection separately. Only used if there are listeners.
+    """
+
+    def __init__(self, *args: t.Any, timer: _Timer, **kwargs: t.Any) -> None:
+        # Set before calling init, which connects.
+        self.timer = timer
+        super().__init__(*args, **kwargs)
+
+    def _get_socket(self, host: str, port: int, timeout: float | None) -> socket.socket:
+        if timeout is not None and not timeout:
+            raise ValueError("Non-blocking socket (timeout=0) is not supported")
+
+        start = time.perf_counter()
+        infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        self.timer.emit("dns", start)
+        start = time.perf_counter()
+        error: OSError | None = None
+
+        # Connect to each resolved address until one succeeds, as
+        # socket.create_connection does, without resolving the host again.
+        # The full address is used, keeping an IPv6 scope ID.
+        for family, type_, proto, _, sockaddr in infos:
+            sock: socket.socket | None = None
+
+            try:
+                sock = socket.socket(family, type_, proto)
+
+                if timeout is not None:
+                    sock.settimeout(timeout)
+
+                if self.source_address:
+                    sock.bind(self.source_address)
+
+                sock.connect(sockaddr)
+            except OSError as e:
+                if sock is not None:
+                    sock.close()
+
+                error = e
+                continue
+
+            self.timer.emit("connect", start)
+            return sock
+
+        assert error is not None
+        raise error
+
+
+class _TimedSMTP_SSL(_TimedSMTP, SMTP_SSL):
+    """An :class:`smtplib.SMTP_SSL` client that times the TLS handshake
+    separately as well.
+    """
+
+    def _get_socket(self, host: str, port: int, timeout: float | None) -> socket.socket:
+        sock = super()._get_socket(host, port, timeout)
+        start = time.perf_counter()
+        sock = self.context.wrap_socket(sock, server_hostname=host)
+        self.timer.emit("tls", start)
+        return sock
+
+
+class _AsyncConnection:
+    """An :class:`.AsyncSMTP` client used to deliver a queue of messages, which
+    is reopened after it's reset because of an error.
+    """
+
+    def __init__(self, handler: SMTPEmailHandler) -> None:
+        self.handler = handler
+        self.timer: _Timer | None = None
+        self._stack: AsyncExitStack | None = None
+        self._client: AsyncSMTP | None = None
+
+    async def get(self) -> AsyncSMTP:
+        if self._client is None:
+            self.timer = self.handler._timer()
+            stack = AsyncExitStack()
+            self._client = await stack.enter_async_context(
+                self.handler._connect_async(self.timer)
+            )
+            self._stack = stack
+
+        return self._client
+
+    async def reset(self) -> None:
+        """Close the client without waiting for ``QUIT``."""
+        if self._client is not None:
+            self._client.close()
+
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        stack, self._stack, self._client = self._stack, None, None
+
+        if stack is not None:
+            await stack.aclose()
+
+    async def __aenter__(self) -> t.Self:
+        return self
+
+    async def __aexit__(self, *args: t.Any) -> None:
+        await self.aclose()
+
+
+class _Routes:
+    """The connections used to send a queue of messages, one for each host
+    returned by the handler's resolver, opened when first needed. Connections
+    are taken from the host's pool, or opened with
+    :meth:`~.SMTPEmailHandler.connect` if there is no pool.
+
+    Connections from other pools are returned before waiting for a pool, so
+    that workers holding connections to different hosts can't block each
+    other.
+    """
+
+    def __init__(self, handler: SMTPEmailHandler) -> None:
+        self.handler = handler
+        self._conns: dict[_Route, tuple[SMTPEmailHandler, _PooledConnection]] = {}
+        self._stacks: dict[_Route, ExitStack] = {}
+
+    def get(
+        self, route: _Route, sent: cabc.Container[_PooledConnection] = ()
+    ) -> _PooledConnection:
+        """Get the connection to a host. A pooled connection that has sent its
+        limit of messages is replaced, unless it's in ``sent`` because it's
+        sending the current message.
+        """
+        entry = self._conns.get(route)
+
+        if entry is not None:
+            handler, conn = entry
+
+            if handler.pool is None or conn in sent or not handler.pool.is_spent(conn):
+                return conn
+
+            self.release(route)
+
+        handler = self.handler._route_handler(route)
+
+        if handler.pool is not None:
+            for other in [r for r in self._conns if r not in self._stacks]:
+                self.release(other)
+
+            conn = handler.pool.acquire()
+        else:
+            stack = ExitStack()
+            conn = _PooledConnection(stack.enter_context(handler.connect()))
+            self._stacks[route] = stack
+
+        self._conns[route] = (handler, conn)
+        return conn
+
+    def release(self, route: _Route) -> None:
+        """Return the connection to a host to its pool, or send ``QUIT`` and
+        close it.
+        """
+        entry = self._conns.pop(route, None)
+        stack = self._stacks.pop(route, None)
+
+        if stack is not None:
+            try:
+                stack.close()
+            except (SMTPException, OSError):
+                pass
+        elif entry is not None:
+            handler, conn = entry
+            assert handler.pool is not None
+            handler.pool.release(conn)
+
+    def discard(self, route: _Route) -> None:
+        """Close the connection to a host after an error."""
+        entry = self._conns.pop(route, None)
+        stack = self._stacks.pop(route, None)
+
+        if entry is None:
+            return
+
+        handler, conn = entry
+
+        if stack is not None:
+            # Close first so that exiting doesn't wait for QUIT.
+            conn.client.close()
+            stack.close()
+        else:
+            assert handler.pool is not None
+            handler.pool.discard(conn)
+
+    def release_all(self) -> None:
+        for route in list(self._conns):
+            self.release(route)
+
+
+class _AsyncRoutes:
+    """Async version of :class:`_Routes`."""
+
+    def __init__(self, handler: SMTPEmailHandler) -> None:
+        self.handler = handler
+        self._conns: dict[_Route, _AsyncConnection] = {}
+
+    def __getitem__(self, route: _Route) -> _AsyncConnection:
+        conn = self._conns.get(route)
+
+        if conn is None:
+            conn = self._conns[route] = _AsyncConnection(
+                self.handler._route_handler(route)
+            )
+
+        return conn
+
+    async def aclose(self) -> None:
+        conns, self._conns = self._conns, {}
+
+        for conn in conns.values():
+            await conn.aclose()
+
+    async def __aenter__(self) -> t.Self:
+        return self
+
+    async def __aexit__(self, *args: t.Any) -> None:
+        await self.aclose()
+
+
+class _PooledConnection:
+    """An open client managed by :class:`SMTPConnectionPool`, along with the
+    information used to decide whether it can be reused.
+    """
+
+    __slots__ = ("client", "last_used", "messages")
+
+    def __init__(self, client: SMTP) -> None:
+        self.client = client
+        self.last_used = time.monotonic()
+        self.messages = 0
+
+
+class SMTPConnectionPool:
+    """A thread-safe pool of open, logged-in :class:`smtplib.SMTP` clients. Used
+    by :class:`SMTPEmailHandler` when ``pool_size`` is given.
+
+    When a connection is requested, the most recently used idle connection is
+    checked with ``RSET`` before it's reused. Connections that fail the check,
+    have been idle too long, or have sent too many messages are closed. If all
+    connections are in use, waits for one to be returned.
+
+    :param connect: Called to open a new, logged-in client.
+    :param size: The maximum number of connections open at once.
+    :param idle_timeout: Close a connection rather than reuse it if it has been
+        idle for longer than this many seconds.
+    :param max_messages: Close a connection after it has sent this many
+        messages.
+    """
+
+    def __init__(
+        self,
+        connect: cabc.Callable[[], SMTP],
+        *,
+        size: int,
+        idle_timeout: float | None = None,
+        max_messages: int | None = None,
+    ) -> None:
+        if size < 1:
+            raise ValueError("Pool size must be at least 1.")
+
+        self._connect = connect
+        self.size = size
+        """The maximum number of connections open at once."""
+
+        self.idle_timeout = idle_timeout
+        """Close a connection rather than reuse it if it has been idle for
+        longer than this many seconds.
+        """
+
+        self.max_messages = max_messages
+        """Close a connection after it has sent this many messages."""
+
+        self._idle: deque[_PooledConnection] = deque()
+        self._open = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def acquire(self) -> _PooledConnection:
+        """Get an idle connection that passes the health check, or open a new
+        one. Blocks if :attr:`size` connections are already in use. The
+        connection must be passed to :meth:`release` or :meth:`discard` after.
+        """
+        while True:
+            conn: _PooledConnection | None = None
+
+            with self._cond:
+                while not self._idle and self._open >= self.size:
+                    self._cond.wait()
+
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._open += 1
+
+            if conn is None:
+                try:
+                    return _PooledConnection(self._connect())
+                except BaseException:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+
+                    raise
+
+            if self._is_healthy(conn):
+                return conn
+
+            self.discard(conn)
+
+    def release(self, conn: _PooledConnection) -> None:
+        """Return a connection to the pool after it was used successfully. It
+        is closed instead if it has sent :attr:`max_messages`, or if the pool
+        was closed.
+        """
+        if self.is_spent(conn):
+            self.discard(conn)
+            return
+
+        conn.last_used = time.monotonic()
+
+        with self._cond:
+            if not self._closed:
+                self._idle.append(conn)
+                self._cond.notify()
+                return
+
+        self.discard(conn)
+
+    def discard(self, conn: _PooledConnection) -> None:
+        """Close a connection rather than returning it to the pool. Used if an
+        error occurred while using it.
+        """
+        _close_client(conn.client)
+
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    def is_spent(self, conn: _PooledConnection) -> bool:
+        """Whether the connection has sent :attr:`max_messages`."""
+        return self.max_messages is not None and conn.messages >= self.max_messages
+
+    def close(self) -> None:
+        """Close all idle connections. Connections that are in use are closed
+        when they are released, rather than returned to the pool.
+        """
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+
+        for conn in idle:
+            _close_client(conn.client)
+
+    def _is_healthy(self, conn: _PooledConnection) -> bool:
+        if (
+            self.idle_timeout is not None
+            and time.monotonic() - conn.last_used > self.idle_timeout
+        ):
+            return False
+
+        try:
+            code, _ = conn.client.rset()
+        except (SMTPException, OSError):
+            return False
+
+        return code == 250
+
+
+def _close_client(client: SMTP) -> None:
+    """Send ``QUIT`` and close the connection, ignoring errors if the server
+    already closed it.
+    """
+    try:
+        client.quit()
+    except (SMTPException, OSError):
+        client.close()
@@ -0,0 +1,472 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import typing as t
+from email import message_from_binary_file
+from email import policy
+from email.message import EmailMessage as _EmailMessage
+from pathlib import Path
+from smtplib import SMTPException
+
+from ..message import Message
+from .base import EmailHandler
+from .base import get_handler_class
+from .file import _fsync_dir
+from .file import _unique_name
+from .file import _write_file
+from .smtp import _is_temporary as _is_temporary_reply
+from .smtp import SMTPSendError
+
+logger = logging.getLogger(__name__)
+
+
+class SpoolEmailHandler(EmailHandler):
+    """Email handler that writes messages to a directory on disk and returns
+    immediately. Background worker threads deliver the spooled messages using
+    another handler. This keeps the time to send out of the request, and keeps
+    messages if the process stops before they're delivered.
+
+    The directory is laid out like a maildir. Each message is written to a file
+    in ``tmp``, then renamed to ``new`` once it is completely written. A worker
+    claims a message by renaming it to ``cur``, and removes it after it's
+    delivered.
+
+    If a message fails temporarily, because the connection failed or the
+    server replied with a ``4xx`` code, it's moved back to ``new`` and tried
+    again after a delay that doubles each time. Messages that fail permanently,
+    or still fail after ``retries``, are moved to ``failed``, and can be moved
+    back with :meth:`requeue_failed`.
+
+    Every message is spooled as MIME and passed to the inner handler as an
+    :class:`~email.message.EmailMessage`, since a :class:`.Message` can't be
+    rebuilt exactly from its MIME. A handler's defaults that only apply to a
+    :class:`.Message` are not used, so set ``from_addr`` before spooling rather
+    than relying on an SMTP handler's ``default_from`` for the ``From`` header.
+
+    When the handler starts, messages left in ``cur`` by a previous process
+    that stopped while delivering them are moved back to ``new``, so they will
+    be delivered again. Only one process should use a spool directory at a
+    time.
+
+    :param directory: The spool directory. Created if it doesn't exist.
+    :param handler: The handler to deliver messages with. May be a handler
+        instance, or a name or class passed to :func:`.get_handler_class`.
+    :param handler_config: Config to create the handler with if ``handler`` is
+        a name or class.
+    :param workers: The number of worker threads delivering messages.
+    :param batch_size: The maximum number of messages a worker claims at once.
+        Messages are passed to the handler one at a time, so that a failure
+        doesn't send the messages before it again. Give an SMTP handler a
+        ``pool_size`` to reuse its connection between messages.
+    :param retries: The number of times to try a message again after a
+        temporary failure before moving it to ``failed``.
+    :param retry_backoff: The delay in seconds before the first retry, doubled
+        for each retry after that.
+    :param retry_max_delay: The maximum delay in seconds between retries.
+    :param fsync: Flush each message and the directory to disk before
+        :meth:`send` returns. The directory is flushed once for all the messages
+        passed to ``send``. Disable this to trade durability for speed.
+    :param poll_interval: How often in seconds idle workers check for messages.
+        Workers are woken immediately when this handler sends, so this only
+        affects messages added to the directory by other means.
+    :param start: Start the workers immediately. Otherwise, call
+        :meth:`start`.
+    """
+
+    def __init__(
+        self,
+        directory: str | os.PathLike[str],
+        handler: EmailHandler | str | type[EmailHandler],
+        *,
+        handler_config: dict[str, t.Any] | None = None,
+        workers: int = 1,
+        batch_size: int = 100,
+        retries: int = 10,
+        retry_backoff: float = 1.0,
+        retry_max_delay: float = 300.0,
+        fsync: bool = True,
+        poll_interval: float = 1.0,
+        start: bool = True,
+    ) -> None:
+        if not isinstance(handler, EmailHandler):
+            handler = get_handler_class(handler).from_config(handler_config or {})
+
+        self.directory: Path = Path(directory)
+        """The spool directory."""
+
+        self.handler: EmailHandler = handler
+        """The handler to deliver messages with."""
+
+        self.workers = workers
+        """The number of worker threads delivering messages."""
+
+        self.batch_size = batch_size
+        """The maximum number of messages a worker claims at once."""
+
+        self.retries = retries
+        """The number of times to try a message again after a temporary
+        failure.
+        """
+
+        self.retry_backoff = retry_backoff
+        """The delay in seconds before the first retry."""
+
+        self.retry_max_delay = retry_max_delay
+        """The maximum delay in seconds between retries."""
+
+        self.fsync = fsync
+        """Flush messages to disk before :meth:`send` returns."""
+
+        self.poll_interval = poll_interval
+        """How often in seconds idle workers check for messages."""
+
+        for name in ("tmp", "new", "cur", "failed"):
+            (self.directory / name).mkdir(parents=True, exist_ok=True)
+
+        self._threads: list[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._wake = threading.Event()
+        self._cond = threading.Condition()
+        self._delivered = 0
+        self._errors = 0
+        # The number of failed attempts and the monotonic time to try again for
+        # messages waiting to be retried, by file name.
+        self._retrying: dict[str, tuple[int, float]] = {}
+
+        if start:
+            self.start()
+
+    @classmethod
+    def from_config(cls, config: dict[str, t.Any]) -> t.Self:
+        """Create a handler from a config dict. Config keys match the arguments
+        to :class:`.SpoolEmailHandler`. ``directory`` and ``handler`` are
+        required.
+        """
+        return cls(
+            config["directory"],
+            config["handler"],
+            handler_config=config.get("handler_config"),
+            workers=config.get("workers", 1),
+            batch_size=config.get("batch_size", 100),
+            retries=config.get("retries", 10),
+            retry_backoff=config.get("retry_backoff", 1.0),
+            retry_max_delay=config.get("retry_max_delay", 300.0),
+            fsync=config.get("fsync", True),
+            poll_interval=config.get("poll_interval", 1.0),
+            start=config.get("start", True),
+        )
+
+    def send(self, messages: list[Message | _EmailMessage]) -> None:
+        """Write messages to the spool, to be delivered by the workers.
+
+        Each message is written to ``tmp``, then all the messages are moved to
+        ``new`` together. If an error occurs while writing, none of the
+        messages are spooled.
+
+        :param messages: A list of messages to send.
+        """
+        if not messages:
+            return
+
+        tmp = self.directory / "tmp"
+        written: list[Path] = []
+
+        try:
+            for message in messages:
+                written.append(self._write(tmp, message))
+        except BaseException:
+            for path in written:
+                path.unlink(missing_ok=True)
+
+            raise
+
+        new = self.directory / "new"
+
+        for path in written:
+            path.rename(new / path.name)
+
+        if self.fsync:
+            _fsync_dir(new)
+
+        self._wake.set()
+
+    def _write(self, directory: Path, message: Message | _EmailMessage) -> Path:
+        """Write one message to a new file in the directory."""
+        # Names sort in the order they were spooled.
+        path = directory / _unique_name(".eml")
+        _write_file(path, message, fsync=self.fsync)
+        return path
+
+    def start(self) -> None:
+        """Recover messages left from a previous process, then start the worker
+        threads. Does nothing if the workers are already running.
+        """
+        if self._threads:
+            return
+
+        self.recover()
+        self._stopping.clear()
+        self._threads = [
+            threading.Thread(target=self._work, name=f"email-spool-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+
+        for thread in self._threads:
+            thread.start()
+
+    def close(self, timeout: float | None = None) -> None:
+        """Stop the workers after they finish delivering their current batch.
+        Messages that have not been delivered stay in the spool, and are
+        delivered when the handler is started again. Closes the inner handler if
+        it has a ``close`` method.
+
+        :param timeout: How long to wait for each worker to stop.
+        """
+        self._stopping.set()
+        self._wake.set()
+
+        for thread in self._threads:
+            thread.join(timeout)
+
+        self._threads = []
+        close = getattr(self.handler, "close", None)
+
+        if close is not None:
+            close()
+
+    def recover(self) -> int:
+        """Move messages in ``cur`` back to ``new``, and remove incomplete
+        files from ``tmp``. These are left if a process stopped while writing
+        or delivering. Called by :meth:`start`, and should not be called while
+        workers are running. Returns the number of messages recovered.
+        """
+        for path in (self.directory / "tmp").iterdir():
+            path.unlink(missing_ok=True)
+
+        return _move_all(self.directory / "cur", self.directory / "new")
+
+    def requeue_failed(self) -> int:
+        """Move messages that failed to deliver back to ``new`` to try again.
+        Returns the number of messages moved.
+        """
+        count = _move_all(self.directory / "failed", self.directory / "new")
+        self._wake.set()
+        return count
+
+    def stats(self) -> SpoolStats:
+        """Get the current size of the spool, and counts of messages delivered
+        by this handler.
+        """
+        new = list((self.directory / "new").iterdir())
+        oldest: float | None = None
+
+        if new:
+            # Names start with the time the message was spooled.
+            first = min(p.name for p in new)
+
+            try:
+                oldest = max(time.time() - int(first.partition(".")[0]) / 1e9, 0.0)
+            except ValueError:
+                oldest = None
+
+        return SpoolStats(
+            pending=len(new),
+            in_flight=_count(self.directory / "cur"),
+            failed=_count(self.directory / "failed"),
+            delivered=self._delivered,
+            errors=self._errors,
+            oldest_age=oldest,
+        )
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Wait until there are no pending or in flight messages. Returns
+        ``False`` if the timeout passed first.
+
+        :param timeout: How long to wait in seconds. By default, waits forever.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._cond:
+            while True:
+                stats = self.stats()
+
+                if not stats.pending and not stats.in_flight:
+                    return True
+
+                remaining = self.poll_interval
+
+                if deadline is not None:
+                    remaining = min(remaining, deadline - time.monotonic())
+
+                    if remaining <= 0:
+                        return False
+
+                self._cond.wait(remaining)
+
+    def _work(self) -> None:
+        """Worker thread loop. Claim and deliver batches until stopped."""
+        while not self._stopping.is_set():
+            claimed = self._claim()
+
+            if not claimed:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+
+            self._deliver(claimed)
+
+            with self._cond:
+                self._cond.notify_all()
+
+    def _claim(self) -> list[Path]:
+        """Claim up to :attr:`batch_size` messages by moving them from ``new``
+        to ``cur``. A message that another worker claimed first, or that is
+        waiting to be retried, is skipped.
+        """
+        new = self.directory / "new"
+        cur = self.directory / "cur"
+        claimed: list[Path] = []
+        now = time.monotonic()
+
+        with self._cond:
+            waiting = {n for n, (_, due) in self._retrying.items() if due > now}
+
+        for name in sorted(os.listdir(new)):
+            if name in waiting:
+                continue
+
+            try:
+                os.rename(new / name, cur / name)
+            except FileNotFoundError:
+                continue
+
+            claimed.append(cur / name)
+
+            if len(claimed) >= self.batch_size:
+                break
+
+        return claimed
+
+    def _deliver(self, paths: list[Path]) -> None:
+        """Send each claimed message with the inner handler, and remove it as
+        soon as it's sent. Messages are sent one at a time, so that if one
+        fails, the messages sent before it are not sent again.
+        """
+        for path in paths:
+            try:
+                message = _load(path)
+            except Exception:
+                logger.exception("Could not read spooled message '%s'.", path.name)
+                self._fail(path)
+                continue
+
+            try:
+                self.handler.send([message])
+            except Exception as e:
+                self._retry(path, e)
+                continue
+
+            path.unlink(missing_ok=True)
+
+            with self._cond:
+                self._retrying.pop(path.name, None)
+                self._delivered += 1
+
+    def _retry(self, path: Path, error: Exception) -> None:
+        """Move a message that failed temporarily back to ``new`` to be tried
+        again after a delay. It's moved to ``failed`` instead if the error is
+        permanent or it has been tried :attr:`retries` times.
+        """
+        with self._cond:
+            attempts = self._retrying.pop(path.name, (0, 0.0))[0] + 1
+
+        if not _is_temporary(error) or attempts > self.retries:
+            logger.error("Could not deliver '%s'.", path.name, exc_info=error)
+            self._fail(path)
+            return
+
+        delay = min(self.retry_max_delay, self.retry_backoff * 2.0 ** (attempts - 1))
+        logger.warning(
+            "Could not deliver '%s', trying again in %.1f seconds.",
+            path.name,
+            delay,
+            exc_info=error,
+        )
+
+        with self._cond:
+            self._retrying[path.name] = (attempts, time.monotonic() + delay)
+
+        path.rename(self.directory / "new" / path.name)
+
+    def _fail(self, path: Path) -> None:
+        path.rename(self.directory / "failed" / path.name)
+
+        with self._cond:
+            self._errors += 1
+
+
+class SpoolStats(t.NamedTuple):
+    """The size of a spool, returned by :meth:`.SpoolEmailHandler.stats`."""
+
+    pending: int
+    """The number of messages waiting to be delivered."""
+
+    in_flight: int
+    """The number of messages claimed by a worker and being delivered."""
+
+    failed: int
+    """The number of messages that failed to deliver."""
+
+    delivered: int
+    """The number of messages delivered by this handler since it was
+    created.
+    """
+
+    errors: int
+    """The number of messages that failed to deliver since this handler was
+    created.
+    """
+
+    oldest_age: float | None
+    """How long in seconds the oldest pending message has been waiting, or
+    ``None`` if there are no pending messages.
+    """
+
+
+def _load(path: Path) -> _EmailMessage:
+    """Read a spooled message as MIME. A :class:`.Message` can't be rebuilt
+    exactly from its MIME, so every message is delivered as MIME.
+    """
+    with path.open("rb") as f:
+        return message_from_binary_file(f, policy=policy.default)
+
+
+def _is_temporary(error: Exception) -> bool:
+    """Whether a message that failed to deliver may succeed if it's tried
+    again, because the connection failed or the server replied with a ``4xx``
+    code. Other errors, such as an invalid message, are permanent.
+    """
+    if isinstance(error, SMTPSendError):
+        return all(_is_temporary(f.error) for f in error.failures)
+
+    if isinstance(error, (SMTPException, OSError)):
+        return _is_temporary_reply(error)
+
+    return False
+
+
+def _move_all(source: Path, target: Path) -> int:
+    count = 0
+
+    for path in source.iterdir():
+        path.rename(target / path.name)
+        count += 1
+
+    return count
+
+
+def _count(directory: Path) -> int:
+    return len(os.listdir(directory))
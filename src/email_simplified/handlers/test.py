@@ -1,29 +1,520 @@
 from __future__ import annotations
 
+import collections.abc as cabc
+import os
+import threading
 import typing as t
+from collections import deque
+from email import message_from_bytes
+from email import policy
+from email.headerregistry import Address
 from email.message import EmailMessage as _EmailMessage
 
+from ..address import prepare_address
 from ..message import Message
 from .base import EmailHandler
+from .file import _iter_message
+from .file import _write_mbox
 
 
 class TestEmailHandler(EmailHandler):
-    """Email handler that appends messages to a list rather than sending them.
-    Useful when testing.
+    """Email handler that appends messages to an :class:`Outbox` rather than
+    sending them. Useful when testing.
+
+    By default, every message is kept. For long running load tests, pass
+    ``max_size`` to keep only the most recent messages, and ``store_bytes`` to
+    keep them serialized rather than as objects.
+
+    :param max_size: Keep at most this many messages in the outbox. Older
+        messages are removed as new messages are added.
+    :param spill_path: Append messages removed from the outbox to this mbox file
+        rather than discarding them.
+    :param store_bytes: Keep the serialized MIME of each message rather than
+        the message object, which uses less memory. Messages are parsed again
+        as :class:`~email.message.EmailMessage` when they're accessed.
     """
 
     __test__ = False  # don't get collected by pytest
 
-    def __init__(self) -> None:
-        self.outbox: list[Message | _EmailMessage] = []
-        """List of messages that have been sent with this handler."""
+    def __init__(
+        self,
+        *,
+        max_size: int | None = None,
+        spill_path: str | os.PathLike[str] | None = None,
+        store_bytes: bool = False,
+    ) -> None:
+        self.outbox: Outbox = Outbox(
+            max_size=max_size, spill_path=spill_path, store_bytes=store_bytes
+        )
+        """The messages that have been sent with this handler."""
 
     @classmethod
     def from_config(cls, config: dict[str, t.Any]) -> t.Self:
-        return cls()
+        """Create a handler from a config dict. Config keys match the arguments
+        to :class:`.TestEmailHandler`, and are all optional.
+        """
+        return cls(
+            max_size=config.get("max_size"),
+            spill_path=config.get("spill_path"),
+            store_bytes=config.get("store_bytes", False),
+        )
 
     def send(self, messages: list[Message | _EmailMessage]) -> None:
         self.outbox.extend(messages)
 
     async def send_async(self, messages: list[Message | _EmailMessage]) -> None:
         self.send(messages)
+
+    def close(self) -> None:
+        """Close the outbox's spill file, if it's open."""
+        self.outbox.close()
+
+
+class _Entry(t.NamedTuple):
+    seq: int
+    value: Message | _EmailMessage | bytes
+    recipients: frozenset[str]
+    sender: str | None
+    subject: str | None
+
+
+class Outbox(cabc.MutableSequence[Message | _EmailMessage]):
+    """The messages sent with a :class:`.TestEmailHandler`, in the order they
+    were sent. It can be used like a list, and compares equal to a list of the
+    same messages. It indexes messages by recipient, sender, and subject to
+    look them up with :meth:`find`. It's safe to send from multiple threads.
+
+    :param max_size: Keep at most this many messages. Older messages are removed
+        as new messages are added.
+    :param spill_path: Append removed messages to this mbox file rather than
+        discarding them. It can be read with :class:`mailbox.mbox`.
+    :param store_bytes: Keep the serialized MIME of each message rather than
+        the message object. Each access parses the MIME again, returning a new
+        :class:`~email.message.EmailMessage`, even if a :class:`.Message` was
+        sent. Messages compare by identity, so the outbox doesn't compare equal
+        to a list of messages taken from it. Compare their fields instead.
+
+    Adding or removing messages at either end updates the indexes directly.
+    Other changes, and assigning to a slice, rebuild the indexes.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_size: int | None = None,
+        spill_path: str | os.PathLike[str] | None = None,
+        store_bytes: bool = False,
+    ) -> None:
+        self.max_size = max_size
+        """Keep at most this many messages."""
+
+        self.spill_path = spill_path
+        """Append removed messages to this mbox file."""
+
+        self.store_bytes = store_bytes
+        """Keep the serialized MIME of each message."""
+
+        self.sent_count = 0
+        """The number of messages sent, including messages that were
+        removed.
+        """
+
+        self.sent_bytes = 0
+        """The total size of the messages sent, including messages that were
+        removed. Only counted with :attr:`store_bytes`, otherwise messages
+        aren't serialized.
+        """
+
+        self.removed_count = 0
+        """The number of messages removed because of :attr:`max_size`."""
+
+        self._entries: deque[_Entry] = deque()
+        self._next_seq = 0
+        self._by_recipient: dict[str, deque[int]] = {}
+        self._by_sender: dict[str | None, deque[int]] = {}
+        self._by_subject: dict[str | None, deque[int]] = {}
+        self._spill: t.IO[bytes] | None = None
+        self._lock = threading.Lock()
+
+    def append(self, message: Message | _EmailMessage) -> None:
+        """Add a sent message."""
+        entry = self._entry(message)
+
+        with self._lock:
+            self.sent_count += 1
+
+            if isinstance(entry.value, bytes):
+                self.sent_bytes += len(entry.value)
+
+            self._add(entry)
+            self._trim()
+
+    def extend(self, messages: cabc.Iterable[Message | _EmailMessage]) -> None:
+        """Add sent messages."""
+        for message in messages:
+            self.append(message)
+
+    def _entry(self, message: Message | _EmailMessage) -> _Entry:
+        """Create an entry to add, serializing the message if needed. The
+        sequence number is set when it's added.
+        """
+        recipients, sender, subject = _index_fields(message)
+        value: Message | _EmailMessage | bytes = message
+
+        if self.store_bytes:
+            value = _serialize(message)
+
+        return _Entry(0, value, recipients, sender, subject)
+
+    def _add(self, entry: _Entry) -> None:
+        """Add an entry to the end, and to the indexes."""
+        seq = self._next_seq
+        self._next_seq += 1
+        self._entries.append(entry._replace(seq=seq))
+
+        for addr in entry.recipients:
+            self._by_recipient.setdefault(addr, deque()).append(seq)
+
+        self._by_sender.setdefault(entry.sender, deque()).append(seq)
+        self._by_subject.setdefault(entry.subject, deque()).append(seq)
+
+    def _add_first(self, entry: _Entry) -> None:
+        """Add an entry to the start, and to the indexes."""
+        if not self._entries:
+            self._add(entry)
+            return
+
+        seq = self._entries[0].seq - 1
+        self._entries.appendleft(entry._replace(seq=seq))
+
+        for addr in entry.recipients:
+            self._by_recipient.setdefault(addr, deque()).appendleft(seq)
+
+        self._by_sender.setdefault(entry.sender, deque()).appendleft(seq)
+        self._by_subject.setdefault(entry.subject, deque()).appendleft(seq)
+
+    def _pop_first(self) -> _Entry:
+        """Remove the first entry, and remove it from the indexes."""
+        entry = self._entries.popleft()
+
+        # The first entry is first in each index it's in.
+        for addr in entry.recipients:
+            _pop_index(self._by_recipient, addr)
+
+        _pop_index(self._by_sender, entry.sender)
+        _pop_index(self._by_subject, entry.subject)
+        return entry
+
+    def _pop_last(self) -> _Entry:
+        """Remove the last entry, and remove it from the indexes."""
+        entry = self._entries.pop()
+        self._next_seq -= 1
+
+        # The last entry is last in each index it's in.
+        for addr in entry.recipients:
+            _pop_index(self._by_recipient, addr, last=True)
+
+        _pop_index(self._by_sender, entry.sender, last=True)
+        _pop_index(self._by_subject, entry.subject, last=True)
+        return entry
+
+    def _pop_at(self, index: int) -> _Entry:
+        """Remove the entry at a position. Rebuilds the indexes unless it's at
+        either end.
+        """
+        if index == 0:
+            return self._pop_first()
+
+        if index == len(self._entries) - 1:
+            return self._pop_last()
+
+        entries = list(self._entries)
+        entry = entries.pop(index)
+        self._reset(entries)
+        return entry
+
+    def _position(self, index: int) -> int:
+        size = len(self._entries)
+
+        if index < 0:
+            index += size
+
+        if not 0 <= index < size:
+            raise IndexError("Outbox index out of range")
+
+        return index
+
+    def _reset(self, entries: list[_Entry]) -> None:
+        """Replace all the entries, and rebuild the indexes. Used when the
+        outbox is changed other than at the ends, so that sequence numbers stay
+        contiguous.
+        """
+        self._entries.clear()
+        self._by_recipient.clear()
+        self._by_sender.clear()
+        self._by_subject.clear()
+        self._next_seq = 0
+
+        for entry in entries:
+            self._add(entry)
+
+        self._trim()
+
+    def _trim(self) -> None:
+        while self.max_size is not None and len(self._entries) > self.max_size:
+            self._remove_oldest()
+
+    def _remove_oldest(self) -> None:
+        entry = self._pop_first()
+        self.removed_count += 1
+
+        if self.spill_path is not None:
+            value = entry.value
+
+            if not isinstance(value, bytes):
+                value = _serialize(value)
+
+            if self._spill is None:
+                self._spill = open(self.spill_path, "ab")
+
+            _write_mbox(self._spill, (value,))
+
+    def find(
+        self,
+        *,
+        to: str | Address | None = None,
+        sender: str | Address | None = None,
+        subject: str | None = None,
+    ) -> list[Message | _EmailMessage]:
+        """Get the messages that match all the given criteria, in the order
+        they were sent. Uses the indexes rather than checking every message.
+
+        :param to: A ``To``, ``Cc``, or ``Bcc`` recipient address. Compared
+            without case, and ignoring the display name.
+        :param sender: The ``From`` address, or ``Sender`` if it's set.
+        :param subject: The exact subject.
+        """
+        with self._lock:
+            found: set[int] | None = None
+            criteria: list[tuple[dict[t.Any, deque[int]], t.Any]] = []
+
+            if to is not None:
+                criteria.append((self._by_recipient, _addr_key(to)))
+
+            if sender is not None:
+                criteria.append((self._by_sender, _addr_key(sender)))
+
+            if subject is not None:
+                criteria.append((self._by_subject, subject))
+
+            for index, key in criteria:
+                seqs = set(index.get(key, ()))
+                found = seqs if found is None else found & seqs
+
+            if found is None:
+                entries = list(self._entries)
+            elif not found:
+                entries = []
+            else:
+                first = self._entries[0].seq
+                entries = [self._entries[seq - first] for seq in sorted(found)]
+
+        return [_load(e) for e in entries]
+
+    def clear(self) -> None:
+        """Remove all the messages and reset the counts."""
+        with self._lock:
+            self._entries.clear()
+            self._by_recipient.clear()
+            self._by_sender.clear()
+            self._by_subject.clear()
+            self._next_seq = 0
+            self.sent_count = 0
+            self.sent_bytes = 0
+            self.removed_count = 0
+
+    def close(self) -> None:
+        """Close the spill file, if it's open. It's opened again if more
+        messages are removed.
+        """
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @t.overload
+    def __getitem__(self, index: int) -> Message | _EmailMessage: ...
+    @t.overload
+    def __getitem__(self, index: slice) -> list[Message | _EmailMessage]: ...
+    def __getitem__(
+        self, index: int | slice
+    ) -> Message | _EmailMessage | list[Message | _EmailMessage]:
+        with self._lock:
+            if isinstance(index, slice):
+                return [_load(e) for e in list(self._entries)[index]]
+
+            return _load(self._entries[index])
+
+    @t.overload
+    def __setitem__(self, index: int, value: Message | _EmailMessage) -> None: ...
+    @t.overload
+    def __setitem__(
+        self, index: slice, value: cabc.Iterable[Message | _EmailMessage]
+    ) -> None: ...
+    def __setitem__(self, index: int | slice, value: t.Any) -> None:
+        if isinstance(index, slice):
+            new = [self._entry(m) for m in value]
+
+            with self._lock:
+                entries = list(self._entries)
+                entries[index] = new
+                self._reset(entries)
+
+            return
+
+        entry = self._entry(value)
+
+        with self._lock:
+            index = self._position(index)
+
+            if index == len(self._entries) - 1:
+                self._pop_last()
+                self._add(entry)
+            elif index == 0:
+                self._pop_first()
+                self._add_first(entry)
+            else:
+                entries = list(self._entries)
+                entries[index] = entry
+                self._reset(entries)
+
+    def __delitem__(self, index: int | slice) -> None:
+        with self._lock:
+            if not isinstance(index, slice):
+                self._pop_at(self._position(index))
+                return
+
+            size = len(self._entries)
+            positions = range(*index.indices(size))
+
+            if not positions:
+                return
+
+            first, last = min(positions), max(positions)
+
+            if last - first + 1 == len(positions) and (first == 0 or last == size - 1):
+                # A range at either end is removed one entry at a time.
+                for _ in positions:
+                    self._pop_at(first if first == 0 else len(self._entries) - 1)
+
+                return
+
+            entries = list(self._entries)
+            del entries[index]
+            self._reset(entries)
+
+    def pop(self, index: int = -1) -> Message | _EmailMessage:
+        """Remove and return the message at the index, the last by default."""
+        with self._lock:
+            entry = self._pop_at(self._position(index))
+
+        return _load(entry)
+
+    def insert(self, index: int, value: Message | _EmailMessage) -> None:
+        """Insert a message before the index. It's not counted as sent."""
+        entry = self._entry(value)
+
+        with self._lock:
+            size = len(self._entries)
+            index = min(max(index + size if index < 0 else index, 0), size)
+
+            if index == size:
+                self._add(entry)
+            elif index == 0:
+                self._add_first(entry)
+            else:
+                entries = list(self._entries)
+                entries.insert(index, entry)
+                self._reset(entries)
+                return
+
+            self._trim()
+
+    def __iter__(self) -> cabc.Iterator[Message | _EmailMessage]:
+        with self._lock:
+            entries = list(self._entries)
+
+        for entry in entries:
+            yield _load(entry)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Outbox):
+            return list(self) == list(other)
+
+        if isinstance(other, list):
+            return list(self) == other
+
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"<Outbox {len(self)} messages, {self.sent_count} sent>"
+
+
+def _index_fields(
+    message: Message | _EmailMessage,
+) -> tuple[frozenset[str], str | None, str | None]:
+    """Get the recipients, sender, and subject of a message to index it."""
+    if isinstance(message, Message):
+        addresses = [*message.to, *message.cc, *message.bcc]
+        from_addr = message.from_addr
+        sender = None if from_addr is None else _addr_key(from_addr)
+        return frozenset(_addr_key(a) for a in addresses), sender, message.subject
+
+    fields = (message["to"], message["cc"], message["bcc"])
+    recipients = frozenset(
+        _addr_key(a) for f in fields if f is not None for a in f.addresses
+    )
+    from_header = message["sender"] or message["from"]
+    sender = None
+
+    if from_header and from_header.addresses:
+        sender = _addr_key(from_header.addresses[0])
+
+    subject = message["subject"]
+    return recipients, sender, None if subject is None else str(subject)
+
+
+def _addr_key(value: str | Address) -> str:
+    return prepare_address(value).addr_spec.lower()
+
+
+def _pop_index(index: dict[t.Any, deque[int]], key: t.Any, last: bool = False) -> None:
+    seqs = index[key]
+
+    if last:
+        seqs.pop()
+    else:
+        seqs.popleft()
+
+    if not seqs:
+        del index[key]
+
+
+def _serialize(message: Message | _EmailMessage) -> bytes:
+    return b"".join(_iter_message(message))
+
+
+def _load(entry: _Entry) -> Message | _EmailMessage:
+    """Get the message from an entry, parsing its MIME if it was stored as
+    bytes. A :class:`.Message` can't be rebuilt exactly from its MIME, so
+    every stored message is returned as an :class:`~email.message.EmailMessage`.
+    """
+    if not isinstance(entry.value, bytes):
+        return entry.value
+
+    return message_from_bytes(entry.value, policy=policy.default)
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import collections.abc as cabc
+import copy
+import email
+import string
+import typing as t
+from email.headerregistry import Address
+from email.message import EmailMessage as _EmailMessage
+
+from . import _mime
+from .attachment import _attach_part
+from .attachment import Attachment
+from .message import Message
+
+RenderFunc: t.TypeAlias = cabc.Callable[[str, cabc.Mapping[str, t.Any]], str]
+"""A function that renders a template string with variables, used by
+:class:`MessageTemplate`.
+"""
+
+_SHARED_HEADERS = frozenset({"From", "Reply-To", "CC", "BCC"})
+"""Headers that are the same for every message rendered from a template."""
+
+
+class MessageTemplate:
+    """Create many messages from a base message, each sent to different
+    recipients and with different values substituted into the subject and
+    content. This is known as "mail merge".
+
+    The parts that are the same for every message are prepared once, rather
+    than for each message. Attachments and inline attachments are encoded the
+    first time a message is serialized, then the encoded data is reused. The
+    ``From``, ``Reply-To``, ``CC``, and ``BCC`` headers are formatted once as
+    well.
+
+    By default, :attr:`~.Message.subject`, :attr:`~.Message.text`, and
+    :attr:`~.Message.html` use :class:`string.Template` syntax, such as
+    ``Hello, $name``. Pass ``render`` to use a different template engine.
+
+    .. code-block:: python
+
+        template = MessageTemplate(
+            Message(subject="Hello, $name", text="...", attachments=[...])
+        )
+        handler.send(list(template.messages([
+            {"to": "a@example.test", "name": "A"},
+            {"to": "b@example.test", "name": "B"},
+        ])))
+
+    Encoded attachments are held in memory for as long as the template is,
+    including attachments that were given as a path or file.
+
+    :param message: The base message. Its attachments are copied, changing them
+        after creating the template has no effect.
+    :param render: A function that takes a template string and the variables
+        for one message, and returns the rendered string.
+    """
+
+    def __init__(self, message: Message, *, render: RenderFunc | None = None):
+        self.message: Message = message
+        """The base message that each message is created from."""
+
+        self.render_func: RenderFunc = render or _render_string_template
+        """The function that renders the template strings."""
+
+        self._check_placeholders = render is None
+        self._attachments = [_EncodedAttachment(a) for a in message.attachments]
+        self._inline_attachments = [
+            _EncodedAttachment(a) for a in message.inline_attachments
+        ]
+        self._headers: dict[tuple[str, str, str, bool], bytes] = {}
+
+    def _render(
+        self, value: str | None, variables: cabc.Mapping[str, t.Any]
+    ) -> str | None:
+        if not value:
+            return value
+
+        if self._check_placeholders and "$" not in value:
+            # Nothing to substitute, the string is the same for every message.
+            return value
+
+        return self.render_func(value, variables)
+
+    def render(self, variables: cabc.Mapping[str, t.Any]) -> Message:
+        """Create a message for one set of variables.
+
+        The ``to`` key sets the recipients of the message, either a single
+        address or a list. If it's not given, the base message's recipients are
+        used. All keys, including ``to``, can be used in the templates.
+
+        :param variables: The values to substitute into the templates.
+        """
+        to = variables.get("to")
+
+        if to is None:
+            to = self.message.to
+        elif isinstance(to, str | Address):
+            to = [to]
+
+        message = _MergedMessage(
+            self,
+            subject=self._render(self.message.subject, variables),
+            text=self._render(self.message.text, variables),
+            html=self._render(self.message.html, variables),
+            from_addr=self.message.from_addr,
+            reply_to=self.message.reply_to,
+            to=list(to),
+            cc=list(self.message.cc),
+            bcc=list(self.message.bcc),
+            attachments=list(self._attachments),
+            inline_attachments=list(self._inline_attachments),
+        )
+        return message
+
+    def messages(
+        self, recipients: cabc.Iterable[cabc.Mapping[str, t.Any]]
+    ) -> cabc.Iterator[Message]:
+        """Create a message for each set of variables, as with :meth:`render`.
+        Messages are created as they are iterated over, rather than all at
+        once.
+
+        :param recipients: The values to substitute for each message.
+        """
+        for variables in recipients:
+            yield self.render(variables)
+
+    def iter_bytes(
+        self, recipients: cabc.Iterable[cabc.Mapping[str, t.Any]], **kwargs: t.Any
+    ) -> cabc.Iterator[bytes]:
+        """Create a message for each set of variables and serialize it, as with
+        :meth:`.Message.iter_bytes`. Yields the complete bytes of each message.
+        Takes the same keyword arguments as ``Message.iter_bytes``.
+
+        :param recipients: The values to substitute for each message.
+        """
+        for message in self.messages(recipients):
+            yield b"".join(message.iter_bytes(**kwargs))
+
+    def _shared_header(
+        self, name: str, value: str, *, linesep: str, utf8: bool
+    ) -> bytes:
+        key = (name, value, linesep, utf8)
+
+        if (out := self._headers.get(key)) is None:
+            out = self._headers[key] = _mime.header(
+                name, value, linesep=linesep, utf8=utf8
+            )
+
+        return out
+
+
+def _render_string_template(value: str, variables: cabc.Mapping[str, t.Any]) -> str:
+    return string.Template(value).substitute(variables)
+
+
+class _MergedMessage(Message):
+    """A message created by :class:`MessageTemplate`, which formats shared
+    headers using the template's cache.
+    """
+
+    def __init__(self, template: MessageTemplate, **kwargs: t.Any) -> None:
+        super().__init__(**kwargs)
+        self._template = template
+
+    def _format_header(
+        self, name: str, value: str, *, linesep: str, utf8: bool
+    ) -> bytes:
+        if name in _SHARED_HEADERS:
+            return self._template._shared_header(
+                name, value, linesep=linesep, utf8=utf8
+            )
+
+        return super()._format_header(name, value, linesep=linesep, utf8=utf8)
+
+
+class _EncodedAttachment(Attachment):
+    """A copy of an attachment that is shared by every message created from a
+    template. Each form of the encoded part is cached the first time it's
+    written.
+    """
+
+    def __init__(self, attachment: Attachment) -> None:
+        super().__init__(
+            attachment.data, filename=attachment.filename, mimetype=attachment.mimetype
+        )
+        self._start = attachment._start
+        # Generate the id now, so it's the same for every message.
+        self.cid = attachment.cid
+        self._encoded: dict[tuple[bool, str], bytes] = {}
+        self._parts: dict[bool, _EmailMessage] = {}
+
+    def iter_bytes(
+        self, *, inline: bool = False, linesep: str = "\r\n"
+    ) -> cabc.Iterator[bytes]:
+        key = (inline, linesep)
+
+        if (out := self._encoded.get(key)) is None:
+            out = self._encoded[key] = b"".join(
+                super().iter_bytes(inline=inline, linesep=linesep)
+            )
+
+        yield out
+
+    def add_to_mime(self, message: _EmailMessage, *, inline: bool = False) -> None:
+        if (part := self._parts.get(inline)) is None:
+            # Parse the encoded part, so the payload is already encoded when
+            # the message is serialized.
+            data = b"".join(self.iter_bytes(inline=inline, linesep="\n"))
+            part = self._parts[inline] = email.message_from_bytes(
+                data,
+                _class=_EmailMessage,
+                policy=message.policy,
+            )
+
+        _attach_part(message, copy.copy(part), inline=inline)
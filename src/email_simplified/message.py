@@ -1,12 +1,19 @@
 from __future__ import annotations
 
 import collections.abc as cabc
+import functools
+import hashlib
 import html.parser
+import os
+import threading
 import typing as t
+from collections import OrderedDict
 from email.headerregistry import Address
 from email.headerregistry import AddressHeader
 from email.message import EmailMessage as _EmailMessage
 
+from . import _mime
+from . import _parse
 from .address import AddressList
 from .address import prepare_address
 from .attachment import Attachment
@@ -62,13 +69,10 @@ class Message:
         self.subject: str | None = subject
         """The text in the subject line of the message."""
 
-        self.text: str | None = text
-        """The plain text content."""
-
-        self.html: str | None = html
-        """The HTML text content. :attr:`text` content should also be provided,
-        but if it's not then text is extracted from the HTML.
-        """
+        self._text = text
+        self._html = html
+        self._loaders: dict[str, cabc.Callable[[], str]] = {}
+        self._temp_files: list[t.IO[bytes]] = []
 
         if from_addr:
             self._from_addr: Address | None = prepare_address(from_addr)
@@ -92,6 +96,34 @@ class Message:
         relevant when :attr:`html` content is provided.
         """
 
+    @property
+    def text(self) -> str | None:
+        """The plain text content."""
+        if "text" in self._loaders:
+            self._text = self._loaders.pop("text")()
+
+        return self._text
+
+    @text.setter
+    def text(self, value: str | None) -> None:
+        self._loaders.pop("text", None)
+        self._text = value
+
+    @property
+    def html(self) -> str | None:
+        """The HTML text content. :attr:`text` content should also be provided,
+        but if it's not then text is extracted from the HTML.
+        """
+        if "html" in self._loaders:
+            self._html = self._loaders.pop("html")()
+
+        return self._html
+
+    @html.setter
+    def html(self, value: str | None) -> None:
+        self._loaders.pop("html", None)
+        self._html = value
+
     @property
     def from_addr(self) -> Address | None:
         """The address to show the message was sent from."""
@@ -188,8 +220,109 @@ class Message:
 
         return message
 
+    def iter_bytes(
+        self,
+        *,
+        linesep: str = "\r\n",
+        include_bcc: bool = True,
+        utf8: bool = False,
+    ) -> cabc.Iterator[bytes]:
+        """Write this message as MIME bytes, in chunks. The output has the same
+        structure, headers, and content as flattening the result of
+        :meth:`to_mime`, but the message is written directly rather than
+        building and then flattening an
+        :class:`~email.message.EmailMessage`. Attachments are encoded in
+        chunks as they are written, and file attachments are read in chunks, so
+        the whole message does not need to be in memory.
+
+        :param linesep: The line separator to use. SMTP requires ``\r\n``.
+        :param include_bcc: Write the ``BCC`` header. This is not sent when
+            sending with SMTP, so that recipients don't see each other.
+        :param utf8: Write non-ASCII header values as UTF-8 rather than
+            encoding them. Only valid if the server supports ``SMTPUTF8``.
+        """
+        sep = linesep.encode("ascii")
+
+        def header(name: str, value: str) -> bytes:
+            return self._format_header(name, value, linesep=linesep, utf8=utf8)
+
+        def addresses(values: AddressList) -> str:
+            return ", ".join(str(a) for a in values)
+
+        if self.subject:
+            yield header("Subject", self.subject)
+
+        if self.from_addr:
+            yield header("From", str(self.from_addr))
+
+        if self.reply_to:
+            yield header("Reply-To", str(self.reply_to))
+
+        if self.to:
+            yield header("To", addresses(self.to))
+
+        if self.cc:
+            yield header("CC", addresses(self.cc))
+
+        if self.bcc and include_bcc:
+            yield header("BCC", addresses(self.bcc))
+
+        parts: list[cabc.Iterable[bytes]] = []
+
+        if self.text or self.html:
+            text = self.text or _HTMLToText.process(t.cast(str, self.html))
+            body = _iter_text_part(text, "plain", linesep)
+
+            if self.html:
+                html = _iter_text_part(self.html, "html", linesep)
+
+                if self.inline_attachments:
+                    html = _iter_multipart(
+                        "related",
+                        [
+                            html,
+                            *(
+                                a.iter_bytes(inline=True, linesep=linesep)
+                                for a in self.inline_attachments
+                            ),
+                        ],
+                        linesep,
+                    )
+
+                body = _iter_multipart("alternative", [body, html], linesep)
+
+            parts.append(body)
+
+        parts.extend(a.iter_bytes(linesep=linesep) for a in self.attachments)
+
+        if not parts:
+            yield sep
+            return
+
+        yield b"MIME-Version: 1.0" + sep
+
+        if len(parts) == 1 and not self.attachments:
+            yield from parts[0]
+        else:
+            yield from _iter_multipart("mixed", parts, linesep)
+
+    def _format_header(
+        self, name: str, value: str, *, linesep: str, utf8: bool
+    ) -> bytes:
+        """Format a header line for :meth:`iter_bytes`."""
+        return _mime.header(name, value, linesep=linesep, utf8=utf8)
+
+    def write_to(self, fp: t.IO[bytes], **kwargs: t.Any) -> None:
+        """Write this message as MIME bytes to a binary file. Takes the same
+        arguments as :meth:`iter_bytes`.
+
+        :param fp: The file to write to.
+        """
+        for chunk in self.iter_bytes(**kwargs):
+            fp.write(chunk)
+
     @classmethod
-    def from_mime(cls, message: _EmailMessage) -> t.Self:
+    def from_mime(cls, message: _EmailMessage, *, lazy: bool = False) -> t.Self:
         """Convert an :class:`email.message.EmailMessage` message to a
         :class:`email_simplified.Message`.
 
@@ -210,73 +343,208 @@ class Message:
             one or more download attachment parts.
 
         :param message: The MIME part message to convert.
+        :param lazy: Only read the headers and the structure of the parts. The
+            text, HTML, and attachment data are decoded when they are first
+            accessed. This is useful if only some messages will be read, such as
+            when routing messages based on their headers.
         """
         original = message
         content_type = original.get_content_type()
         parts: list[_EmailMessage]
-        text: str
-        html: str | None
+        text_part: _EmailMessage
+        html_part: _EmailMessage | None = None
         attachments: list[Attachment] = []
         inline_attachments: list[Attachment] = []
 
         if content_type == "multipart/mixed":
             message, *parts = t.cast(list[_EmailMessage], original.get_payload())
             content_type = message.get_content_type()
-
-            for part in parts:
-                attachments.append(
-                    Attachment(
-                        data=part.get_content(),
-                        filename=part.get_filename(),
-                        mimetype=part.get_content_type(),
-                    )
-                )
+            attachments.extend(_mime_attachment(part, lazy) for part in parts)
 
         if content_type == "multipart/alternative":
-            text_part: _EmailMessage
-            html_part: _EmailMessage
             text_part, html_part = t.cast(list[_EmailMessage], message.get_payload())
-            text = text_part.get_content()
 
             if html_part.get_content_type() == "multipart/related":
                 html_part, *parts = t.cast(list[_EmailMessage], html_part.get_payload())
 
                 for part in parts:
-                    attachment = Attachment(
-                        data=part.get_content(),
-                        filename=part.get_filename(),
-                        mimetype=part.get_content_type(),
-                    )
+                    attachment = _mime_attachment(part, lazy)
                     attachment.cid = part["content-id"]
                     inline_attachments.append(attachment)
-
-            html = html_part.get_content()
         else:
-            text = message.get_content()
-            html = None
+            text_part = message
 
         from_addr: AddressHeader = original["from"]
         reply_to: AddressHeader = original["reply-to"]
         to: AddressHeader = original["to"]
         cc: AddressHeader = original["cc"]
         bcc: AddressHeader = original["bcc"]
-        return cls(
+        out = cls(
             subject=original["subject"],
-            text=text,
             from_addr=from_addr.addresses[0] if from_addr else None,
             reply_to=reply_to.addresses[0] if reply_to else None,
             to=list(to.addresses) if to else [],
             cc=list(cc.addresses) if cc else [],
             bcc=list(bcc.addresses) if bcc else [],
             attachments=attachments,
-            html=html,
             inline_attachments=inline_attachments,
         )
 
+        # Files created for spooled parts are closed by close().
+        out._temp_files = [
+            t.cast(t.IO[bytes], part.attachment.data)
+            for part in original.walk()
+            if isinstance(part, _parse._SpooledPart) and part.attachment is not None
+        ]
+
+        if lazy:
+            out._loaders["text"] = text_part.get_content
+
+            if html_part is not None:
+                out._loaders["html"] = html_part.get_content
+        else:
+            out.text = text_part.get_content()
+
+            if html_part is not None:
+                out.html = html_part.get_content()
+
+        return out
+
+    def close(self) -> None:
+        """Close the temporary files created for attachments by
+        :meth:`from_bytes` or :meth:`from_file` with ``spool_size``. The
+        attachments can't be read after this. Also called when exiting a
+        ``with`` block.
+        """
+        for f in self._temp_files:
+            f.close()
+
+        self._temp_files.clear()
+
+    def __enter__(self) -> t.Self:
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.close()
+
+    @classmethod
+    def from_bytes(
+        cls,
+        data: bytes | cabc.Iterable[bytes],
+        *,
+        lazy: bool = False,
+        spool_size: int | None = None,
+        spool_dir: str | os.PathLike[str] | None = None,
+    ) -> t.Self:
+        """Parse MIME message bytes and convert them to a
+        :class:`email_simplified.Message`, as with :meth:`from_mime`.
+
+        The data can be given in chunks, such as when reading from a socket,
+        and is parsed incrementally as each chunk is received. If
+        ``spool_size`` is given, attachments larger than that are decoded to
+        temporary files as they are parsed, and the resulting
+        :class:`.Attachment` objects read from those files rather than holding
+        the data in memory.
+
+        :param data: The message bytes, or an iterable of chunks of bytes.
+        :param lazy: Decode the text, HTML, and attachment data when they are
+            first accessed.
+        :param spool_size: Decode attachments with an encoded size larger than
+            this many bytes to temporary files.
+        :param spool_dir: The directory to create temporary files in. Defaults
+            to the system temporary directory.
+        """
+        if isinstance(data, bytes):
+            data = (data,)
+
+        mime = _parse.parse(data, spool_size=spool_size, spool_dir=spool_dir)
+        return cls.from_mime(mime, lazy=lazy)
+
+    @classmethod
+    def from_file(
+        cls,
+        fp: str | os.PathLike[str] | t.IO[bytes],
+        *,
+        chunk_size: int = 64 * 1024,
+        **kwargs: t.Any,
+    ) -> t.Self:
+        """Parse a MIME message from a file, reading it in chunks. Takes the
+        same arguments as :meth:`from_bytes`.
+
+        :param fp: A path or binary file to read from.
+        :param chunk_size: The number of bytes to read at once.
+        """
+        if isinstance(fp, str | os.PathLike):
+            with open(fp, "rb") as f:
+                return cls.from_file(f, chunk_size=chunk_size, **kwargs)
+
+        return cls.from_bytes(
+            iter(functools.partial(fp.read, chunk_size), b""), **kwargs
+        )
+
+
+def _mime_attachment(part: _EmailMessage, lazy: bool) -> Attachment:
+    """Create an attachment from a MIME part. If ``lazy`` is enabled, the data
+    is decoded when it is first accessed.
+    """
+    if isinstance(part, _parse._SpooledPart) and part.attachment is not None:
+        # The data was decoded to a temporary file while parsing.
+        return part.attachment
+
+    if not lazy:
+        return Attachment(
+            data=part.get_content(),
+            filename=part.get_filename(),
+            mimetype=part.get_content_type(),
+        )
+
+    attachment = Attachment(
+        data=b"", filename=part.get_filename(), mimetype=part.get_content_type()
+    )
+    attachment._loader = part.get_content
+    return attachment
+
+
+def _iter_text_part(text: str, subtype: str, linesep: str) -> cabc.Iterator[bytes]:
+    """Write a text part, as :meth:`~email.message.EmailMessage.set_content`
+    would create.
+    """
+    cte, body = _mime.encode_text(text, linesep=linesep)
+    yield _mime.params_header(
+        "Content-Type", f"text/{subtype}", {"charset": "utf-8"}, linesep=linesep
+    )
+    yield f"Content-Transfer-Encoding: {cte}{linesep}{linesep}".encode("ascii")
+    yield body
+
+
+def _iter_multipart(
+    subtype: str, parts: list[cabc.Iterable[bytes]], linesep: str
+) -> cabc.Iterator[bytes]:
+    """Write a multipart part containing the given parts."""
+    boundary = _mime.make_boundary()
+    sep = linesep.encode("ascii")
+    delimiter = f"--{boundary}".encode("ascii")
+    yield _mime.params_header(
+        "Content-Type", f"multipart/{subtype}", {"boundary": boundary}, linesep=linesep
+    )
+    yield sep
+
+    for i, part in enumerate(parts):
+        yield (sep + delimiter + sep) if i else (delimiter + sep)
+        yield from part
+
+    yield sep + delimiter + b"--" + sep
+
 
 class _HTMLToText(html.parser.HTMLParser):
-    """Extract all text data from an HTML document. Used to create text content
-    for an email if only HTML content is given.
+    """Convert an HTML document to plain text. Used to create text content for
+    an email if only HTML content is given.
+
+    Block elements such as paragraphs, headings, and list items start new
+    lines. Link targets are shown after the link text. Whitespace is collapsed
+    except in ``<pre>`` elements. The content of ``<title>``, ``<script>``,
+    ``<style>``, and ``<template>`` elements is skipped. Nested lists continue
+    their parent list item without a blank line.
     """
 
     def __init__(self) -> None:
@@ -284,20 +552,185 @@ class _HTMLToText(html.parser.HTMLParser):
         self.data: list[str] = []
         """Accumulates the text parts extracted during parsing."""
 
+        self._skip = 0
+        self._pre = 0
+        self._newlines = 0
+        self._space = False
+        self._links: list[str | None] = []
+        self._list_depth = 0
+
     @classmethod
     def process(cls, html: str) -> str:
-        """Convert an HTML document into plain text.
+        """Convert an HTML document into plain text. The result is cached by a
+        hash of the HTML, so converting the same document again is fast.
 
         :param html: The HTML to convert.
         """
+        key = hashlib.sha256(html.encode("utf-8", "surrogatepass")).digest()
+
+        with _html_text_lock:
+            if (text := _html_text_cache.get(key)) is not None:
+                _html_text_cache.move_to_end(key)
+                return text
+
         parser = cls()
         parser.feed(html)
-        return parser.text
+        parser.close()
+        text = parser.text
+
+        with _html_text_lock:
+            _html_text_cache[key] = text
+
+            if len(_html_text_cache) > _HTML_TEXT_CACHE_SIZE:
+                _html_text_cache.popitem(last=False)
+
+        return text
 
     @property
     def text(self) -> str:
         """Join the text parts into a single string."""
         return "".join(self.data)
 
+    def _block(self, newlines: int) -> None:
+        """Start a new line before the next text, with blank lines between
+        paragraphs. Nothing is added at the start of the document.
+        """
+        if self.data:
+            self._newlines = max(self._newlines, newlines)
+
+    def _write(self, text: str) -> None:
+        if self._newlines:
+            self.data.append("\n" * self._newlines)
+            self._newlines = 0
+        elif self._space and self.data and not self.data[-1].endswith("\n"):
+            self.data.append(" ")
+
+        self._space = False
+        self.data.append(text)
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif self._skip:
+            return
+        elif tag == "br":
+            self.data.append("\n")
+            self._newlines = 0
+            self._space = False
+        elif tag in _PARAGRAPH_TAGS:
+            self._block(1 if tag in {"ul", "ol"} and self._list_depth else 2)
+
+            if tag == "pre":
+                self._pre += 1
+            elif tag in {"ul", "ol"}:
+                self._list_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self._block(1)
+
+            if tag == "li":
+                self._write("  " * max(self._list_depth - 1, 0) + "-")
+                self._space = True
+        elif tag == "a":
+            self._links.append(dict(attrs).get("href"))
+        elif tag == "img":
+            alt = dict(attrs).get("alt")
+
+            if alt:
+                self.handle_data(alt)
+        elif tag in {"td", "th"}:
+            self._space = True
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in _SKIP_TAGS:
+            self._skip = max(self._skip - 1, 0)
+        elif self._skip:
+            return
+        elif tag in _PARAGRAPH_TAGS:
+            if tag == "pre":
+                self._pre = max(self._pre - 1, 0)
+            elif tag in {"ul", "ol"}:
+                self._list_depth = max(self._list_depth - 1, 0)
+
+            self._block(1 if tag in {"ul", "ol"} and self._list_depth else 2)
+        elif tag in _BLOCK_TAGS:
+            self._block(1)
+        elif tag == "a" and self._links:
+            href = self._links.pop()
+
+            if href and not href.startswith(("#", "javascript:")):
+                target = href.removeprefix("mailto:")
+
+                if not self.data or target not in self.data[-1]:
+                    self._space = True
+                    self._write(f"({href})")
+
     def handle_data(self, data: str) -> None:
-        self.data.append(data)
+        if self._skip:
+            return
+
+        if self._pre:
+            self._write(data)
+            return
+
+        text = " ".join(data.split())
+
+        if data[:1].isspace():
+            self._space = True
+
+        if text:
+            self._write(text)
+            self._space = data[-1:].isspace()
+
+
+_SKIP_TAGS = frozenset({"title", "script", "style", "template"})
+"""Elements whose content is not shown as text. ``<head>`` isn't skipped, since
+its end tag may be omitted, but it contains no other text.
+"""
+
+_PARAGRAPH_TAGS = frozenset(
+    {
+        "blockquote",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+        "hr",
+        "ol",
+        "p",
+        "pre",
+        "table",
+        "ul",
+    }
+)
+"""Block elements separated from surrounding text by a blank line."""
+
+_BLOCK_TAGS = frozenset(
+    {
+        "address",
+        "article",
+        "aside",
+        "dd",
+        "div",
+        "dl",
+        "dt",
+        "figcaption",
+        "figure",
+        "footer",
+        "form",
+        "header",
+        "li",
+        "main",
+        "nav",
+        "section",
+        "tr",
+    }
+)
+"""Block elements that start on a new line."""
+
+_HTML_TEXT_CACHE_SIZE = 64
+"""Number of converted documents to keep in :meth:`_HTMLToText.process`."""
+
+_html_text_cache: OrderedDict[bytes, str] = OrderedDict()
+_html_text_lock = threading.Lock()
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import asyncio
+import collections.abc as cabc
+import contextlib
+import threading
+
+import pytest
+from smtp_server import SMTPServer
+
+
+@contextlib.contextmanager
+def run_smtp_server() -> cabc.Iterator[SMTPServer]:
+    """Run an :class:`SMTPServer` in a background thread until the block
+    exits.
+    """
+    server = SMTPServer()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def start() -> asyncio.Server:
+        return await asyncio.start_server(server.handle, server.host, 0)
+
+    aio_server = asyncio.run_coroutine_threadsafe(start(), loop).result()
+    server.port = aio_server.sockets[0].getsockname()[1]
+
+    try:
+        yield server
+    finally:
+
+        async def stop() -> None:
+            aio_server.close()
+            current = asyncio.current_task()
+
+            for task in asyncio.all_tasks():
+                if task is not current:
+                    task.cancel()
+
+        asyncio.run_coroutine_threadsafe(stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+@pytest.fixture
+def smtp_server() -> cabc.Iterator[SMTPServer]:
+    """Run an :class:`SMTPServer` in a background thread for the test."""
+    with run_smtp_server() as server:
+        yield server
+
+
+@pytest.fixture
+def smtp_servers() -> cabc.Iterator[list[SMTPServer]]:
+    """Run three :class:`SMTPServer` instances in background threads for the
+    test.
+    """
+    with contextlib.ExitStack() as stack:
+        yield [stack.enter_context(run_smtp_server()) for _ in range(3)]
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+from dataclasses import dataclass
+from dataclasses import field
+
+
+@dataclass
+class Envelope:
+    mail_from: str
+    rcpt_tos: list[str]
+    data: bytes
+
+
+@dataclass
+class SMTPServer:
+    """A minimal SMTP server running on a background event loop, enough to
+    exercise the SMTP handlers without a real server.
+    """
+
+    host: str = "127.0.0.1"
+    port: int = 0
+    extensions: list[str] = field(
+        default_factory=lambda: ["8BITMIME", "SMTPUTF8", "SIZE", "AUTH PLAIN LOGIN"]
+    )
+    messages: list[Envelope] = field(default_factory=list)
+    """Messages that were accepted."""
+    commands: list[str] = field(default_factory=list)
+    """Every command line received, across all connections."""
+    connections: int = 0
+    """Number of connections that were opened."""
+    logins: list[tuple[str, str]] = field(default_factory=list)
+    """Username and password for each successful ``AUTH``."""
+    reject: dict[str, int] = field(default_factory=dict)
+    """Map of recipient addresses to the code to reject them with."""
+    reject_once: dict[str, int] = field(default_factory=dict)
+    """Map of recipient addresses to the code to reject them with the next
+    time they're sent to. Accepted after that.
+    """
+    data_code: int = 250
+    """The code to reply with after receiving ``DATA``."""
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.connections += 1
+        writer.write(b"220 localhost ESMTP\r\n")
+        mail_from: str | None = None
+        rcpt_tos: list[str] = []
+        # With PIPELINING, replies from MAIL to DATA are held then sent together.
+        # A client that waits for each reply would time out.
+        pending: list[str] = []
+        holding = False
+
+        def reply(line: str) -> None:
+            pending.append(f"{line}\r\n")
+
+        async def flush() -> None:
+            writer.write("".join(pending).encode())
+            pending.clear()
+            await writer.drain()
+
+        try:
+            while line_bytes := await reader.readline():
+                line = line_bytes.decode().rstrip("\r\n")
+                self.commands.append(line)
+                name, _, args = line.partition(" ")
+                name = name.upper()
+
+                if name == "EHLO":
+                    lines = ["localhost", *self.extensions]
+                    reply("\r\n".join(f"250-{x}" for x in lines[:-1]))
+                    reply(f"250 {lines[-1]}")
+                elif name == "HELO":
+                    reply("250 localhost")
+                elif name == "AUTH":
+                    mechanism, _, token = args.partition(" ")
+
+                    if mechanism.upper() == "PLAIN":
+                        _, username, password = base64.b64decode(token).split(b"\0")
+                    else:
+                        reply("334 VXNlcm5hbWU6")
+                        await flush()
+                        username = base64.b64decode(await reader.readline())
+                        reply("334 UGFzc3dvcmQ6")
+                        await flush()
+                        password = base64.b64decode(await reader.readline())
+
+                    self.logins.append((username.decode(), password.decode()))
+                    reply("235 Authentication successful")
+                elif name == "MAIL":
+                    holding = "PIPELINING" in self.extensions
+                    mail_from = args[5:].partition(">")[0].lstrip("<")
+                    rcpt_tos = []
+                    reply("250 OK")
+                elif name == "RCPT":
+                    addr = args[3:].strip("<>")
+
+                    if addr in self.reject:
+                        reply(f"{self.reject[addr]} Rejected")
+                    elif addr in self.reject_once:
+                        reply(f"{self.reject_once.pop(addr)} Rejected")
+                    else:
+                        rcpt_tos.append(addr)
+                        reply("250 OK")
+                elif name == "DATA":
+                    holding = False
+
+                    if not rcpt_tos:
+                        reply("554 No valid recipients")
+                        await flush()
+                        continue
+
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await flush()
+                    lines_data: list[bytes] = []
+
+                    while (data_line := await reader.readline()) != b".\r\n":
+                        if data_line.startswith(b"."):
+                            data_line = data_line[1:]
+
+                        lines_data.append(data_line)
+
+                    if self.data_code == 250:
+                        assert mail_from is not None
+                        self.messages.append(
+                            Envelope(mail_from, rcpt_tos, b"".join(lines_data))
+                        )
+
+                    mail_from = None
+                    rcpt_tos = []
+                    reply(f"{self.data_code} Done")
+                elif name == "RSET":
+                    mail_from = None
+                    rcpt_tos = []
+                    reply("250 OK")
+                elif name == "NOOP":
+                    reply("250 OK")
+                elif name == "QUIT":
+                    reply("221 Bye")
+                    await flush()
+                    break
+                else:
+                    reply("502 Command not implemented")
+
+                if not holding:
+                    await flush()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
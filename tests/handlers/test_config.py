@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+from importlib.metadata import EntryPoint
+
 import pytest
 
+import email_simplified
 from email_simplified import get_handler_class
 from email_simplified import SMTPEmailHandler
 from email_simplified import TestEmailHandler
+from email_simplified.handlers import base
 from email_simplified.handlers import EmailHandler
 
 
@@ -34,3 +38,30 @@ def test_get_error() -> None:
 def test_from_config() -> None:
     handler = SMTPEmailHandler.from_config({"port": 1025})
     assert handler.port == 1025
+
+
+def test_get_entry_point_only_requested(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        base,
+        "_entry_points",
+        {
+            "smtp": EntryPoint(
+                "smtp",
+                "email_simplified.handlers.smtp:SMTPEmailHandler",
+                "email_simplified.handler",
+            ),
+            "broken": EntryPoint(
+                "broken", "missing:Handler", "email_simplified.handler"
+            ),
+        },
+    )
+    monkeypatch.setattr(base, "_handler_classes", {})
+    assert get_handler_class("smtp") is SMTPEmailHandler
+
+    with pytest.raises(ImportError):
+        get_handler_class("broken")
+
+
+def test_module_getattr_error() -> None:
+    with pytest.raises(AttributeError):
+        email_simplified.nothing  # noqa: B018
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+import time
+from email.message import EmailMessage
+
+import pytest
+from smtp_server import SMTPServer
+
+from email_simplified import Message
+from email_simplified import SMTPEmailHandler
+from email_simplified.handlers.failover import FailoverSMTPEmailHandler
+from email_simplified.handlers.failover import SMTPEndpoint
+from email_simplified.handlers.smtp import MessageResult
+from email_simplified.handlers.smtp import SMTPEvent
+
+
+def _closed_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]  # type: ignore[no-any-return]
+
+
+def _config(server: SMTPServer, weight: float = 1.0) -> dict[str, object]:
+    return {"host": server.host, "port": server.port, "weight": weight}
+
+
+def _deliver_sync_or_async(
+    handler: SMTPEmailHandler, messages: list[Message | EmailMessage], use_async: bool
+) -> list[MessageResult]:
+    if use_async:
+        return asyncio.run(handler.deliver_async(messages))
+
+    return handler.deliver(messages)
+
+
+def test_spread(smtp_servers: list[SMTPServer]) -> None:
+    handler = FailoverSMTPEmailHandler([_config(s) for s in smtp_servers])
+
+    for _ in range(30):
+        handler.send([Message(to=["a@example.test"])])
+
+    assert sum(len(s.messages) for s in smtp_servers) == 30
+    assert all(s.messages for s in smtp_servers)
+
+
+def test_weight(smtp_servers: list[SMTPServer]) -> None:
+    handler = FailoverSMTPEmailHandler(
+        [_config(smtp_servers[0], 1000), _config(smtp_servers[1], 0.001)]
+    )
+
+    for _ in range(5):
+        handler.send([Message(to=["a@example.test"])])
+
+    assert len(smtp_servers[0].messages) == 5
+
+
+def test_weight_error() -> None:
+    with pytest.raises(ValueError):
+        SMTPEndpoint(SMTPEmailHandler(), 0)
+
+
+def test_no_endpoints() -> None:
+    with pytest.raises(ValueError):
+        FailoverSMTPEmailHandler([])
+
+
+def test_resolver() -> None:
+    """Resolved hosts would replace the endpoint, so a resolver is rejected."""
+    with pytest.raises(ValueError, match="resolver"):
+        FailoverSMTPEmailHandler([SMTPEmailHandler()], resolver=lambda domain: None)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_connect_failover(smtp_server: SMTPServer, use_async: bool) -> None:
+    down = SMTPEndpoint(SMTPEmailHandler(host="127.0.0.1", port=_closed_port()), 1000)
+    handler = FailoverSMTPEmailHandler(
+        [down, {"host": smtp_server.host, "port": smtp_server.port}], probe=False
+    )
+    message = Message(to=["a@example.test"])
+
+    if use_async:
+        asyncio.run(handler.send_async([message]))
+    else:
+        handler.send([message])
+
+    assert len(smtp_server.messages) == 1
+    assert not down.healthy
+    assert handler.endpoints[1].healthy
+
+
+def test_all_down() -> None:
+    handler = FailoverSMTPEmailHandler(
+        [{"host": "127.0.0.1", "port": _closed_port()} for _ in range(2)], probe=False
+    )
+
+    with pytest.raises(OSError):
+        handler.send([Message(to=["a@example.test"])])
+
+    assert not any(e.healthy for e in handler.endpoints)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_retry_elsewhere(smtp_servers: list[SMTPServer], use_async: bool) -> None:
+    smtp_servers[0].reject["a@example.test"] = 451
+    handler = FailoverSMTPEmailHandler(
+        [_config(smtp_servers[0], 1000), _config(smtp_servers[1], 0.001)],
+        failure_threshold=1,
+        probe=False,
+        retries=1,
+        retry_backoff=0,
+    )
+    (result,) = _deliver_sync_or_async(
+        handler, [Message(to=["a@example.test"])], use_async
+    )
+    assert result.accepted
+    assert result.recipients[0].attempts == 2
+    assert not smtp_servers[0].messages
+    assert len(smtp_servers[1].messages) == 1
+    assert not handler.endpoints[0].healthy
+
+
+def test_failure_threshold(smtp_server: SMTPServer) -> None:
+    smtp_server.reject["a@example.test"] = 451
+    handler = FailoverSMTPEmailHandler(
+        [_config(smtp_server)], failure_threshold=2, probe=False
+    )
+    endpoint = handler.endpoints[0]
+    handler.deliver([Message(to=["a@example.test"])])
+    assert endpoint.healthy
+    assert endpoint.failures == 1
+    handler.deliver([Message(to=["a@example.test"])])
+    assert not endpoint.healthy
+
+
+def test_permanent_failure(smtp_server: SMTPServer) -> None:
+    smtp_server.reject["a@example.test"] = 550
+    handler = FailoverSMTPEmailHandler(
+        [_config(smtp_server)], failure_threshold=1, probe=False
+    )
+    handler.deliver([Message(to=["a@example.test"])])
+    assert handler.endpoints[0].healthy
+
+
+def test_success_resets(smtp_server: SMTPServer) -> None:
+    smtp_server.reject_once["a@example.test"] = 451
+    handler = FailoverSMTPEmailHandler(
+        [_config(smtp_server)], failure_threshold=2, probe=False
+    )
+    endpoint = handler.endpoints[0]
+    handler.deliver([Message(to=["a@example.test"])])
+    assert endpoint.failures == 1
+    handler.deliver([Message(to=["a@example.test"])])
+    assert endpoint.failures == 0
+
+
+def test_probe(smtp_server: SMTPServer) -> None:
+    smtp_server.reject["a@example.test"] = 451
+    handler = FailoverSMTPEmailHandler(
+        [_config(smtp_server)], failure_threshold=1, cooldown=0.05
+    )
+    endpoint = handler.endpoints[0]
+    handler.deliver([Message(to=["a@example.test"])])
+    assert not endpoint.healthy
+    deadline = time.monotonic() + 5
+
+    while not endpoint.healthy and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert endpoint.healthy
+    assert "noop" in smtp_server.commands
+    handler.close()
+
+
+def test_probe_after_close() -> None:
+    handler = FailoverSMTPEmailHandler([{"host": "127.0.0.1", "port": _closed_port()}])
+    handler.close()
+
+    with pytest.raises(OSError):
+        handler.send([Message(to=["a@example.test"])])
+
+    # The failure doesn't start a probe thread on the closed handler.
+    assert not handler.endpoints[0].healthy
+    assert handler._probe_thread is None  # pyright: ignore
+
+
+def test_listeners(smtp_server: SMTPServer) -> None:
+    events: list[SMTPEvent] = []
+    endpoint = SMTPEmailHandler(host=smtp_server.host, port=smtp_server.port)
+    FailoverSMTPEmailHandler([endpoint], listeners=[events.append], probe=False)
+    handler = FailoverSMTPEmailHandler(
+        [endpoint], listeners=[events.append], probe=False
+    )
+    # The endpoint handler that was passed in isn't changed.
+    assert endpoint.listeners == []
+    handler.send([Message(to=["a@example.test"])])
+    assert [e.phase for e in events].count("connect") == 1
+
+
+def test_half_open(smtp_servers: list[SMTPServer]) -> None:
+    smtp_servers[0].reject_once["a@example.test"] = 451
+    handler = FailoverSMTPEmailHandler(
+        [_config(smtp_servers[0], 1000), _config(smtp_servers[1], 0.001)],
+        failure_threshold=1,
+        cooldown=0,
+        probe=False,
+    )
+    endpoint = handler.endpoints[0]
+    handler.deliver([Message(to=["a@example.test"])])
+    assert not endpoint.healthy
+    # After the cooldown, the next connection tries the endpoint again.
+    handler.send([Message(to=["a@example.test"])])
+    assert endpoint.healthy
+    assert len(smtp_servers[0].messages) == 1
+
+
+def test_from_config(smtp_servers: list[SMTPServer]) -> None:
+    handler = FailoverSMTPEmailHandler.from_config(
+        {
+            "endpoints": [_config(smtp_servers[0], 2), _config(smtp_servers[1])],
+            "failure_threshold": 5,
+            "cooldown": 10,
+            "probe": False,
+            "retries": 2,
+        }
+    )
+    assert [e.weight for e in handler.endpoints] == [2, 1]
+    assert handler.endpoints[0].handler.port == smtp_servers[0].port
+    assert handler.failure_threshold == 5
+    assert handler.cooldown == 10
+    assert not handler.probe
+    assert handler.retries == 2
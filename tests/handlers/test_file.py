@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import mailbox
+from email.message import EmailMessage
+from pathlib import Path
+
+import pytest
+
+from email_simplified import Attachment
+from email_simplified import get_handler_class
+from email_simplified import Message
+from email_simplified.handlers.file import _write_mbox
+from email_simplified.handlers.file import FileEmailHandler
+from email_simplified.handlers.file import MaildirEmailHandler
+from email_simplified.handlers.file import MboxEmailHandler
+
+
+def _messages(count: int) -> list[Message | EmailMessage]:
+    return [
+        Message(subject=str(i), to=["a@example.test"], text=f"From here {i}\n")
+        for i in range(count)
+    ]
+
+
+def _sorted_subjects(paths: list[Path]) -> list[str]:
+    return sorted(
+        (Message.from_bytes(p.read_bytes()).subject or "" for p in paths), key=int
+    )
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_file(tmp_path: Path, use_async: bool) -> None:
+    handler = FileEmailHandler(tmp_path, workers=3)
+
+    if use_async:
+        asyncio.run(handler.send_async(_messages(10)))
+    else:
+        handler.send(_messages(10))
+
+    paths = sorted(tmp_path.glob("*.eml"))
+    assert _sorted_subjects(paths) == [str(i) for i in range(10)]
+    assert not list((tmp_path / ".tmp").iterdir())
+
+
+def test_file_linesep(tmp_path: Path) -> None:
+    FileEmailHandler(tmp_path, linesep="\r\n").send(_messages(1))
+    (path,) = tmp_path.glob("*.eml")
+    data = path.read_bytes()
+    assert b"\r\n" in data
+    assert b"\n" not in data.replace(b"\r\n", b"")
+
+
+def test_file_mime(tmp_path: Path) -> None:
+    message = EmailMessage()
+    message["Subject"] = "a"
+    message.set_content("b")
+    FileEmailHandler(tmp_path, fsync=False).send([message])
+    (path,) = tmp_path.glob("*.eml")
+    assert b"Subject: a\n" in path.read_bytes()
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_error_writes_nothing(tmp_path: Path, use_async: bool) -> None:
+    handler = FileEmailHandler(tmp_path, workers=2)
+    messages = _messages(4)
+    # The bad message fails while it's being serialized, after others are written.
+    messages.append(Message(attachments=[Attachment(tmp_path / "missing")]))
+
+    with pytest.raises(OSError):
+        if use_async:
+            asyncio.run(handler.send_async(messages))
+        else:
+            handler.send(messages)
+
+    assert not list(tmp_path.glob("*.eml"))
+    assert not list((tmp_path / ".tmp").iterdir())
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_maildir(tmp_path: Path, use_async: bool) -> None:
+    handler = MaildirEmailHandler(tmp_path / "mail", workers=4)
+
+    if use_async:
+        asyncio.run(handler.send_async(_messages(10)))
+    else:
+        handler.send(_messages(10))
+
+    box = mailbox.Maildir(tmp_path / "mail", create=False)
+    assert sorted((m["subject"] for m in box), key=int) == [str(i) for i in range(10)]
+    assert not list((tmp_path / "mail" / "tmp").iterdir())
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_mbox(tmp_path: Path, use_async: bool) -> None:
+    path = tmp_path / "mail.mbox"
+    handler = MboxEmailHandler(path)
+
+    for start in (0, 5):
+        messages = _messages(10)[start : start + 5]
+
+        if use_async:
+            asyncio.run(handler.send_async(messages))
+        else:
+            handler.send(messages)
+
+    box = mailbox.mbox(path, create=False)
+
+    try:
+        # Messages are appended in order, and lines starting with From quoted.
+        assert [m["subject"] for m in box] == [str(i) for i in range(10)]
+    finally:
+        box.close()
+
+    assert b"\n>From here 0\n" in path.read_bytes()
+
+
+def test_mbox_split_chunks(tmp_path: Path) -> None:
+    path = tmp_path / "mail.mbox"
+
+    with path.open("wb") as f:
+        _write_mbox(f, [b"Subject: a\n\nFr", b"om here\nFrom", b" there"])
+
+    data = path.read_bytes()
+    assert data.endswith(b"\n\n>From here\n>From there\n\n")
+
+
+@pytest.mark.parametrize(
+    ("name", "key"), [("file", "directory"), ("maildir", "directory"), ("mbox", "path")]
+)
+def test_from_config(tmp_path: Path, name: str, key: str) -> None:
+    cls = get_handler_class(
+        {
+            "file": "email_simplified.handlers.file:FileEmailHandler",
+            "maildir": "email_simplified.handlers.file:MaildirEmailHandler",
+            "mbox": "email_simplified.handlers.file:MboxEmailHandler",
+        }[name]
+    )
+    handler = cls.from_config({key: tmp_path / name, "fsync": False})
+    assert handler.fsync is False  # type: ignore[attr-defined]
+    handler.send(_messages(1))
+    assert (tmp_path / name).exists()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import asyncio
+import collections.abc as cabc
+from unittest.mock import patch
+
+import pytest
+
+from email_simplified.handlers.rate_limit import TokenBucket
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> cabc.Iterator[Clock]:
+    clock = Clock()
+
+    with patch("time.monotonic", clock):
+        yield clock
+
+
+def test_reserve(clock: Clock) -> None:
+    bucket = TokenBucket(2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0.5
+    # Later callers wait behind earlier reservations.
+    assert bucket.reserve() == 1
+    clock.now = 1.0
+    assert bucket.reserve() == 0.5
+
+
+def test_reserve_burst(clock: Clock) -> None:
+    bucket = TokenBucket(1, 60, burst=3)
+    assert [bucket.reserve() for _ in range(4)] == [0, 0, 0, 60]
+    # Idle time doesn't save up more than the burst.
+    clock.now = 1000
+    assert [bucket.reserve() for _ in range(4)] == [0, 0, 0, 60]
+
+
+def test_reserve_large(clock: Clock) -> None:
+    bucket = TokenBucket(10)
+    assert bucket.reserve(30) == 2
+
+
+def test_invalid() -> None:
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_acquire(clock: Clock) -> None:
+    bucket = TokenBucket(1)
+
+    with patch("time.sleep") as sleep:
+        bucket.acquire()
+        sleep.assert_not_called()
+        bucket.acquire()
+        sleep.assert_called_once_with(1)
+
+
+def test_acquire_async(clock: Clock) -> None:
+    bucket = TokenBucket(1)
+
+    with patch("asyncio.sleep") as sleep:
+        asyncio.run(bucket.acquire_async(2))
+        sleep.assert_called_once_with(1)
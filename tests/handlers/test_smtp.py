@@ -1,13 +1,43 @@
 from __future__ import annotations
 
 import asyncio
+import collections.abc as cabc
+import socket
+import threading
+from email.headerregistry import Address
+from email.message import EmailMessage
 from smtplib import SMTP
+from smtplib import SMTPNotSupportedError
+from smtplib import SMTPRecipientsRefused
+from smtplib import SMTPServerDisconnected
 from unittest.mock import create_autospec
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
+import pytest
+from smtp_server import SMTPServer
+
+from email_simplified import address
 from email_simplified import Message
 from email_simplified import SMTPEmailHandler
+from email_simplified.address import set_address_cache_size
+from email_simplified.handlers import smtp
+from email_simplified.handlers.rate_limit import TokenBucket
+from email_simplified.handlers.smtp import MessageResult
+from email_simplified.handlers.smtp import SMTPEvent
+from email_simplified.handlers.smtp import SMTPSendError
+from email_simplified.handlers.smtp import SMTPStats
+
+
+def _mock_client() -> MagicMock:
+    client = create_autospec(SMTP, instance=True)
+    client.rset.return_value = (250, b"OK")
+    client.has_extn.return_value = False
+    client.mail.return_value = (250, b"OK")
+    client.rcpt.return_value = (250, b"OK")
+    client.docmd.return_value = (354, b"OK")
+    client.getreply.return_value = (250, b"OK")
+    return client  # type: ignore[no-any-return]
 
 
 def test_tls_port() -> None:
@@ -69,17 +99,19 @@ def test_connect_tls(smtp_ssl_cls: MagicMock) -> None:
 
 @patch.object(SMTPEmailHandler, "connect")
 def test_send(connect: MagicMock) -> None:
-    ctx = create_autospec(SMTP, instance=True)
+    ctx = _mock_client()
     connect.return_value.__enter__.return_value = ctx
     handler = SMTPEmailHandler()
     handler.send(
         [
-            Message(subject="a"),
-            Message(subject="b", from_addr="a@example.test").to_mime(),
+            Message(subject="a", to=["a@example.test"]),
+            Message(
+                subject="b", from_addr="a@example.test", to=["a@example.test"]
+            ).to_mime(),
         ]
     )
     connect.assert_called()
-    assert ctx.send_message.call_count == 2
+    assert ctx.mail.call_count == 2
 
 
 @patch.object(SMTPEmailHandler, "connect")
@@ -91,30 +123,947 @@ def test_send_empty(connect: MagicMock) -> None:
 
 @patch.object(SMTPEmailHandler, "connect")
 def test_send_batch(connect: MagicMock) -> None:
-    ctx = create_autospec(SMTP, instance=True)
+    ctx = _mock_client()
     connect.return_value.__enter__.return_value = ctx
     handler = SMTPEmailHandler(recipients_per_message=4)
-    handler.send([Message(subject="a", to=[f"a{x}@example.test" for x in range(10)])])
-    assert ctx.send_message.call_count == 3
+    message = Message(subject="a", to=[f"a{x}@example.test" for x in range(10)])
+
+    with patch.object(handler, "_prepare", wraps=handler._prepare) as prepare:
+        handler.send([message])
+
+    assert ctx.mail.call_count == 3
+    assert ctx.rcpt.call_count == 10
+    # The message is serialized once and reused for every batch.
+    prepare.assert_called_once()
 
 
 @patch.object(SMTPEmailHandler, "connect")
-def test_send_async(connect: MagicMock) -> None:
-    ctx = create_autospec(SMTP, instance=True)
+def test_send_refused_keeps_connection(connect: MagicMock) -> None:
+    ctx = _mock_client()
+    ctx.mail.side_effect = [(550, b"no"), (250, b"OK")]
     connect.return_value.__enter__.return_value = ctx
-    handler = SMTPEmailHandler()
-    asyncio.run(handler.send_async([Message(subject="a")]))
-    connect.assert_called()
-    assert ctx.send_message.call_count == 1
+    handler = SMTPEmailHandler(max_connections=1)
+
+    with pytest.raises(SMTPSendError) as exc_info:
+        handler.send(
+            [
+                Message(subject="a", to=["a@example.test"]),
+                Message(subject="b", to=["a@example.test"]),
+            ]
+        )
+
+    assert [f.position for f in exc_info.value.failures] == [0]
+    # The transaction was reset, so the next message uses the same connection.
+    ctx.rset.assert_called_once()
+    connect.assert_called_once()
+
+
+def test_send_bcc_stripped(smtp_server: SMTPServer) -> None:
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, recipients_per_message=2
+    )
+    message = Message(
+        subject="a",
+        from_addr="a@example.test",
+        to=["b@example.test"],
+        bcc=["c@example.test", "d@example.test"],
+    )
+    handler.send([message])
+    assert [m.rcpt_tos for m in smtp_server.messages] == [
+        ["b@example.test", "c@example.test"],
+        ["d@example.test"],
+    ]
+    assert all(b"Bcc" not in m.data for m in smtp_server.messages)
+    assert smtp_server.messages[0].data == smtp_server.messages[1].data
+
+
+def test_send_async(smtp_server: SMTPServer) -> None:
+    handler = SMTPEmailHandler(host=smtp_server.host, port=smtp_server.port)
+    asyncio.run(
+        handler.send_async(
+            [Message(subject="a", from_addr="a@example.test", to=["b@example.test"])]
+        )
+    )
+    assert len(smtp_server.messages) == 1
+    envelope = smtp_server.messages[0]
+    assert envelope.mail_from == "a@example.test"
+    assert envelope.rcpt_tos == ["b@example.test"]
+    assert b"Subject: a\r\n" in envelope.data
+    assert smtp_server.commands[-1] == "QUIT"
+
+
+def test_send_async_empty(smtp_server: SMTPServer) -> None:
+    handler = SMTPEmailHandler(host=smtp_server.host, port=smtp_server.port)
+    asyncio.run(handler.send_async([]))
+    assert smtp_server.connections == 0
+
+
+def test_send_async_batch(smtp_server: SMTPServer) -> None:
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, recipients_per_message=4
+    )
+    message = Message(
+        subject="a",
+        to=["a@example.test"],
+        bcc=[f"b{x}@example.test" for x in range(9)],
+    )
+    asyncio.run(handler.send_async([message]))
+    assert [len(m.rcpt_tos) for m in smtp_server.messages] == [4, 4, 2]
+    assert all(b"b0@" not in m.data for m in smtp_server.messages)
+
+
+def test_send_async_default_from(smtp_server: SMTPServer) -> None:
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, default_from="d@example.test"
+    )
+    message = Message(subject="a", to=["a@example.test"])
+    asyncio.run(handler.send_async([message]))
+    assert str(message.from_addr) == "d@example.test"
+    assert smtp_server.messages[0].mail_from == "d@example.test"
+
+
+@pytest.mark.parametrize("auth", ["AUTH PLAIN LOGIN", "AUTH LOGIN"])
+def test_send_async_login(smtp_server: SMTPServer, auth: str) -> None:
+    smtp_server.extensions = [auth]
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, username="u", password="p"
+    )
+    asyncio.run(handler.send_async([Message(subject="a", to=["a@example.test"])]))
+    assert smtp_server.logins == [("u", "p")]
+
+
+def test_send_async_refused(smtp_server: SMTPServer) -> None:
+    smtp_server.reject["b@example.test"] = 550
+    handler = SMTPEmailHandler(host=smtp_server.host, port=smtp_server.port)
+    message = Message(subject="a", to=["a@example.test", "b@example.test"])
+    asyncio.run(handler.send_async([message]))
+    assert smtp_server.messages[0].rcpt_tos == ["a@example.test"]
+
+    with pytest.raises(SMTPRecipientsRefused):
+        asyncio.run(handler.send_async([Message(subject="b", to=["b@example.test"])]))
+
+
+def test_send_async_smtputf8(smtp_server: SMTPServer) -> None:
+    handler = SMTPEmailHandler(host=smtp_server.host, port=smtp_server.port)
+    message = Message(subject="a", to=["あ@example.test"])
+    asyncio.run(handler.send_async([message]))
+    assert "SMTPUTF8" in smtp_server.commands[-4]
+    smtp_server.extensions = []
+
+    with pytest.raises(SMTPNotSupportedError):
+        asyncio.run(handler.send_async([message]))
+
+
+def test_send_async_concurrent(smtp_server: SMTPServer) -> None:
+    handler = SMTPEmailHandler(host=smtp_server.host, port=smtp_server.port)
+
+    async def send_all() -> None:
+        await asyncio.gather(
+            *(
+                handler.send_async([Message(subject=str(x), to=["a@example.test"])])
+                for x in range(20)
+            )
+        )
+
+    asyncio.run(send_all())
+    assert len(smtp_server.messages) == 20
+    assert smtp_server.connections == 20
 
 
 @patch.object(SMTPEmailHandler, "connect")
 def test_set_message_from(connect: MagicMock) -> None:
-    ctx = create_autospec(SMTP, instance=True)
+    ctx = _mock_client()
     connect.return_value.__enter__.return_value = ctx
     handler = SMTPEmailHandler(default_from="default@example.test")
-    message1 = Message(subject="a")
-    message2 = Message(subject="b", from_addr="b@example.test")
+    message1 = Message(subject="a", to=["a@example.test"])
+    message2 = Message(subject="b", from_addr="b@example.test", to=["a@example.test"])
     handler.send([message1, message2])
     assert str(message1.from_addr) == "default@example.test"
     assert str(message2.from_addr) == "b@example.test"
+
+
+@patch.object(SMTPEmailHandler, "open")
+def test_pool_reuse(open_: MagicMock) -> None:
+    client = _mock_client()
+    open_.return_value = client
+    handler = SMTPEmailHandler(pool_size=1)
+    handler.send([Message(subject="a", to=["a@example.test"])])
+    handler.send([Message(subject="b", to=["a@example.test"])])
+    assert open_.call_count == 1
+    client.rset.assert_called_once()
+    client.quit.assert_not_called()
+    assert client.mail.call_count == 2
+    handler.close()
+    client.quit.assert_called_once()
+
+
+@patch.object(SMTPEmailHandler, "open")
+def test_pool_release_after_close(open_: MagicMock) -> None:
+    client = _mock_client()
+    open_.return_value = client
+    handler = SMTPEmailHandler(pool_size=1)
+    assert handler.pool is not None
+    conn = handler.pool.acquire()
+    handler.close()
+    client.quit.assert_not_called()
+    handler.pool.release(conn)
+    client.quit.assert_called_once()
+    assert not handler.pool._idle  # pyright: ignore
+
+
+@patch.object(SMTPEmailHandler, "open")
+def test_pool_unhealthy(open_: MagicMock) -> None:
+    client = _mock_client()
+    client.rset.return_value = (421, b"closing")
+    open_.return_value = client
+    handler = SMTPEmailHandler(pool_size=1)
+    handler.send([Message(subject="a", to=["a@example.test"])])
+    handler.send([Message(subject="b", to=["a@example.test"])])
+    assert open_.call_count == 2
+
+
+@patch.object(SMTPEmailHandler, "open")
+def test_pool_idle_timeout(open_: MagicMock) -> None:
+    client = _mock_client()
+    open_.return_value = client
+    handler = SMTPEmailHandler(pool_size=1, pool_idle_timeout=5)
+    handler.send([Message(subject="a", to=["a@example.test"])])
+    assert handler.pool is not None
+    handler.pool._idle[0].last_used -= 10  # pyright: ignore
+    handler.send([Message(subject="b", to=["a@example.test"])])
+    assert open_.call_count == 2
+    client.rset.assert_not_called()
+
+
+@patch.object(SMTPEmailHandler, "open")
+def test_pool_max_messages(open_: MagicMock) -> None:
+    open_.side_effect = lambda: _mock_client()
+    handler = SMTPEmailHandler(pool_size=1, pool_max_messages=2)
+    handler.send(
+        [
+            Message(subject="a", to=["a@example.test"]),
+            Message(subject="b", to=["a@example.test"]),
+            Message(subject="c", to=["a@example.test"]),
+        ]
+    )
+    assert open_.call_count == 2
+    handler.send([Message(subject="d", to=["a@example.test"])])
+    assert open_.call_count == 2
+    handler.send([Message(subject="e", to=["a@example.test"])])
+    assert open_.call_count == 3
+
+
+@patch.object(SMTPEmailHandler, "open")
+def test_pool_max_messages_batches(open_: MagicMock) -> None:
+    """A message sent in several batches counts once toward the limit."""
+    open_.side_effect = lambda: _mock_client()
+    handler = SMTPEmailHandler(
+        pool_size=1, pool_max_messages=2, recipients_per_message=1
+    )
+    to: list[str | Address] = ["a@example.test", "b@example.test", "c@example.test"]
+    handler.send([Message(subject="a", to=to), Message(subject="b", to=to)])
+    assert open_.call_count == 1
+    handler.send([Message(subject="c", to=to)])
+    assert open_.call_count == 2
+
+
+@patch.object(SMTPEmailHandler, "open")
+def test_pool_error_discards(open_: MagicMock) -> None:
+    client = _mock_client()
+    client.mail.side_effect = SMTPServerDisconnected()
+    open_.return_value = client
+
+    handler = SMTPEmailHandler(pool_size=1)
+
+    with pytest.raises(SMTPServerDisconnected):
+        handler.send([Message(subject="a", to=["a@example.test"])])
+
+    client.quit.assert_called_once()
+    client.mail.side_effect = None
+    handler.send([Message(subject="b", to=["a@example.test"])])
+    assert open_.call_count == 2
+
+
+@patch.object(SMTPEmailHandler, "open")
+def test_pool_threads(open_: MagicMock) -> None:
+    open_.side_effect = lambda: _mock_client()
+    handler = SMTPEmailHandler(pool_size=2)
+    threads = [
+        threading.Thread(
+            target=handler.send, args=([Message(subject="a", to=["a@example.test"])],)
+        )
+        for _ in range(8)
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert 1 <= open_.call_count <= 2
+
+
+def test_pool_from_config() -> None:
+    handler = SMTPEmailHandler.from_config(
+        {"pool_size": 2, "pool_idle_timeout": 30, "pool_max_messages": 100}
+    )
+    assert handler.pool is not None
+    assert handler.pool.size == 2
+    assert handler.pool.idle_timeout == 30
+    assert handler.pool.max_messages == 100
+
+
+def test_pool_size_invalid() -> None:
+    with pytest.raises(ValueError):
+        SMTPEmailHandler(pool_size=0)
+
+
+def test_send_concurrent(smtp_server: SMTPServer) -> None:
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, max_connections=4
+    )
+    handler.send([Message(subject=str(x), to=["a@example.test"]) for x in range(20)])
+    assert len(smtp_server.messages) == 20
+    assert 1 <= smtp_server.connections <= 4
+
+
+def test_send_concurrent_failures(smtp_server: SMTPServer) -> None:
+    smtp_server.reject["b@example.test"] = 550
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, max_connections=3
+    )
+    messages: list[Message | EmailMessage] = [
+        Message(subject=str(x), to=["b@example.test" if x % 3 else "a@example.test"])
+        for x in range(9)
+    ]
+
+    with pytest.raises(SMTPSendError) as exc_info:
+        handler.send(messages)
+
+    failures = exc_info.value.failures
+    assert [f.position for f in failures] == [1, 2, 4, 5, 7, 8]
+    assert all(f.message is messages[f.position] for f in failures)
+    assert all(isinstance(f.error, SMTPRecipientsRefused) for f in failures)
+    assert all(0 <= f.connection < 3 for f in failures)
+    assert len(smtp_server.messages) == 3
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_send_concurrent_single_failure(
+    smtp_server: SMTPServer, use_async: bool
+) -> None:
+    """With max_connections, one message fails with the same error type as a
+    list of messages.
+    """
+    smtp_server.reject["b@example.test"] = 550
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, max_connections=3
+    )
+
+    with pytest.raises(SMTPSendError) as exc_info:
+        _send_sync_or_async(
+            handler, [Message(subject="a", to=["b@example.test"])], use_async
+        )
+
+    (failure,) = exc_info.value.failures
+    assert failure.position == 0
+    assert isinstance(failure.error, SMTPRecipientsRefused)
+
+
+def test_send_concurrent_connect_error() -> None:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    handler = SMTPEmailHandler(host="127.0.0.1", port=port, max_connections=2)
+
+    with pytest.raises(SMTPSendError) as exc_info:
+        handler.send(
+            [
+                Message(subject="a", to=["a@example.test"]),
+                Message(subject="b", to=["a@example.test"]),
+            ]
+        )
+
+    assert len(exc_info.value.failures) == 2
+    assert all(isinstance(f.error, OSError) for f in exc_info.value.failures)
+
+
+def test_send_concurrent_preserve_order(smtp_server: SMTPServer) -> None:
+    handler = SMTPEmailHandler(
+        host=smtp_server.host,
+        port=smtp_server.port,
+        max_connections=4,
+        preserve_order=True,
+    )
+    handler.send(
+        [Message(subject=f"{x:02}", to=[f"{x % 3}@example.test"]) for x in range(30)]
+    )
+
+    for x in range(3):
+        received = [
+            m.data for m in smtp_server.messages if m.rcpt_tos == [f"{x}@example.test"]
+        ]
+        assert received == sorted(received)
+        assert len(received) == 10
+
+
+def test_send_concurrent_pool(smtp_server: SMTPServer) -> None:
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, max_connections=2, pool_size=2
+    )
+    handler.send([Message(subject="a", to=["a@example.test"])] * 4)
+    handler.send([Message(subject="a", to=["a@example.test"])] * 4)
+    handler.close()
+    assert len(smtp_server.messages) == 8
+    assert 1 <= smtp_server.connections <= 2
+
+
+def test_send_async_concurrent_connections(smtp_server: SMTPServer) -> None:
+    smtp_server.reject["b@example.test"] = 550
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, max_connections=3
+    )
+    messages: list[Message | EmailMessage] = [
+        Message(subject=str(x), to=["a@example.test"]) for x in range(10)
+    ]
+    messages.append(Message(subject="b", to=["b@example.test"]))
+
+    with pytest.raises(SMTPSendError) as exc_info:
+        asyncio.run(handler.send_async(messages))
+
+    assert [f.position for f in exc_info.value.failures] == [10]
+    assert len(smtp_server.messages) == 10
+    assert smtp_server.connections == 3
+
+
+def _send_sync_or_async(
+    handler: SMTPEmailHandler, messages: list[Message | EmailMessage], use_async: bool
+) -> None:
+    if use_async:
+        asyncio.run(handler.send_async(messages))
+    else:
+        handler.send(messages)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_pipelining(smtp_server: SMTPServer, use_async: bool) -> None:
+    # The server holds replies until DATA, a client that waits for each reply
+    # would time out.
+    smtp_server.extensions.append("PIPELINING")
+    smtp_server.reject["c@example.test"] = 550
+    handler = SMTPEmailHandler(host=smtp_server.host, port=smtp_server.port, timeout=5)
+    message = Message(
+        subject="a",
+        from_addr="a@example.test",
+        to=["b@example.test", "c@example.test"],
+        bcc=["d@example.test"],
+    )
+    _send_sync_or_async(handler, [message], use_async)
+    assert smtp_server.messages[0].rcpt_tos == ["b@example.test", "d@example.test"]
+    assert smtp_server.commands[1:6] == [
+        "MAIL FROM:<a@example.test> SIZE=" + smtp_server.commands[1].rpartition("=")[2],
+        "RCPT TO:<b@example.test>",
+        "RCPT TO:<c@example.test>",
+        "RCPT TO:<d@example.test>",
+        "DATA",
+    ]
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_pipelining_all_refused(smtp_server: SMTPServer, use_async: bool) -> None:
+    smtp_server.extensions.append("PIPELINING")
+    smtp_server.reject["c@example.test"] = 550
+    handler = SMTPEmailHandler(host=smtp_server.host, port=smtp_server.port, timeout=5)
+    good = Message(subject="a", from_addr="a@example.test", to=["b@example.test"])
+    bad = Message(subject="b", from_addr="a@example.test", to=["c@example.test"])
+
+    with pytest.raises(SMTPRecipientsRefused) as exc_info:
+        _send_sync_or_async(handler, [good, bad], use_async)
+
+    assert exc_info.value.recipients == {"c@example.test": (550, b"Rejected")}
+    assert len(smtp_server.messages) == 1
+    assert "RSET" in [c.upper() for c in smtp_server.commands]
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_send_large(smtp_server: SMTPServer, use_async: bool) -> None:
+    """A message larger than the spool and chunk size is streamed, and lines
+    starting with a period are escaped across chunk boundaries.
+    """
+    text = ".a\n" * 500_000
+    handler = SMTPEmailHandler(host=smtp_server.host, port=smtp_server.port, timeout=5)
+    message = Message(text=text, from_addr="a@example.test", to=["b@example.test"])
+    _send_sync_or_async(handler, [message], use_async)
+    data = smtp_server.messages[0].data
+    assert data == b"".join(message.iter_bytes(include_bcc=False))
+    size = int(smtp_server.commands[1].rpartition("=")[2])
+    assert size == len(data)
+
+
+def test_listeners(smtp_server: SMTPServer) -> None:
+    events: list[SMTPEvent] = []
+    handler = SMTPEmailHandler(
+        host=smtp_server.host,
+        port=smtp_server.port,
+        username="a",
+        password="b",
+        recipients_per_message=1,
+        listeners=[events.append],
+    )
+    message = Message(
+        from_addr="a@example.test", to=["b@example.test", "c@example.test"]
+    )
+    handler.send([message, message])
+    assert [(e.phase, e.message) for e in events] == [
+        ("dns", None),
+        ("connect", None),
+        ("ehlo", None),
+        ("auth", None),
+        *[
+            (phase, i)
+            for i in range(2)
+            for phase in ("prepare", "envelope", "data", "envelope", "data")
+        ],
+    ]
+    assert {e.connection for e in events} == {0}
+    assert all(e.duration >= 0 for e in events)
+    size = len(smtp_server.messages[0].data)
+    assert [e.size for e in events if e.phase == "data"] == [size] * 4
+
+
+def test_listeners_sockaddr() -> None:
+    """Each resolved address is connected to as is, keeping the IPv6 flow info
+    and scope ID, until one succeeds.
+    """
+    events: list[SMTPEvent] = []
+    infos = [
+        (socket.AF_INET6, socket.SOCK_STREAM, 6, "", ("fe80::1", 25, 0, 1)),
+        (socket.AF_INET6, socket.SOCK_STREAM, 6, "", ("fe80::2", 25, 3, 2)),
+    ]
+    socks = [MagicMock(), MagicMock()]
+    socks[0].connect.side_effect = ConnectionRefusedError
+    client = smtp._TimedSMTP(timer=smtp._Timer([events.append], 0))
+
+    with (
+        patch.object(socket, "getaddrinfo", return_value=infos),
+        patch.object(socket, "socket", side_effect=socks) as new_socket,
+    ):
+        assert client._get_socket("mx.example.test", 25, 5) is socks[1]
+
+    assert new_socket.call_args.args == (socket.AF_INET6, socket.SOCK_STREAM, 6)
+    socks[0].connect.assert_called_once_with(("fe80::1", 25, 0, 1))
+    socks[0].close.assert_called_once_with()
+    socks[1].settimeout.assert_called_once_with(5)
+    socks[1].connect.assert_called_once_with(("fe80::2", 25, 3, 2))
+    socks[1].close.assert_not_called()
+    assert [e.phase for e in events] == ["dns", "connect"]
+
+
+def test_listeners_pool(smtp_server: SMTPServer) -> None:
+    events: list[SMTPEvent] = []
+    handler = SMTPEmailHandler(
+        host=smtp_server.host,
+        port=smtp_server.port,
+        pool_size=1,
+        listeners=[events.append],
+    )
+    message = Message(from_addr="a@example.test", to=["b@example.test"])
+    handler.send([message])
+    handler.send([message])
+    handler.close()
+    assert [e.phase for e in events].count("connect") == 1
+    assert {e.connection for e in events} == {0}
+
+
+def test_listeners_async(smtp_server: SMTPServer) -> None:
+    events: list[SMTPEvent] = []
+    handler = SMTPEmailHandler(
+        host=smtp_server.host,
+        port=smtp_server.port,
+        max_connections=2,
+        listeners=[events.append],
+    )
+    message = Message(from_addr="a@example.test", to=["b@example.test"])
+    asyncio.run(handler.send_async([message, message]))
+    assert sorted(e.phase for e in events) == sorted(["connect", "prepare", "data"] * 2)
+    assert {e.connection for e in events} == {0, 1}
+    assert sorted(e.message for e in events if e.message is not None) == [
+        0,
+        0,
+        1,
+        1,
+    ]
+
+
+def test_stats(smtp_server: SMTPServer) -> None:
+    stats = SMTPStats()
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, listeners=[stats]
+    )
+    message = Message(from_addr="a@example.test", to=["b@example.test"])
+    handler.send([message, message])
+    phases = stats.phases
+    assert phases["connect"].calls == 1
+    assert phases["data"].calls == 2
+    assert phases["data"].size == 2 * len(smtp_server.messages[0].data)
+    assert phases["data"].max <= phases["data"].total
+    assert phases["data"].mean == phases["data"].total / 2
+    stats.reset()
+    assert stats.phases == {}
+
+
+def test_listeners_tls(smtp_server: SMTPServer) -> None:
+    # The test server doesn't support TLS, the mock context skips wrapping.
+    tls_context = MagicMock()
+    tls_context.wrap_socket.side_effect = lambda sock, server_hostname: sock
+    events: list[SMTPEvent] = []
+    handler = SMTPEmailHandler(
+        host=smtp_server.host,
+        port=smtp_server.port,
+        use_tls=True,
+        listeners=[events.append],
+    )
+    handler.tls_context = tls_context
+    handler.send([Message(from_addr="a@example.test", to=["b@example.test"])])
+    assert [e.phase for e in events][:4] == ["dns", "connect", "tls", "ehlo"]
+    tls_context.wrap_socket.assert_called_once()
+    assert tls_context.wrap_socket.call_args.kwargs == {
+        "server_hostname": smtp_server.host
+    }
+
+
+def _deliver_sync_or_async(
+    handler: SMTPEmailHandler, messages: list[Message | EmailMessage], use_async: bool
+) -> list[MessageResult]:
+    if use_async:
+        return asyncio.run(handler.deliver_async(messages))
+
+    return handler.deliver(messages)
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_deliver(smtp_server: SMTPServer, use_async: bool) -> None:
+    smtp_server.reject["c@example.test"] = 550
+    handler = SMTPEmailHandler(host=smtp_server.host, port=smtp_server.port)
+    messages: list[Message | EmailMessage] = [
+        Message(from_addr="a@example.test", to=["b@example.test"]),
+        Message(from_addr="a@example.test", to=["b@example.test", "c@example.test"]),
+        Message(from_addr="a@example.test", to=["c@example.test"]),
+    ]
+    results = _deliver_sync_or_async(handler, messages, use_async)
+    assert [r.position for r in results] == [0, 1, 2]
+    assert [r.accepted for r in results] == [True, False, False]
+    assert [(r.address, r.status, r.code) for r in results[1].recipients] == [
+        ("b@example.test", "accepted", 250),
+        ("c@example.test", "permanent", 550),
+    ]
+    assert results[1].failed == results[1].recipients[1:]
+    assert results[2].recipients[0].status == "permanent"
+    assert results[2].error is None
+    assert len(smtp_server.messages) == 2
+    assert smtp_server.connections == 1
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_deliver_retry(smtp_server: SMTPServer, use_async: bool) -> None:
+    smtp_server.reject_once["c@example.test"] = 451
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, retries=2, retry_backoff=0
+    )
+    message = Message(
+        from_addr="a@example.test", to=["b@example.test", "c@example.test"]
+    )
+    (result,) = _deliver_sync_or_async(handler, [message], use_async)
+    assert result.accepted
+    assert [r.attempts for r in result.recipients] == [1, 2]
+    # The accepted recipient was not sent to again.
+    assert [m.rcpt_tos for m in smtp_server.messages] == [
+        ["b@example.test"],
+        ["c@example.test"],
+    ]
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_deliver_retries_exhausted(smtp_server: SMTPServer, use_async: bool) -> None:
+    smtp_server.data_code = 451
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, retries=1, retry_backoff=0
+    )
+    message = Message(from_addr="a@example.test", to=["b@example.test"])
+    (result,) = _deliver_sync_or_async(handler, [message], use_async)
+    assert result.recipients[0].status == "temporary"
+    assert result.recipients[0].code == 451
+    assert result.recipients[0].attempts == 2
+    assert [c.upper() for c in smtp_server.commands].count("DATA") == 2
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_deliver_connect_error(use_async: bool) -> None:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    handler = SMTPEmailHandler(
+        host="127.0.0.1", port=port, max_connections=2, retries=1, retry_backoff=0
+    )
+    messages: list[Message | EmailMessage] = [
+        Message(to=["a@example.test"]),
+        Message(to=["a@example.test"]),
+    ]
+    results = _deliver_sync_or_async(handler, messages, use_async)
+    assert all(isinstance(r.error, OSError) for r in results)
+    assert all(
+        (r.recipients[0].status, r.recipients[0].code, r.recipients[0].attempts)
+        == ("temporary", None, 2)
+        for r in results
+    )
+
+
+def test_deliver_empty() -> None:
+    assert SMTPEmailHandler().deliver([]) == []
+
+
+def test_retry_delay() -> None:
+    handler = SMTPEmailHandler(retry_backoff=1, retry_max_delay=5, retry_jitter=False)
+    assert [handler._retry_delay(i) for i in range(1, 5)] == [1, 2, 4, 5]
+    handler.retry_jitter = True
+    assert all(0 <= handler._retry_delay(3) <= 4 for _ in range(20))
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_deliver_reconnect(smtp_server: SMTPServer, use_async: bool) -> None:
+    """A 421 reply closes the connection, the retry uses a new connection."""
+    smtp_server.reject_once["b@example.test"] = 421
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, retries=1, retry_backoff=0
+    )
+    message = Message(from_addr="a@example.test", to=["b@example.test"])
+    (result,) = _deliver_sync_or_async(handler, [message], use_async)
+    assert result.accepted
+    assert smtp_server.connections == 2
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_rate_limits(smtp_server: SMTPServer, use_async: bool) -> None:
+    messages_rate = create_autospec(TokenBucket, instance=True)
+    recipients_rate = create_autospec(TokenBucket, instance=True)
+    connections_rate = create_autospec(TokenBucket, instance=True)
+    handler = SMTPEmailHandler(
+        host=smtp_server.host,
+        port=smtp_server.port,
+        recipients_per_message=2,
+        max_messages_per_second=messages_rate,
+        max_recipients_per_second=recipients_rate,
+        max_connections_per_minute=connections_rate,
+    )
+    message = Message(
+        from_addr="a@example.test",
+        to=["b@example.test", "c@example.test", "d@example.test"],
+    )
+    _send_sync_or_async(handler, [message, message], use_async)
+
+    if use_async:
+        assert messages_rate.acquire_async.call_count == 4
+        assert [c.args for c in recipients_rate.acquire_async.call_args_list] == [
+            (2,),
+            (1,),
+        ] * 2
+        assert connections_rate.acquire_async.call_count == 1
+    else:
+        assert messages_rate.acquire.call_count == 4
+        assert [c.args for c in recipients_rate.acquire.call_args_list] == [
+            (2,),
+            (1,),
+        ] * 2
+        assert connections_rate.acquire.call_count == 1
+
+
+def test_rate_limits_from_config() -> None:
+    handler = SMTPEmailHandler.from_config(
+        {"max_messages_per_second": 5, "max_connections_per_minute": 10}
+    )
+    assert handler.message_rate is not None
+    assert handler.message_rate.rate == 5
+    assert handler.recipient_rate is None
+    assert handler.connection_rate is not None
+    assert handler.connection_rate.period == 60
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_group_by_domain(smtp_server: SMTPServer, use_async: bool) -> None:
+    handler = SMTPEmailHandler(
+        host=smtp_server.host,
+        port=smtp_server.port,
+        recipients_per_message=2,
+        group_by_domain=True,
+    )
+    message = Message(
+        from_addr="a@example.test",
+        to=["a@x.test", "b@y.test", "c@X.test", "d@y.test"],
+    )
+    _send_sync_or_async(handler, [message], use_async)
+    assert [m.rcpt_tos for m in smtp_server.messages] == [
+        ["a@x.test", "c@X.test"],
+        ["b@y.test", "d@y.test"],
+    ]
+
+
+def test_domain_address_cache() -> None:
+    """The domain is IDNA encoded with the current address cache, which
+    set_address_cache_size replaces.
+    """
+    try:
+        set_address_cache_size(10)
+        assert smtp._domain("a@Bücher.test") == "xn--bcher-kva.test"
+        assert address._idna_if_needed.cache_info().currsize == 1
+    finally:
+        set_address_cache_size(100_000)
+
+
+def _resolver(
+    servers: list[SMTPServer],
+) -> cabc.Callable[[str], tuple[str, int] | None]:
+    routes = {"a.test": servers[0], "b.test": servers[1]}
+
+    def resolver(domain: str) -> tuple[str, int] | None:
+        if (server := routes.get(domain)) is None:
+            return None
+
+        return server.host, server.port
+
+    return resolver
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_resolver(smtp_servers: list[SMTPServer], use_async: bool) -> None:
+    default = smtp_servers[2]
+    handler = SMTPEmailHandler(
+        host=default.host, port=default.port, resolver=_resolver(smtp_servers)
+    )
+    message = Message(
+        from_addr="a@example.test",
+        to=["x@a.test", "y@b.test", "z@a.test", "w@c.test"],
+    )
+    _send_sync_or_async(handler, [message, message], use_async)
+    assert [m.rcpt_tos for m in smtp_servers[0].messages] == [
+        ["x@a.test", "z@a.test"]
+    ] * 2
+    assert [m.rcpt_tos for m in smtp_servers[1].messages] == [["y@b.test"]] * 2
+    assert [m.rcpt_tos for m in default.messages] == [["w@c.test"]] * 2
+    # Each host's connection is reused for the second message.
+    assert [s.connections for s in smtp_servers] == [1, 1, 1]
+    assert b"To: x@a.test, y@b.test" in smtp_servers[1].messages[0].data
+
+
+def test_resolver_default_not_used(smtp_servers: list[SMTPServer]) -> None:
+    # The default host isn't connected to if every domain is resolved.
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    handler = SMTPEmailHandler(
+        host="127.0.0.1", port=port, resolver=_resolver(smtp_servers)
+    )
+    handler.send([Message(from_addr="a@example.test", to=["x@a.test"])])
+    assert len(smtp_servers[0].messages) == 1
+
+
+def test_resolver_pool(smtp_servers: list[SMTPServer]) -> None:
+    handler = SMTPEmailHandler(
+        host=smtp_servers[2].host,
+        port=smtp_servers[2].port,
+        resolver=_resolver(smtp_servers),
+        pool_size=1,
+    )
+    message = Message(from_addr="a@example.test", to=["x@a.test", "y@b.test"])
+    handler.send([message])
+    handler.send([message])
+    handler.close()
+    assert [s.connections for s in smtp_servers] == [1, 1, 0]
+
+
+def test_resolver_pool_workers(smtp_servers: list[SMTPServer]) -> None:
+    """Workers waiting for each other's pools don't deadlock."""
+    handler = SMTPEmailHandler(
+        host=smtp_servers[2].host,
+        port=smtp_servers[2].port,
+        resolver=_resolver(smtp_servers),
+        pool_size=1,
+        max_connections=2,
+    )
+    messages = [
+        Message(from_addr="a@example.test", to=[f"x@{'ab'[i % 2]}.test"])
+        for i in range(20)
+    ]
+    thread = threading.Thread(target=handler.send, args=(messages,), daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive()
+    handler.close()
+    assert [len(s.messages) for s in smtp_servers] == [10, 10, 0]
+
+
+def test_resolver_routes_evicted(
+    smtp_servers: list[SMTPServer], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(smtp, "_MAX_ROUTES", 1)
+    handler = SMTPEmailHandler(
+        host=smtp_servers[2].host,
+        port=smtp_servers[2].port,
+        resolver=_resolver(smtp_servers),
+        pool_size=1,
+    )
+    handler.send([Message(from_addr="a@example.test", to=["x@a.test"])])
+    (first,) = handler._routes.values()  # pyright: ignore
+    assert first.pool is not None
+    assert first.pool._idle  # pyright: ignore
+    handler.send([Message(from_addr="a@example.test", to=["x@b.test"])])
+    # The pool for the least recently used host was closed.
+    routes = list(handler._routes)  # pyright: ignore
+    assert routes == [(smtp_servers[1].host, smtp_servers[1].port)]
+    assert not first.pool._idle  # pyright: ignore
+    handler.close()
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_resolver_deliver(smtp_servers: list[SMTPServer], use_async: bool) -> None:
+    smtp_servers[1].reject_once["y@b.test"] = 451
+    handler = SMTPEmailHandler(
+        host=smtp_servers[2].host,
+        port=smtp_servers[2].port,
+        resolver=_resolver(smtp_servers),
+        retries=1,
+        retry_backoff=0,
+    )
+    message = Message(from_addr="a@example.test", to=["x@a.test", "y@b.test"])
+    (result,) = _deliver_sync_or_async(handler, [message], use_async)
+    assert result.accepted
+    assert [r.attempts for r in result.recipients] == [1, 2]
+    assert [m.rcpt_tos for m in smtp_servers[0].messages] == [["x@a.test"]]
+    assert [m.rcpt_tos for m in smtp_servers[1].messages] == [["y@b.test"]]
+
+
+def test_resolver_error(smtp_server: SMTPServer) -> None:
+    def resolver(domain: str) -> None:
+        raise OSError("lookup failed")
+
+    handler = SMTPEmailHandler(
+        host=smtp_server.host, port=smtp_server.port, resolver=resolver
+    )
+    (result,) = handler.deliver([Message(to=["x@a.test"])])
+    assert isinstance(result.error, OSError)
+    assert result.recipients[0].status == "temporary"
+    assert smtp_server.connections == 0
+
+
+def test_resolver_from_config() -> None:
+    def resolver(domain: str) -> None:
+        return None
+
+    handler = SMTPEmailHandler.from_config(
+        {"group_by_domain": True, "resolver": resolver}
+    )
+    assert handler.group_by_domain
+    assert handler.resolver is resolver
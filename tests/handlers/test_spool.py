@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import collections.abc as cabc
+import typing as t
+from email import message_from_bytes
+from email.message import EmailMessage
+from pathlib import Path
+
+import pytest
+from smtp_server import SMTPServer
+
+from email_simplified import Attachment
+from email_simplified import Message
+from email_simplified import SMTPEmailHandler
+from email_simplified import TestEmailHandler
+from email_simplified.handlers.base import EmailHandler
+from email_simplified.handlers.spool import SpoolEmailHandler
+
+
+class FailingHandler(EmailHandler):
+    """Fails to send a list that contains a message with the subject "bad"."""
+
+    def __init__(self) -> None:
+        self.outbox: list[EmailMessage] = []
+
+    def send(self, messages: list[Message | EmailMessage]) -> None:
+        for m in messages:
+            assert isinstance(m, EmailMessage)
+
+            if m["subject"] == "bad":
+                raise ValueError("bad")
+
+        self.outbox.extend(t.cast(list[EmailMessage], messages))
+
+
+class DisconnectedHandler(EmailHandler):
+    """Fails every send as if the server can't be reached."""
+
+    def __init__(self) -> None:
+        self.attempts = 0
+
+    def send(self, messages: list[Message | EmailMessage]) -> None:
+        self.attempts += 1
+        raise ConnectionRefusedError()
+
+
+@pytest.fixture
+def spool(tmp_path: Path) -> cabc.Iterator[SpoolEmailHandler]:
+    handler = SpoolEmailHandler(tmp_path, TestEmailHandler(), poll_interval=0.05)
+    yield handler
+    handler.close()
+
+
+def _outbox(spool: SpoolEmailHandler) -> list[t.Any]:
+    return spool.handler.outbox  # type: ignore[attr-defined, no-any-return]
+
+
+def test_send(spool: SpoolEmailHandler) -> None:
+    spool.send([Message(subject=str(i), to=["a@example.test"]) for i in range(3)])
+    assert spool.wait(5)
+    outbox = _outbox(spool)
+    assert [m["subject"] for m in outbox] == ["0", "1", "2"]
+    assert outbox[0]["to"] == "a@example.test"
+    stats = spool.stats()
+    assert stats.pending == stats.in_flight == stats.failed == 0
+    assert stats.delivered == 3
+    assert stats.oldest_age is None
+
+
+def test_send_mime(spool: SpoolEmailHandler) -> None:
+    message = EmailMessage()
+    message["Subject"] = "a"
+    message["X-Custom"] = "b"
+    spool.send([message])
+    assert spool.wait(5)
+    (out,) = _outbox(spool)
+    assert isinstance(out, EmailMessage)
+    assert out["x-custom"] == "b"
+
+
+def test_send_attachments(spool: SpoolEmailHandler) -> None:
+    """Messages are delivered as MIME, without losing parts that can't be
+    converted back to a Message.
+    """
+    spool.send(
+        [
+            Message(attachments=[Attachment(b"\x00\x01", filename="a.bin")]),
+            Message(
+                text="b",
+                html='<img src="cid:c">',
+                inline_attachments=[Attachment(b"\x02", filename="c.png")],
+            ),
+        ]
+    )
+    assert spool.wait(5)
+    a, b = _outbox(spool)
+    assert isinstance(a, EmailMessage)
+    (part,) = a.iter_attachments()
+    assert part.get_filename() == "a.bin"
+    assert part.get_content() == b"\x00\x01"
+    assert a.get_body(("plain",)) is None
+    assert b.get_body(("plain",)).get_content() == "b\n"
+    (inline,) = [p for p in b.walk() if p.get_content_disposition() == "inline"]
+    assert inline.get_content_type() == "image/png"
+    assert inline.get_content() == b"\x02"
+    assert inline["content-id"]
+
+
+def test_send_empty(spool: SpoolEmailHandler) -> None:
+    spool.send([])
+    assert spool.stats().pending == 0
+
+
+def test_not_started(tmp_path: Path) -> None:
+    spool = SpoolEmailHandler(tmp_path, "test", start=False, fsync=False)
+    spool.send([Message(subject="a")])
+    stats = spool.stats()
+    assert stats.pending == 1
+    assert stats.oldest_age is not None
+    assert not spool.wait(0.1)
+    spool.start()
+    assert spool.wait(5)
+    spool.close()
+    assert [m["subject"] for m in _outbox(spool)] == ["a"]
+
+
+def test_recover(tmp_path: Path) -> None:
+    spool = SpoolEmailHandler(tmp_path, "test", start=False)
+    spool.send([Message(subject="a")])
+    # Simulate a process that stopped while delivering or writing.
+    (path,) = (tmp_path / "new").iterdir()
+    path.rename(tmp_path / "cur" / path.name)
+    (tmp_path / "tmp" / "partial.eml").write_bytes(b"Subj")
+    spool = SpoolEmailHandler(tmp_path, "test", poll_interval=0.05)
+    assert spool.wait(5)
+    spool.close()
+    assert [m["subject"] for m in _outbox(spool)] == ["a"]
+    assert not list((tmp_path / "tmp").iterdir())
+
+
+def test_failed(tmp_path: Path) -> None:
+    handler = FailingHandler()
+    spool = SpoolEmailHandler(tmp_path, handler, poll_interval=0.05)
+    spool.send([Message(subject="a"), Message(subject="bad"), Message(subject="b")])
+    assert spool.wait(5)
+    # The good messages in the failed batch were delivered.
+    assert sorted(m["subject"] for m in handler.outbox) == ["a", "b"]
+    stats = spool.stats()
+    assert stats.failed == 1
+    assert stats.errors == 1
+    assert stats.delivered == 2
+    spool.close()
+    assert spool.requeue_failed() == 1
+    assert spool.stats().pending == 1
+
+
+def test_smtp_refused(tmp_path: Path, smtp_server: SMTPServer) -> None:
+    """A message refused by the server doesn't cause the messages sent before
+    it to be sent again.
+    """
+    smtp_server.reject["bad@example.test"] = 550
+    handler = SMTPEmailHandler(host=smtp_server.host, port=smtp_server.port)
+    spool = SpoolEmailHandler(tmp_path, handler, poll_interval=0.05)
+    spool.send(
+        [
+            Message(subject="1", to=["a@example.test"]),
+            Message(subject="2", to=["bad@example.test"]),
+            Message(subject="3", to=["a@example.test"]),
+        ]
+    )
+    assert spool.wait(5)
+    spool.close()
+    subjects = [message_from_bytes(m.data)["subject"] for m in smtp_server.messages]
+    assert subjects == ["1", "3"]
+    assert spool.stats().failed == 1
+
+
+def test_retry_temporary(tmp_path: Path, smtp_server: SMTPServer) -> None:
+    smtp_server.reject_once["a@example.test"] = 451
+    handler = SMTPEmailHandler(host=smtp_server.host, port=smtp_server.port)
+    spool = SpoolEmailHandler(tmp_path, handler, poll_interval=0.05, retry_backoff=0.05)
+    spool.send([Message(subject="a", to=["a@example.test"])])
+    assert spool.wait(5)
+    spool.close()
+    assert len(smtp_server.messages) == 1
+    stats = spool.stats()
+    assert stats.failed == stats.errors == 0
+    assert stats.delivered == 1
+
+
+def test_retries_exhausted(tmp_path: Path) -> None:
+    handler = DisconnectedHandler()
+    spool = SpoolEmailHandler(
+        tmp_path, handler, poll_interval=0.05, retries=2, retry_backoff=0.01
+    )
+    spool.send([Message(subject="a")])
+    assert spool.wait(5)
+    spool.close()
+    assert handler.attempts == 3
+    assert spool.stats().failed == 1
+
+
+def test_from_config(tmp_path: Path) -> None:
+    spool = SpoolEmailHandler.from_config(
+        {"directory": tmp_path, "handler": "test", "workers": 2, "start": False}
+    )
+    assert isinstance(spool.handler, TestEmailHandler)
+    assert spool.workers == 2
+    spool.start()
+    assert len(spool._threads) == 2
+    spool.close()
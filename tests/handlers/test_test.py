@@ -1,9 +1,15 @@
 from __future__ import annotations
 
 import asyncio
+import collections.abc as cabc
+import mailbox
+from email.message import EmailMessage
+from pathlib import Path
+from unittest.mock import patch
 
 from email_simplified import Message
 from email_simplified import TestEmailHandler
+from email_simplified.handlers.test import Outbox
 
 
 def test_handler() -> None:
@@ -15,3 +21,146 @@ def test_handler() -> None:
 
 def test_config() -> None:
     TestEmailHandler.from_config({"invalid": True})
+
+
+def _subjects(messages: cabc.Iterable[Message | EmailMessage]) -> list[str | None]:
+    return [m.subject if isinstance(m, Message) else m["subject"] for m in messages]
+
+
+def test_outbox_sequence() -> None:
+    handler = TestEmailHandler()
+    handler.send([Message(subject=str(i)) for i in range(3)])
+    outbox = handler.outbox
+    assert outbox
+    assert _subjects(outbox) == ["0", "1", "2"]
+    assert _subjects([outbox[-1]]) == ["2"]
+    assert _subjects(outbox[1:]) == ["1", "2"]
+    outbox.clear()
+    assert len(outbox) == 0
+    assert outbox.sent_count == 0
+
+
+def test_outbox_list() -> None:
+    """The outbox supports the same operations as the list it replaced."""
+    handler = TestEmailHandler()
+    a, b, c, d = (Message(subject=s, to=[f"{s}@example.test"]) for s in "abcd")
+    handler.send([a, b, c])
+    outbox = handler.outbox
+    assert outbox == [a, b, c]
+    assert [a, b, c] == outbox
+    assert outbox != [a, b]
+    assert outbox.pop() is c
+    assert outbox.find(to="c@example.test") == []
+    outbox[0] = d
+    assert outbox == [d, b]
+    assert outbox.find(to="d@example.test") == [d]
+    outbox.insert(0, c)
+    assert outbox.find(to="b@example.test") == [b]
+    assert outbox == [c, d, b]
+    del outbox[:]
+    assert outbox == []
+    assert outbox.sent_count == 3
+    handler.send([a])
+    assert outbox.find(to="a@example.test") == [a]
+
+
+def test_outbox_ends() -> None:
+    """Changes at either end update the indexes without rebuilding them."""
+    handler = TestEmailHandler()
+    a, b, c, d, e = (Message(subject=s, to=[f"{s}@example.test"]) for s in "abcde")
+    handler.send([a, b, c])
+    outbox = handler.outbox
+
+    with patch.object(Outbox, "_reset", side_effect=AssertionError):
+        assert outbox.pop(0) is a
+        outbox.insert(0, d)
+        outbox.append(e)
+        outbox[-1] = a
+        outbox[0] = e
+        assert outbox == [e, b, c, a]
+        del outbox[-1]
+        del outbox[:1]
+        assert outbox.pop() is c
+
+    assert outbox == [b]
+    assert outbox.find(to="b@example.test") == [b]
+
+    for s in "acde":
+        assert outbox.find(to=f"{s}@example.test") == []
+
+    outbox.insert(1, c)
+    outbox.insert(1, d)
+    assert outbox == [b, d, c]
+    assert outbox.find(to="c@example.test") == [c]
+
+
+def test_find() -> None:
+    handler = TestEmailHandler()
+    mime = EmailMessage()
+    mime["From"] = "c@example.test"
+    mime["Cc"] = "A <a@example.test>"
+    mime["Subject"] = "hello"
+    handler.send(
+        [
+            Message(subject="hello", from_addr="b@example.test", to=["a@example.test"]),
+            Message(subject="bye", from_addr="b@example.test", bcc=["A@Example.test"]),
+            mime,
+        ]
+    )
+    outbox = handler.outbox
+    assert len(outbox.find(to="a@example.test")) == 3
+    found = outbox.find(to="x <a@EXAMPLE.test>", sender="b@example.test")
+    assert _subjects(found) == ["hello", "bye"]
+    assert outbox.find(subject="hello", sender="c@example.test") == [mime]
+    assert outbox.find(subject="nothing") == []
+    assert len(outbox.find()) == 3
+
+
+def test_max_size() -> None:
+    handler = TestEmailHandler(max_size=2)
+    handler.send(
+        [Message(subject=str(i), to=[f"{i % 2}@example.test"]) for i in range(5)]
+    )
+    outbox = handler.outbox
+    assert _subjects(outbox) == ["3", "4"]
+    assert outbox.sent_count == 5
+    assert outbox.removed_count == 3
+    assert _subjects(outbox.find(to="1@example.test")) == ["3"]
+    assert _subjects(outbox.find(to="0@example.test")) == ["4"]
+    assert outbox.find(subject="0") == []
+
+
+def test_store_bytes() -> None:
+    handler = TestEmailHandler(store_bytes=True)
+    mime = EmailMessage()
+    mime["Subject"] = "b"
+    mime.set_content("body")
+    handler.send([Message(subject="a", text="hello", bcc=["a@example.test"]), mime])
+    outbox = handler.outbox
+    first, second = outbox
+    # Stored messages are returned as MIME, even if a Message was sent.
+    assert isinstance(first, EmailMessage)
+    assert first.get_content() == "hello\n"
+    assert first["bcc"] == "a@example.test"
+    assert isinstance(second, EmailMessage)
+    assert second.get_content() == "body\n"
+    assert outbox.sent_bytes > 0
+    assert len(outbox.find(to="a@example.test")) == 1
+
+
+def test_spill(tmp_path: Path) -> None:
+    path = tmp_path / "spill.mbox"
+    handler = TestEmailHandler.from_config({"max_size": 1, "spill_path": path})
+    handler.send(
+        [
+            Message(subject="a", text="From here\nto there"),
+            Message(subject="b"),
+            Message(subject="c"),
+        ]
+    )
+    handler.close()
+    assert _subjects(handler.outbox) == ["c"]
+    spilled = mailbox.mbox(path)
+    assert [m["subject"] for m in spilled] == ["a", "b"]
+    spilled.close()
+    assert b"\n>From here\n" in path.read_bytes()
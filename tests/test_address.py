@@ -1,11 +1,19 @@
 from __future__ import annotations
 
+import collections.abc as cabc
+import copy
+import pickle
 from email.headerregistry import Address
 
 import pytest
 
+from email_simplified.address import address_cache_info
 from email_simplified.address import AddressList
+from email_simplified.address import AddressReject
+from email_simplified.address import clear_address_cache
+from email_simplified.address import parse_addresses
 from email_simplified.address import prepare_address
+from email_simplified.address import set_address_cache_size
 
 
 @pytest.mark.parametrize(
@@ -89,3 +97,166 @@ def test_list_contains() -> None:
     assert "a@a.test" in data
     assert "b@a.test" not in data
     assert object() not in data
+
+
+def _check_index(data: AddressList) -> None:
+    """The index matches a fresh copy of the list."""
+    expect = AddressList(list(data))
+    assert data._counts == expect._counts  # pyright: ignore
+    assert data._specs == expect._specs  # pyright: ignore
+
+
+def test_list_index_mutations() -> None:
+    data = AddressList(["a@a.test", "b@a.test", "A <a@a.test>"])
+    data.append("c@a.test")
+    data.insert(0, "d@a.test")
+    data.remove("b@a.test")
+    data[0] = "e@a.test"
+    data[1:3] = ["f@a.test", "g@a.test", "h@a.test"]
+    del data[0]
+    del data[:1]
+    assert data.pop() == Address(addr_spec="c@a.test")
+    data *= 2
+    data += ["i@a.test"]
+    data.sort(key=str)
+    _check_index(data)
+    data.clear()
+    _check_index(data)
+
+
+def test_list_contains_exact() -> None:
+    """Membership still compares the display name, as list does."""
+    data = AddressList(["A <a@a.test>"])
+    assert "A <a@a.test>" in data
+    assert "a@a.test" not in data
+    assert data.count("A <a@a.test>") == 1
+
+    with pytest.raises(ValueError):
+        data.index("a@a.test")
+
+    with pytest.raises(ValueError):
+        data.remove("a@a.test")
+
+
+def test_list_add_unique() -> None:
+    data = AddressList(["A <a@a.test>"])
+    assert data.has_addr_spec("A@A.test")
+    assert not data.add_unique("B <A@a.test>")
+    assert data.add_unique("b@a.test")
+    assert [str(x) for x in data] == ["A <a@a.test>", "b@a.test"]
+
+
+def test_list_dedupe() -> None:
+    data = AddressList(["a@a.test", "b@a.test", "A <A@a.test>", "c@a.test", "b@a.test"])
+    assert data.dedupe() == 2
+    assert [x.addr_spec for x in data] == ["a@a.test", "b@a.test", "c@a.test"]
+    assert data.dedupe() == 0
+    _check_index(data)
+
+
+@pytest.mark.parametrize(
+    "copy_func", [copy.copy, copy.deepcopy, lambda x: pickle.loads(pickle.dumps(x))]
+)
+def test_list_copy(copy_func: cabc.Callable[[AddressList], AddressList]) -> None:
+    data = AddressList(["a@a.test", "a@a.test"])
+    result = copy_func(data)
+    assert isinstance(result, AddressList)
+    assert result == data
+    _check_index(result)
+
+
+@pytest.fixture
+def address_cache() -> cabc.Iterator[None]:
+    set_address_cache_size(2)
+
+    try:
+        yield
+    finally:
+        set_address_cache_size(100_000)
+
+
+@pytest.mark.usefixtures("address_cache")
+def test_cache() -> None:
+    a = prepare_address("A <a@あ.test>")
+    assert prepare_address("A <a@あ.test>") is a
+    info = address_cache_info()
+    assert (info["parse"].hits, info["parse"].misses) == (1, 1)
+    assert info["parse"].hit_rate == 0.5
+    assert info["idna"].size == 1
+    prepare_address(Address(username="b", domain="あ.test"))
+    assert address_cache_info()["idna"].hits == 1
+
+
+@pytest.mark.usefixtures("address_cache")
+def test_cache_bounded() -> None:
+    for x in range(5):
+        prepare_address(f"{x}@a.test")
+
+    info = address_cache_info()["parse"]
+    assert info.size == info.max_size == 2
+
+
+@pytest.mark.usefixtures("address_cache")
+def test_cache_clear() -> None:
+    prepare_address("a@a.test")
+    clear_address_cache()
+    info = address_cache_info()["parse"]
+    assert info.size == info.hits == info.misses == 0
+    assert info.hit_rate == 0
+
+
+def test_cache_disabled() -> None:
+    set_address_cache_size(0)
+
+    try:
+        assert prepare_address("a@a.test") == prepare_address("a@a.test")
+        assert address_cache_info()["parse"].size == 0
+    finally:
+        set_address_cache_size(100_000)
+
+
+@pytest.mark.parametrize(
+    ("value", "reason"),
+    [
+        ("", "empty"),
+        ("a@a.test, b@a.test", "more than one address"),
+        ("a@a@a.test", "could not be parsed"),
+        ("a", "missing '@'"),
+        ("@a.test", "empty user"),
+        ("a@-a.test", "invalid domain"),
+        ("a@a..test", "invalid domain"),
+        (f"{'a' * 250}@a.test", "too long"),
+    ],
+)
+def test_parse_addresses_reject(value: str, reason: str) -> None:
+    result = parse_addresses(["a@a.test", value])
+    assert result.rejects == [AddressReject(1, value, reason)]
+    assert len(result.addresses) == 1
+
+
+def test_parse_addresses() -> None:
+    result = parse_addresses(
+        ["a@a.test", "B <b@あ.test>", "A <A@a.test>", "c@[127.0.0.1]", "x"]
+    )
+    assert [str(a) for a in result.addresses] == [
+        "a@a.test",
+        "B <b@xn--l8j.test>",
+        "c@[127.0.0.1]",
+    ]
+    assert result.duplicates == 1
+    assert len(result.rejects) == 1
+    assert list(result.by_domain) == ["a.test", "xn--l8j.test", "[127.0.0.1]"]
+
+
+def test_parse_addresses_no_dedupe() -> None:
+    result = parse_addresses(["a@a.test", "a@a.test"], dedupe=False)
+    assert len(result.addresses) == 2
+    assert result.duplicates == 0
+    assert len(result.by_domain["a.test"]) == 2
+
+
+def test_parse_addresses_processes() -> None:
+    values = [f"{x}@{x % 3}.test" for x in range(50)] + ["x"]
+    result = parse_addresses(values, processes=2, chunk_size=7)
+    assert result == parse_addresses(values)
+    assert result.rejects[0].position == 50
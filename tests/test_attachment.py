@@ -1,8 +1,17 @@
 from __future__ import annotations
 
+import base64
+import collections.abc as cabc
+import io
+import mmap
+import re
+from pathlib import Path
+
 import pytest
 
 from email_simplified import Attachment
+from email_simplified import EncodingCache
+from email_simplified import Message
 
 
 @pytest.mark.parametrize(
@@ -40,3 +49,145 @@ def test_set_cid() -> None:
     data.cid = "test"
     assert data._cid is not None  # pyright: ignore
     assert data.cid == "test"
+
+
+def _mime_bytes(attachment: Attachment, *, inline: bool = False) -> bytes:
+    if inline:
+        message = Message(html="a", inline_attachments=[attachment])
+    else:
+        message = Message(text="a", attachments=[attachment])
+
+    # Boundaries are random, replace them to compare output.
+    return re.sub(rb"=+\d+==", b"boundary", message.to_mime().as_bytes())
+
+
+@pytest.mark.parametrize("inline", [False, True])
+def test_file_matches_bytes(tmp_path: Path, inline: bool) -> None:
+    data = bytes(range(256)) * 100
+    path = tmp_path / "a.pdf"
+    path.write_bytes(data)
+    expect = Attachment(data, filename="a.pdf")
+    expect.cid = "a"
+    attachment = Attachment(path)
+    attachment.cid = "a"
+    assert attachment.filename == "a.pdf"
+    assert attachment.mimetype == "application/pdf"
+    assert attachment.is_file
+    assert _mime_bytes(attachment, inline=inline) == _mime_bytes(expect, inline=inline)
+
+
+def test_file_read_lazily(tmp_path: Path) -> None:
+    path = tmp_path / "a.bin"
+    mime = Message(text="a", attachments=[Attachment(path)]).to_mime()
+    path.write_bytes(b"data")
+    assert Message.from_mime(mime).attachments[0].data == b"data"
+
+
+def test_file_object(tmp_path: Path) -> None:
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"ab")
+
+    with path.open("rb") as f:
+        f.read(1)
+        attachment = Attachment(f)
+        assert attachment.filename == "a.bin"
+        # Read from the initial position each time.
+        assert attachment.read() == b"b"
+        assert attachment.read() == b"b"
+
+
+def test_mmap(tmp_path: Path) -> None:
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"ab" * 1000)
+
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        attachment = Attachment(m)
+        assert attachment.filename is None
+        assert attachment.mimetype == "application/octet-stream"
+        assert attachment.read() == b"ab" * 1000
+
+
+def test_memory_not_file() -> None:
+    attachment = Attachment(b"a")
+    assert not attachment.is_file
+
+    with pytest.raises(TypeError), attachment.open():
+        pass
+
+
+@pytest.mark.parametrize("data", [b"", b"a", bytes(range(256)) * 50])
+def test_iter_base64(data: bytes) -> None:
+    attachment = Attachment(io.BytesIO(data))
+    chunks = list(attachment.iter_base64(linesep="\r\n", chunk_size=100))
+    assert all(len(c) <= 2 * 78 for c in chunks)
+    assert b"".join(chunks) == base64.encodebytes(data).replace(b"\n", b"\r\n")
+
+
+@pytest.fixture
+def encoding_cache() -> cabc.Iterator[EncodingCache]:
+    cache = EncodingCache(max_size=10_000)
+    Attachment.encoding_cache = cache
+
+    try:
+        yield cache
+    finally:
+        Attachment.encoding_cache = None
+
+
+@pytest.mark.parametrize("inline", [False, True])
+@pytest.mark.parametrize("data", [bytes(range(256)) * 10, "null"])
+def test_cache_matches(
+    encoding_cache: EncodingCache, inline: bool, data: str | bytes
+) -> None:
+    attachment = Attachment(data, filename="a.json")
+    attachment.cid = "a"
+    Attachment.encoding_cache = None
+    expect = _mime_bytes(attachment, inline=inline)
+    Attachment.encoding_cache = encoding_cache
+    assert _mime_bytes(attachment, inline=inline) == expect
+    assert _mime_bytes(attachment, inline=inline) == expect
+    assert encoding_cache.hits == 1
+    assert encoding_cache.misses == 1
+
+
+def test_cache_content_key(encoding_cache: EncodingCache) -> None:
+    """Attachments with the same content share an entry."""
+    message = Message(text="a", attachments=[Attachment(b"a"), Attachment(b"a")])
+    b"".join(message.iter_bytes())
+    assert (encoding_cache.hits, encoding_cache.misses) == (1, 1)
+    assert len(encoding_cache) == 1
+    # The line separator is part of the key.
+    message.to_mime()
+    assert len(encoding_cache) == 2
+
+
+def test_cache_data_changed(encoding_cache: EncodingCache) -> None:
+    attachment = Attachment(b"a")
+    b"".join(attachment.iter_bytes())
+    attachment.data = b"b"
+    data = b"".join(attachment.iter_bytes())
+    assert data.endswith(b"Yg==\r\n")
+    assert encoding_cache.misses == 2
+
+
+def test_cache_evict(encoding_cache: EncodingCache) -> None:
+    for x in range(20):
+        b"".join(Attachment(bytes([x]) * 1000).iter_bytes())
+
+    assert encoding_cache.size <= encoding_cache.max_size
+    assert encoding_cache.evictions == 20 - len(encoding_cache)
+    # Too large to cache.
+    b"".join(Attachment(b"a" * 10_000).iter_bytes())
+    assert encoding_cache.size <= encoding_cache.max_size
+    encoding_cache.clear()
+    assert len(encoding_cache) == encoding_cache.size == encoding_cache.misses == 0
+
+
+def test_cache_not_file(encoding_cache: EncodingCache) -> None:
+    b"".join(Attachment(io.BytesIO(b"a")).iter_bytes())
+    assert encoding_cache.misses == 0
+
+
+def test_cache_size_invalid() -> None:
+    with pytest.raises(ValueError):
+        EncodingCache(max_size=0)
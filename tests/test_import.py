@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+
+
+def _imported_after(code: str) -> set[str]:
+    """Run code in a new interpreter and return the modules it imported."""
+    script = (
+        "import sys\n"
+        "before = set(sys.modules)\n"
+        f"{code}\n"
+        "print('\\n'.join(set(sys.modules) - before))\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, check=True, text=True
+    ).stdout
+    return set(out.split())
+
+
+def test_import_lightweight() -> None:
+    imported = _imported_after("import email_simplified")
+    assert "email_simplified.message" in imported
+    assert not imported & {
+        "asyncio",
+        "concurrent.futures.process",
+        "email_simplified.handlers",
+        "importlib.metadata",
+        "smtplib",
+        "ssl",
+    }
+
+
+def test_import_handler_lazy() -> None:
+    imported = _imported_after("from email_simplified import SMTPEmailHandler")
+    assert {"email_simplified.handlers.smtp", "smtplib", "ssl"} <= imported
+    assert "email_simplified.handlers.test" not in imported
+
+
+def test_get_handler_class_lazy() -> None:
+    imported = _imported_after(
+        "from email_simplified import get_handler_class\nget_handler_class('test')"
+    )
+    assert "email_simplified.handlers.test" in imported
+    assert "email_simplified.handlers.smtp" not in imported
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import collections.abc as cabc
+import email
+import email.policy
+import typing as t
+from unittest.mock import patch
+
+import pytest
+
+from email_simplified import Attachment
+from email_simplified import Message
+from email_simplified import MessageTemplate
+
+
+def test_render() -> None:
+    template = MessageTemplate(
+        Message(
+            subject="Hello, $name",
+            text="Hi $name, ${to}.",
+            html="<p>$$5</p>",
+            from_addr="a@example.test",
+        )
+    )
+    m = template.render({"to": "b@example.test", "name": "B"})
+    assert m.subject == "Hello, B"
+    assert m.text == "Hi B, b@example.test."
+    assert m.html == "<p>$5</p>"
+    assert str(m.from_addr) == "a@example.test"
+    assert [str(a) for a in m.to] == ["b@example.test"]
+
+
+def test_render_to() -> None:
+    template = MessageTemplate(Message(text="a", to=["a@example.test"]))
+    assert [str(a) for a in template.render({}).to] == ["a@example.test"]
+    m = template.render({"to": ["b@example.test", "c@example.test"]})
+    assert len(m.to) == 2
+
+
+def test_render_missing() -> None:
+    template = MessageTemplate(Message(subject="$name"))
+
+    with pytest.raises(KeyError):
+        template.render({})
+
+
+def test_render_func() -> None:
+    def render(value: str, variables: cabc.Mapping[str, t.Any]) -> str:
+        return value.format_map(variables)
+
+    template = MessageTemplate(Message(subject="{name}", text="a"), render=render)
+    assert template.render({"name": "b"}).subject == "b"
+
+
+def test_messages_lazy() -> None:
+    template = MessageTemplate(Message(subject="$name"))
+    messages = template.messages({"name": str(x)} for x in range(3))
+    assert next(messages).subject == "0"
+    assert [m.subject for m in messages] == ["1", "2"]
+
+
+def test_attachments_encoded_once() -> None:
+    image = Attachment(b"image", filename="a.png")
+    template = MessageTemplate(
+        Message(
+            subject="$name",
+            html=f'<img src="cid:{image.cid[1:-1]}">',
+            attachments=[Attachment(b"\x00" * 1000, filename="b.bin")],
+            inline_attachments=[image],
+        )
+    )
+
+    with patch.object(
+        Attachment, "iter_bytes", autospec=True, side_effect=Attachment.iter_bytes
+    ) as iter_bytes:
+        data = list(template.iter_bytes({"name": str(x)} for x in range(3)))
+
+    # Once for the attachment and once for the inline attachment.
+    assert iter_bytes.call_count == 2
+
+    for i, item in enumerate(data):
+        m = Message.from_mime(
+            email.message_from_bytes(item, policy=email.policy.default)
+        )
+        assert m.subject == str(i)
+        assert m.attachments[0].data == b"\x00" * 1000
+        assert m.inline_attachments[0].cid == image.cid
+
+
+def test_to_mime() -> None:
+    template = MessageTemplate(
+        Message(
+            text="$name",
+            attachments=[Attachment("null", filename="a.json")],
+        )
+    )
+
+    for x in range(2):
+        m = Message.from_mime(template.render({"name": str(x)}).to_mime())
+        assert m.text == f"{x}\n"
+        assert m.attachments[0].data == b"null"
+        assert m.attachments[0].filename == "a.json"
+
+
+def test_shared_headers() -> None:
+    template = MessageTemplate(
+        Message(subject="$name", from_addr="Jöe <a@example.test>", cc=["c@a.test"])
+    )
+    a, b = template.iter_bytes([{"name": "a"}, {"name": "b"}])
+    assert a.replace(b"Subject: a", b"Subject: b") == b
+    assert len(template._headers) == 2
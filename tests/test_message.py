@@ -1,11 +1,22 @@
 from __future__ import annotations
 
+import base64
+import email
+import email.policy
+import io
+import typing as t
 from email.headerregistry import Address
+from email.message import EmailMessage
+from pathlib import Path
+from unittest.mock import patch
 
 import pytest
 
 from email_simplified import Attachment
 from email_simplified import Message
+from email_simplified.message import _HTMLToText
+
+_image = Attachment(b"image", filename="a.png")
 
 
 def test_init() -> None:
@@ -98,10 +109,45 @@ def test_mime_text() -> None:
 
 def test_mime_html() -> None:
     m = Message.from_mime(Message(html="<p>b</p>\n<p>c</p>").to_mime())
-    assert m.text == "b\nc\n"
+    assert m.text == "b\n\nc\n"
     assert m.html == "<p>b</p>\n<p>c</p>\n"
 
 
+@pytest.mark.parametrize(
+    ("html", "expect"),
+    [
+        ("<p>a\n  b</p><p>c</p>", "a b\n\nc"),
+        ("<h1>a</h1>b<div>c</div>d", "a\n\nb\nc\nd"),
+        ("a<br>b", "a\nb"),
+        ("<ul><li>a</li><li>b<ul><li>c</li></ul></li></ul>", "- a\n- b\n  - c"),
+        (
+            "<ul><li>a<ol><li>b</li></ol></li><li>c</li></ul><p>d",
+            "- a\n  - b\n- c\n\nd",
+        ),
+        ('<a href="https://a.test">a</a>', "a (https://a.test)"),
+        ('<a href="https://a.test">https://a.test</a>', "https://a.test"),
+        ('<a href="mailto:a@a.test">a@a.test</a>', "a@a.test"),
+        ('<a href="#top">a</a>', "a"),
+        ("<head><title>a</title><style>b</style></head><script>c</script>d", "d"),
+        ("<html><head><title>T</title><body><p>Hello</p>", "Hello"),
+        ("<pre>a\n  b</pre>", "a\n  b"),
+        ('<img alt="a"> b &amp; c', "a b & c"),
+    ],
+)
+def test_html_to_text(html: str, expect: str) -> None:
+    assert _HTMLToText.process(html) == expect
+
+
+def test_html_to_text_cached() -> None:
+    html = "<p>cached</p>"
+    assert _HTMLToText.process(html) == "cached"
+
+    with patch.object(_HTMLToText, "feed") as feed:
+        assert _HTMLToText.process(html) == "cached"
+
+    feed.assert_not_called()
+
+
 def test_mime_text_html() -> None:
     m = Message.from_mime(Message(text="a", html="<p>b</p>").to_mime())
     assert m.text == "a\n"
@@ -130,3 +176,202 @@ def test_no_html_attachments() -> None:
     )
     assert len(m.attachments) == 1
     assert len(m.inline_attachments) == 0
+
+
+def _shape(part: EmailMessage) -> t.Any:
+    """Headers and content of each part. Boundaries are random, and the
+    serializer doesn't add ``MIME-Version`` to subparts, so those are ignored.
+    """
+    headers = []
+
+    for name, value in part.items():
+        if name.lower() == "mime-version":
+            continue
+
+        if part.is_multipart() and name.lower() == "content-type":
+            value = value.split(";")[0]
+
+        headers.append((name.lower(), str(value)))
+
+    if part.is_multipart():
+        return headers, [_shape(p) for p in part.iter_parts()]  # type: ignore[arg-type]
+
+    return headers, part.get_content()
+
+
+def _parse(data: bytes) -> EmailMessage:
+    return email.message_from_bytes(data, policy=email.policy.default)
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        pytest.param(Message(), id="empty"),
+        pytest.param(Message(text="a"), id="text"),
+        pytest.param(Message(text="é\n" * 3), id="text 8bit"),
+        pytest.param(Message(text="x" * 200), id="text long"),
+        pytest.param(Message(text="é" * 200), id="text long 8bit"),
+        pytest.param(Message(html="<p>a</p>\n<p>b</p>"), id="html"),
+        pytest.param(Message(subject="a =?utf-8?q?b?= c", text="a"), id="encoded word"),
+        pytest.param(Message(text="a", inline_attachments=[_image]), id="text inline"),
+        pytest.param(
+            Message(
+                subject="Héllo " + "word " * 20,
+                text="a\n.b",
+                html="<p>a</p>",
+                from_addr="Jöe <a@ä.test>",
+                to=["b@a.test", "C, D <c@a.test>"],
+                cc=["d@a.test"],
+                bcc=["e@a.test"],
+                reply_to="f@a.test",
+                attachments=[
+                    Attachment("null", filename="a.json"),
+                    Attachment("text"),
+                    Attachment(b"\x00\x01" * 1000, filename="b é.bin"),
+                ],
+                inline_attachments=[_image],
+            ),
+            id="all",
+        ),
+    ],
+)
+def test_iter_bytes(message: Message) -> None:
+    """The serialized message is equivalent to the generated MIME message."""
+    for linesep in ("\n", "\r\n"):
+        policy = email.policy.default.clone(linesep=linesep)
+        expect = _parse(message.to_mime().as_bytes(policy=policy))
+        data = b"".join(message.iter_bytes(linesep=linesep))
+        assert _shape(_parse(data)) == _shape(expect)
+
+
+def test_iter_bytes_linesep() -> None:
+    data = b"".join(Message(subject="a", text="b").iter_bytes(linesep="\n"))
+    assert b"\r" not in data
+    assert data.startswith(b"Subject: a\n")
+
+
+def test_iter_bytes_bcc() -> None:
+    message = Message(text="a", to=["b@a.test"], bcc=["c@a.test"])
+    assert b"BCC: c@a.test" in b"".join(message.iter_bytes())
+    assert b"c@a.test" not in b"".join(message.iter_bytes(include_bcc=False))
+
+
+def test_write_to() -> None:
+    message = Message(text="a", attachments=[Attachment(b"b", filename="b.bin")])
+    out = io.BytesIO()
+    message.write_to(out, linesep="\n")
+    parsed = Message.from_mime(_parse(out.getvalue()))
+    assert parsed.text == "a\n"
+    assert parsed.attachments[0].data == b"b"
+
+
+def test_from_bytes() -> None:
+    m = Message.from_bytes(Message(subject="a", text="b").to_mime().as_bytes())
+    assert m.subject == "a"
+    assert m.text == "b\n"
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_from_mime_lazy(lazy: bool) -> None:
+    mime = Message(
+        subject="a",
+        html="<p>b</p>",
+        to=["c@a.test"],
+        attachments=[Attachment(b"d", filename="d.bin")],
+        inline_attachments=[Attachment(b"e", filename="e.png")],
+    ).to_mime()
+
+    with patch.object(EmailMessage, "get_content", autospec=True) as get_content:
+        get_content.side_effect = lambda part: f"{part.get_content_type()}"
+        m = Message.from_mime(mime, lazy=lazy)
+        assert m.subject == "a"
+        assert str(m.to[0]) == "c@a.test"
+        assert len(m.attachments) == 1
+        assert m.attachments[0].filename == "d.bin"
+        assert m.inline_attachments[0].mimetype == "image/png"
+        assert get_content.call_count == (0 if lazy else 4)
+        assert m.html == "text/html"
+        assert m.attachments[0].data == "application/octet-stream"
+        assert get_content.call_count == (2 if lazy else 4)
+
+
+def test_from_mime_lazy_set() -> None:
+    m = Message.from_bytes(Message(text="a").to_mime().as_bytes(), lazy=True)
+    m.text = "b"
+    assert m.text == "b"
+
+
+def test_from_bytes_chunks() -> None:
+    data = Message(subject="a", text="b").to_mime().as_bytes()
+    m = Message.from_bytes(data[i : i + 10] for i in range(0, len(data), 10))
+    assert m.subject == "a"
+    assert m.text == "b\n"
+
+
+def test_from_file(tmp_path: Path) -> None:
+    path = tmp_path / "a.eml"
+    path.write_bytes(Message(subject="a", text="b").to_mime().as_bytes())
+    assert Message.from_file(path, chunk_size=10).subject == "a"
+
+    with path.open("rb") as f:
+        assert Message.from_file(f).text == "b\n"
+
+
+def test_from_bytes_spool(tmp_path: Path) -> None:
+    binary = bytes(range(256)) * 100
+    text = "é\n" * 500 + "x" * 200
+    data = Message(
+        text="a" * 2000,
+        html="<p>a</p>",
+        attachments=[
+            Attachment(binary, filename="a.bin"),
+            Attachment(text, filename="b.txt"),
+            Attachment(b"small", filename="c.bin"),
+        ],
+        inline_attachments=[Attachment(binary, filename="d.png")],
+    ).to_mime()
+    m = Message.from_bytes(data.as_bytes(), spool_size=1000, spool_dir=tmp_path)
+
+    with m:
+        _check_spooled(m, binary, text)
+
+    assert all(a.data.closed for a in m.attachments if a.is_file)  # type: ignore[union-attr]
+
+
+def test_from_bytes_spool_base64_lines(tmp_path: Path) -> None:
+    """Base64 lines may be any length, not only a multiple of 4."""
+    binary = bytes(range(256)) * 1000
+    encoded = base64.b64encode(binary).decode()
+    lines = "\n".join(encoded[i : i + 75] for i in range(0, len(encoded), 75))
+    data = (
+        "Content-Type: multipart/mixed; boundary=b\n\n"
+        "--b\nContent-Type: text/plain\n\na\n"
+        "--b\nContent-Type: application/octet-stream\n"
+        "Content-Disposition: attachment; filename=a.bin\n"
+        f"Content-Transfer-Encoding: base64\n\n{lines}\n"
+        "--b--\n"
+    ).encode()
+    m = Message.from_bytes(data, spool_size=1000, spool_dir=tmp_path)
+
+    with m:
+        (a,) = m.attachments
+        assert a.is_file
+        assert a.read() == binary
+
+
+def _check_spooled(m: Message, binary: bytes, text: str) -> None:
+    assert m.text == "a" * 2000 + "\n"
+    a, b, c = m.attachments
+    assert a.is_file
+    assert a.filename == "a.bin"
+    assert a.read() == binary
+    assert b.is_file
+    assert b.mimetype == "text/plain"
+    assert b.read() == (text + "\n").encode()
+    assert not c.is_file
+    d = m.inline_attachments[0]
+    assert d.is_file
+    assert d.read() == binary
+    # The spooled attachments can be serialized again.
+    again = Message.from_mime(m.to_mime())
+    assert again.attachments[0].data == binary